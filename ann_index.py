@@ -0,0 +1,109 @@
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv() # Load environment variables from .env file
+
+LOCAL_ANN_MIN_ROWS = int(os.getenv("LOCAL_ANN_MIN_ROWS", 0)) # Opt-in: partitions (or segments) with at least this many rows are searched approximately; 0 (default) always searches exactly
+LOCAL_ANN_NLIST = int(os.getenv("LOCAL_ANN_NLIST", 0)) # Coarse clusters per index; 0 picks about sqrt(rows)
+LOCAL_ANN_NPROBE = int(os.getenv("LOCAL_ANN_NPROBE", 16)) # Clusters scanned per query; higher is slower and more accurate
+LOCAL_ANN_REBUILD_GROWTH = float(os.getenv("LOCAL_ANN_REBUILD_GROWTH", 2.0)) # Retrain once the indexed rows grow by this factor
+
+# --- IVF Approximate Nearest-Neighbour Index ---
+# Inverted-file index over rows of a normalized float32 matrix it does not own:
+# spherical k-means picks nlist centroids, every row is assigned to its nearest
+# centroid, and a query only scores the rows assigned to its nprobe nearest centroids.
+# The index stores just the centroids and one int32 cluster label per row. New rows are
+# assigned to the existing centroids; once the row count has grown by rebuild_growth
+# since training, needs_rebuild() asks the owner to retrain.
+
+def default_nlist(rows):
+    return int(min(4096, max(16, np.sqrt(rows))))
+
+def assign(vectors, centroids, block_size=8192):
+    # Nearest centroid (by dot product) of every row, in blocks to bound memory
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+def kmeans(vectors, nlist, iterations=8, sample_size=None, seed=0):
+    # Spherical k-means on a sample of the rows; returns (nlist, dimension) unit centroids
+    rng = np.random.default_rng(seed)
+    rows = len(vectors)
+    sample_size = min(rows, sample_size or max(nlist * 32, 10_000))
+    sample = np.asarray(vectors[np.sort(rng.choice(rows, sample_size, replace=False))], dtype=np.float32)
+    nlist = min(nlist, len(sample))
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = ~sums.any(axis=1)
+        if empty.any():
+            # Re-seed empty clusters with random sample rows
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+class IVFIndex:
+    def __init__(self, centroids, labels, trained_rows):
+        self.centroids = centroids
+        self.trained_rows = trained_rows
+        self._labels = labels
+        self.size = len(labels)
+
+    @classmethod
+    def build(cls, vectors, nlist=LOCAL_ANN_NLIST, seed=0):
+        rows = len(vectors)
+        centroids = kmeans(vectors, nlist or default_nlist(rows), seed=seed)
+        return cls(centroids, assign(vectors, centroids), rows)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @property
+    def labels(self):
+        return self._labels[:self.size]
+
+    def needs_rebuild(self, rows, growth=LOCAL_ANN_REBUILD_GROWTH):
+        return rows > self.trained_rows * growth
+
+    def add(self, vectors):
+        # Assigns rows appended to the end of the matrix
+        labels = assign(vectors, self.centroids)
+        if self.size + len(labels) > len(self._labels):
+            grown = np.empty(max(2 * len(self._labels), self.size + len(labels)), dtype=np.int32)
+            grown[:self.size] = self._labels[:self.size]
+            self._labels = grown
+        self._labels[self.size:self.size + len(labels)] = labels
+        self.size += len(labels)
+
+    def update(self, row, vector):
+        self._labels[row] = assign(vector[None, :], self.centroids)[0]
+
+    def remove(self, row):
+        # Mirrors a swap-remove in the matrix: the last row moves into the gap
+        self.size -= 1
+        self._labels[row] = self._labels[self.size]
+
+    def candidates(self, query, nprobe=LOCAL_ANN_NPROBE):
+        # Rows assigned to the nprobe centroids closest to the (normalized) query
+        nprobe = max(1, min(nprobe, self.nlist))
+        scores = self.centroids @ query
+        probe = np.argpartition(-scores, nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+        selected = np.zeros(self.nlist, dtype=bool)
+        selected[probe] = True
+        return np.flatnonzero(selected[self.labels])
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, labels=self.labels, trained_rows=self.trained_rows)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["labels"].copy(), int(data["trained_rows"]))
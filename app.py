@@ -1,30 +1,80 @@
 import streamlit as st
 import time
 from datetime import datetime # Import datetime
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from utils import hash_password, check_password, get_ollama_embedding, add_user, get_user_by_username
-from pinecone_utils import initialize_pinecone_rag_index, get_user_embeddings, delete_embeddings, get_user_rag_stats
-
-# Initialize Pinecone RAG Index
-rag_index = initialize_pinecone_rag_index()
-# The user_index is initialized in utils.py
+from pinecone_utils import (
+    get_rag_index, list_user_embedding_ids, list_all_user_embedding_ids, fetch_embeddings, delete_embeddings,
+    get_user_rag_stats, pinecone_health_check, HEALTH_CHECK_INTERVAL, start_rag_stats_reconciler,
+)
+from retrieval import retrieve_similar
+from ingest_pipeline import run_ingest_pipeline, make_chunk_vector_builder, update_document, INGEST_CONCURRENCY
+from text_splitting import RecursiveTextSplitter, iter_file_chunks, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+from trigram_index import text_search_index
+from session_tokens import issue_token, verify_token, revoke_token, SESSION_TTL
+from metrics import metrics, start_exporter, flush_file, METRICS_PANEL
+from profiler import RunProfile, detect_action, PROFILE_ENABLED
+
+# Pinecone RAG Index, created once per process and shared across reruns
+rag_index = get_rag_index()
+# The user store (Pinecone user index or SQLite) is resolved lazily in utils.py
+
+# Prometheus /metrics endpoint (METRICS_PORT), started once per process; it also serves
+# the index health check at /healthz
+start_exporter(health_check=lambda: pinecone_health_check(max_age=HEALTH_CHECK_INTERVAL))
+
+# Background reconciliation of the RAG statistics (RAG_STATS_RECONCILE_INTERVAL), started
+# once per process
+start_rag_stats_reconciler()
+
+# Admin page "Filter by" options and the metadata field each one searches
+FILTER_FIELDS = {"Text Content": "text", "ID": "id", "Original Text ID": "original_text_id", "Insert Date": "insert_date"}
 
 if "selected_embeddings" not in st.session_state:
     st.session_state["selected_embeddings"] = []
 
+# --- Sessions ---
+# A successful login also puts a signed session token in the page URL, so a browser
+# reload (which starts a fresh st.session_state) is restored from the token without
+# asking for the password again. Logging out revokes the token server-side, since copies
+# of the URL may remain in browser history or logs.
+def start_session(username, user_id):
+    st.session_state["logged_in"] = True
+    st.session_state["username"] = username
+    st.session_state["user_id"] = user_id # Store user_id in session state
+    if SESSION_TTL > 0:
+        st.query_params["session"] = issue_token(user_id, username)
+
+def end_session():
+    st.session_state["logged_in"] = False
+    st.session_state["username"] = None
+    st.session_state["user_id"] = None
+    st.session_state["page"] = "main" # Reset page on logout
+    if "session" in st.query_params:
+        revoke_token(st.query_params["session"])
+        del st.query_params["session"]
+
+def restore_session():
+    # Called once per browser session; returns True if a valid token logged the user back in
+    token = st.query_params.get("session")
+    claims = verify_token(token) if token and SESSION_TTL > 0 else None
+    if claims is None:
+        return False
+    st.session_state["logged_in"] = True
+    st.session_state["username"] = claims["username"]
+    st.session_state["user_id"] = claims["user_id"]
+    return True
+
 # --- Streamlit Pages ---
 def login_page():
     st.title("Login")
     username = st.text_input("Username")
     password = st.text_input("Password", type="password")
 
-    if st.button("Login"):
+    if st.button("Login", key="login_btn"):
         user_data = get_user_by_username(username)
         if user_data and check_password(password, user_data["password"]):
-            st.session_state["logged_in"] = True
-            st.session_state["username"] = username
-            st.session_state["user_id"] = user_data["user_id"] # Store user_id in session state
+            start_session(username, user_data["user_id"])
             st.rerun()
         else:
             st.error("Invalid username or password")
@@ -33,16 +83,14 @@ def login_page():
     new_username = st.text_input("New Username")
     new_password = st.text_input("New Password", type="password", key="new_password")
     
-    if st.button("Register"):
+    if st.button("Register", key="register_btn"):
         if new_username and new_password:
             if add_user(new_username, new_password):
                 st.success("User registered successfully! Logging in...")
                 # Auto-login the newly registered user
                 user_data = get_user_by_username(new_username)
                 if user_data:
-                    st.session_state["logged_in"] = True
-                    st.session_state["username"] = new_username
-                    st.session_state["user_id"] = user_data["user_id"]
+                    start_session(new_username, user_data["user_id"])
                     st.rerun()
                 else:
                     st.error("Error retrieving user data after registration. Please try logging in manually.")
@@ -50,9 +98,69 @@ def login_page():
         else:
             st.error("Please enter both username and password for registration.")
 
+def filter_embedding_ids(user_id):
+    # IDs of the user's chunks matching the admin filter, in ID order, or None when no search
+    # term is set. The user's IDs are only listed when their trigram index is first built or
+    # due for a resync; in between, uploads and deletes keep it up to date.
+    if not st.session_state["search_term"]:
+        return None
+    search_index = text_search_index.current(user_id)
+    if search_index is None:
+        ids = list_all_user_embedding_ids(rag_index, user_id)
+        if ids is None:
+            return []
+        search_index = text_search_index.sync(user_id, ids, lambda missing: fetch_embeddings(rag_index, missing))
+    return sorted(search_index.search(FILTER_FIELDS[st.session_state["filter_criteria"]], st.session_state["search_term"]))
+
 def set_page(page_name):
     st.session_state["page"] = page_name
 
+def index_status():
+    # Index connection status under the sidebar buttons, from a health check at most
+    # HEALTH_CHECK_INTERVAL seconds old
+    report = pinecone_health_check(max_age=HEALTH_CHECK_INTERVAL)
+    if not report["indexes"]:
+        st.sidebar.error("Vector index: not connected.")
+    elif report["ok"]:
+        latency = max(status["latency_ms"] for status in report["indexes"].values())
+        st.sidebar.caption(f"Vector index: OK ({latency:.0f} ms)")
+    else:
+        for name, status in report["indexes"].items():
+            if not status["ok"]:
+                st.sidebar.error(f"Vector index {name} unreachable: {status['error']}")
+
+def performance_panel():
+    # Per-stage latencies recorded in this process so far. render_* covers a whole page
+    # run, including the stages it calls; the remainder is Streamlit rendering.
+    with st.sidebar.expander("Performance"):
+        stages = metrics.snapshot()
+        if not stages:
+            st.caption("No timings recorded yet.")
+            return
+        st.dataframe(
+            [{"stage": stage, "calls": s["count"], "errors": s["errors"], "mean ms": round(s["mean_ms"], 1),
+              "p50 ms": round(s["p50_ms"], 1), "p95 ms": round(s["p95_ms"], 1)} for stage, s in stages.items()],
+            hide_index=True,
+        )
+        for event, value in metrics.counters().items():
+            st.caption(f"{event}: {value}")
+
+def profile_panel():
+    # Hot functions of this session's previous profiled run
+    summary = st.session_state.get("last_profile")
+    with st.sidebar.expander("Profile"):
+        if not summary:
+            st.caption("No profiled run yet.")
+            return
+        st.caption(f"{summary['page']} / {summary['action']}: {summary['seconds'] * 1000:.0f} ms")
+        st.dataframe(
+            [{"function": row["function"], "calls": row["calls"], "own ms": round(row["own_ms"], 1),
+              "cumulative ms": round(row["cumulative_ms"], 1)} for row in summary["top"]],
+            hide_index=True,
+        )
+        if summary["path"]:
+            st.caption(f"Saved to {summary['path']}")
+
 def main_page():
     st.sidebar.title(f"Welcome, {st.session_state['username']}!")
     
@@ -84,10 +192,7 @@ def main_page():
         if st.button("Admin Page", key="sidebar_admin_btn", type="primary"):
             set_page("admin")
         if st.button("Logout", key="sidebar_logout_btn", type="secondary"): # Use secondary type for custom styling
-            st.session_state["logged_in"] = False
-            st.session_state["username"] = None
-            st.session_state["user_id"] = None
-            st.session_state["page"] = "main" # Reset page on logout
+            end_session()
             st.rerun()
 
     st.title("Streamlit RAG with Ollama and Pinecone Local")
@@ -109,68 +214,100 @@ def main_page():
     st.subheader("Retrieve Similar Text")
     query_text = st.text_area("Enter query text to find similar entries:", height=100)
 
-    if st.button("Retrieve Similar"):
+    if st.button("Retrieve Similar", key="retrieve_btn"):
         if query_text:
-            with st.spinner("Getting query embedding from Ollama..."):
-                query_embedding = get_ollama_embedding(query_text)
-            
-            if query_embedding:
-                try:
-                    results = rag_index.query(
-                        vector=query_embedding,
-                        top_k=5,
-                        include_metadata=True,
-                        filter={"user_id": st.session_state["user_id"]} # Filter by user ID
-                    )
-                    st.write("Similar entries found:")
-                    for match in results.matches:
-                        st.write(f"- **Score:** {match.score:.2f}, **Text:** {match.metadata['text']}")
-                except Exception as e:
-                    st.error(f"Error retrieving similar embeddings from Pinecone: {e}")
+            with st.spinner("Retrieving similar entries..."):
+                matches = retrieve_similar(rag_index, st.session_state["user_id"], query_text, top_k=5)
+
+            if matches is not None:
+                st.write("Similar entries found:")
+                for match in matches:
+                    st.write(f"- **Score:** {match.score:.2f}, **Text:** {match.metadata['text']}")
         else:
             st.warning("Please enter some query text.")
 
     # Chunking options
     st.sidebar.header("Chunking Options")
-    chunk_size = st.sidebar.slider("Chunk Size", min_value=100, max_value=2000, value=500, step=50)
-    chunk_overlap = st.sidebar.slider("Chunk Overlap", min_value=0, max_value=chunk_size - 1, value=50, step=10)
-
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-        is_separator_regex=False,
-    )
+    chunk_size = st.sidebar.slider("Chunk Size", min_value=100, max_value=2000, value=DEFAULT_CHUNK_SIZE, step=50)
+    chunk_overlap = st.sidebar.slider("Chunk Overlap", min_value=0, max_value=chunk_size - 1, value=min(DEFAULT_CHUNK_OVERLAP, chunk_size - 1), step=10)
 
-    user_text = st.text_area("Enter text to embed and store:", height=150)
+    text_splitter = RecursiveTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    ingest_concurrency = st.sidebar.slider("Ingest Concurrency", min_value=1, max_value=16, value=INGEST_CONCURRENCY, step=1)
 
-    if st.button("Store Embedding"):
-        if user_text:
-            chunks = text_splitter.split_text(user_text)
+    user_text = st.text_area("Enter text to embed and store:", height=150)
+    update_mode = st.checkbox("Update an existing document (only changed chunks are re-embedded)")
+    update_document_id = st.text_input("Original Text ID of the document to update", disabled=not update_mode).strip()
+
+    if st.button("Store Embedding", key="store_text_btn"):
+        if user_text and update_mode and not update_document_id:
+            st.warning("Please enter the Original Text ID of the document to update.")
+        elif user_text and update_mode:
+            with metrics.timed("chunking"):
+                chunks = text_splitter.split_text(user_text)
+            st.info(f"Text split into {len(chunks)} chunks.")
+            with st.spinner("Updating document..."):
+                result = update_document(rag_index, st.session_state["user_id"], update_document_id, chunks, datetime.now().isoformat(), concurrency=ingest_concurrency)
+            if result is not None:
+                st.success(f"Document {update_document_id} updated: {result['unchanged']} chunks unchanged, {result['inserted']} embedded and stored, {result['deleted']} removed.")
+                if result["failed"]:
+                    st.warning(f"{result['failed']} new chunks could not be stored; the {result['stale']} outdated chunks were kept.")
+        elif user_text:
+            with metrics.timed("chunking"):
+                chunks = text_splitter.split_text(user_text)
             st.info(f"Text split into {len(chunks)} chunks.")
 
             # Generate a single UUID for the entire document
             import uuid
             document_uuid = str(uuid.uuid4())
             current_time = datetime.now().isoformat() # Get current time for insert date
+            build_vector = make_chunk_vector_builder(st.session_state["user_id"], document_uuid, current_time)
 
-            for i, chunk in enumerate(chunks):
-                with st.spinner(f"Getting embedding for chunk {i+1}/{len(chunks)} from Ollama..."):
-                    embedding = get_ollama_embedding(chunk)
-                
-                if embedding:
-                    # Use a unique ID for each chunk, but share the document_uuid for original_text_id
-                    unique_chunk_id = f"{st.session_state['user_id']}-{document_uuid}-{i}" 
-                    try:
-                        rag_index.upsert(vectors=[{"id": unique_chunk_id, "values": embedding, "metadata": {"text": chunk, "original_text_id": document_uuid, "user_id": st.session_state["user_id"], "insert_date": current_time}}])
-                        st.success(f"Chunk {i+1} embedded and stored in Pinecone with ID: {unique_chunk_id}")
-                    except Exception as e:
-                        st.error(f"Error storing embedding for chunk {i+1} in Pinecone: {e}")
-                else:
-                    st.error(f"Could not get embedding for chunk {i+1}. Skipping.")
+            progress_bar = st.progress(0.0, text="Embedding and storing chunks...")
+
+            def on_progress(i, vector_id, error):
+                progress_bar.progress((i + 1) / len(chunks), text=f"Processed chunk {i+1}/{len(chunks)}")
+                if error:
+                    st.error(f"Chunk {i+1} was not stored: {error}")
+
+            summary = run_ingest_pipeline(rag_index, chunks, build_vector, concurrency=ingest_concurrency, on_progress=on_progress)
+            if summary["failed"]:
+                st.warning(f"Stored {summary['stored']} of {summary['total_chunks']} chunks; {summary['failed']} failed.")
+            else:
+                st.success(f"All {summary['stored']} chunks embedded and stored in Pinecone under document ID: {document_uuid}")
         else:
             st.warning("Please enter some text to store.")
 
+    uploaded_files = st.file_uploader("Or upload text files to embed and store:", type=["txt", "md", "csv", "json", "html"], accept_multiple_files=True)
+
+    if st.button("Store Uploaded Files", key="store_files_btn"):
+        if uploaded_files:
+            import uuid
+            for uploaded_file in uploaded_files:
+                # Each file is its own document; its chunks are produced while the file is
+                # still being read and go straight into the embedding/upsert pipeline
+                document_uuid = str(uuid.uuid4())
+                current_time = datetime.now().isoformat()
+                build_vector = make_chunk_vector_builder(st.session_state["user_id"], document_uuid, current_time)
+                file_size = max(uploaded_file.size, 1)
+                progress_bar = st.progress(0.0, text=f"Reading {uploaded_file.name}...")
+
+                def on_progress(i, vector_id, error):
+                    progress_bar.progress(min(uploaded_file.tell() / file_size, 1.0), text=f"{uploaded_file.name}: processed chunk {i+1}")
+                    if error:
+                        st.error(f"{uploaded_file.name}: chunk {i+1} was not stored: {error}")
+
+                uploaded_file.seek(0)
+                chunks = metrics.timed_iter("chunking", iter_file_chunks(uploaded_file, text_splitter, chunk_size, chunk_overlap))
+                summary = run_ingest_pipeline(rag_index, chunks, build_vector, concurrency=ingest_concurrency, on_progress=on_progress)
+                progress_bar.progress(1.0, text=f"{uploaded_file.name}: done")
+                if summary["failed"]:
+                    st.warning(f"{uploaded_file.name}: stored {summary['stored']} of {summary['total_chunks']} chunks; {summary['failed']} failed.")
+                else:
+                    st.success(f"{uploaded_file.name}: all {summary['stored']} chunks stored under document ID: {document_uuid}")
+        else:
+            st.warning("Please upload at least one file to store.")
+
 def admin_page():
     st.sidebar.title(f"Welcome, {st.session_state['username']}!")
     
@@ -202,10 +339,7 @@ def admin_page():
         if st.button("Admin Page", key="admin_sidebar_admin_btn", type="primary"):
             set_page("admin")
         if st.button("Logout", key="admin_sidebar_logout_btn", type="secondary"): # Use secondary type for custom styling
-            st.session_state["logged_in"] = False
-            st.session_state["username"] = None
-            st.session_state["user_id"] = None
-            st.session_state["page"] = "main" # Reset page on logout
+            end_session()
             st.rerun()
 
     st.title("Admin Page - Your Embeddings")
@@ -218,15 +352,6 @@ def admin_page():
     
     st.subheader("Manage Your Stored Embeddings")
 
-    embeddings = get_user_embeddings(rag_index, user_id)
-    
-    if not embeddings:
-        st.info("No embeddings found for your account.")
-        return
-
-    # Sort embeddings by insert_date (newest first)
-    embeddings.sort(key=lambda x: x.metadata.get("insert_date", ""), reverse=True)
-
     # Initialize session state for filters and pagination if not present
     if "filter_criteria" not in st.session_state:
         st.session_state["filter_criteria"] = "Text Content"
@@ -236,6 +361,10 @@ def admin_page():
         st.session_state["items_per_page"] = 10
     if "current_page" not in st.session_state:
         st.session_state["current_page"] = 1
+    if "page_tokens" not in st.session_state:
+        st.session_state["page_tokens"] = [None] # page_tokens[p - 1] lists page p; None is the first page
+    if "filtered_ids" not in st.session_state:
+        st.session_state["filtered_ids"] = None # IDs matching the active filter, or None when unfiltered
     
     # Initialize session state for messages
     if "delete_message" not in st.session_state:
@@ -277,274 +406,62 @@ def admin_page():
 
         update_button = st.form_submit_button("Apply Filters & Pagination")
 
-    # Apply filters and pagination only when update_button is clicked or on initial load
-    if update_button:
-        st.session_state["current_page"] = 1 # Reset page on filter/pagination change
-        # Filtering logic
-        filtered_embeddings = []
-        search_term_lower = st.session_state["search_term"].lower()
-        for match in embeddings:
-            metadata_value = ""
-            if st.session_state["filter_criteria"] == "Text Content":
-                metadata_value = match.metadata.get("text", "").lower()
-            elif st.session_state["filter_criteria"] == "ID":
-                metadata_value = match.id.lower()
-            elif st.session_state["filter_criteria"] == "Original Text ID":
-                metadata_value = match.metadata.get("original_text_id", "").lower()
-            elif st.session_state["filter_criteria"] == "Insert Date":
-                metadata_value = match.metadata.get("insert_date", "").lower()
-            
-            if search_term_lower in metadata_value:
-                filtered_embeddings.append(match)
-        st.session_state["filtered_embeddings"] = filtered_embeddings
-    elif "filtered_embeddings" not in st.session_state or st.session_state["delete_triggered"]: # Re-evaluate if delete was triggered
-        st.session_state["filtered_embeddings"] = embeddings # Initial load or after delete
-        st.session_state["delete_triggered"] = False # Reset flag
-    
-    filtered_embeddings = st.session_state["filtered_embeddings"]
-
-    if not filtered_embeddings:
-        st.info("No embeddings match your search criteria.")
-        return
-
-    total_pages = (len(filtered_embeddings) + st.session_state["items_per_page"] - 1) // st.session_state["items_per_page"]
-    
-    # Ensure current_page is valid
-    if st.session_state["current_page"] > total_pages and total_pages > 0:
-        st.session_state["current_page"] = total_pages
-    elif st.session_state["current_page"] == 0 and total_pages > 0:
-        st.session_state["current_page"] = 1
-    elif total_pages == 0:
-        st.session_state["current_page"] = 0
-
-
-    # Pagination controls
-    st.write(f"Page {st.session_state['current_page']} of {total_pages}")
-    
-    # Horizontal pagination buttons
-    # Create columns dynamically for page numbers
-    page_cols = st.columns([0.1] + [0.05] * min(total_pages, 5) + [0.1]) # Prev, up to 5 page numbers, Next
-    
-    with page_cols[0]:
-        if st.button("Prev", key="prev_page_button", disabled=(st.session_state["current_page"] <= 1)):
-            st.session_state["current_page"] -= 1
-            st.rerun()
-    
-    # Individual page number buttons
-    page_numbers_to_display = 5 # Number of page buttons to show
-    start_page = max(1, st.session_state["current_page"] - page_numbers_to_display // 2)
-    end_page = min(total_pages, start_page + page_numbers_to_display - 1)
-    
-    if end_page - start_page + 1 < page_numbers_to_display:
-        start_page = max(1, end_page - page_numbers_to_display + 1)
-
-    for i, p_num in enumerate(range(start_page, end_page + 1)):
-        with page_cols[i + 1]: # Offset by 1 for the 'Prev' button column
-            if st.button(str(p_num), key=f"page_button_{p_num}", type="primary" if p_num == st.session_state["current_page"] else "secondary"):
-                st.session_state["current_page"] = p_num
-                st.rerun()
-
-    with page_cols[-1]: # Last column for 'Next' button
-        if st.button("Next", key="next_page_button", disabled=(st.session_state["current_page"] >= total_pages)):
-            st.session_state["current_page"] += 1
-            st.rerun()
-
-    start_idx = (st.session_state["current_page"] - 1) * st.session_state["items_per_page"]
-    end_idx = start_idx + st.session_state["items_per_page"]
-    paginated_embeddings = filtered_embeddings[start_idx:end_idx]
-
-    st.write(f"Displaying {len(paginated_embeddings)} embeddings on this page ({len(filtered_embeddings)} total filtered, {len(embeddings)} total stored).")
-    
-    # Batch delete button at the top
-    with st.form("delete_embeddings_form_top"):
-        if st.form_submit_button("Delete Selected Embeddings (Top)", type="primary"):
-            if st.session_state["selected_embeddings"]:
-                with st.spinner("Deleting selected embeddings..."):
-                    if delete_embeddings(rag_index, st.session_state["selected_embeddings"], user_id):
-                        st.session_state["delete_message"] = {"type": "success", "content": "Selected embeddings deleted successfully!"}
-                        st.session_state["selected_embeddings"] = [] # Clear selection
-                        st.session_state["delete_triggered"] = True # Set flag to force re-evaluation of filtered_embeddings
-                        st.rerun() # Rerun to refresh the list
-                    else:
-                        st.session_state["delete_message"] = {"type": "error", "content": "Failed to delete embeddings."}
-                        st.session_state["delete_triggered"] = True # Set flag
-                        st.rerun()
-            else:
-                st.session_state["delete_message"] = {"type": "warning", "content": "No embeddings selected for deletion."}
-                st.session_state["delete_triggered"] = True # Set flag
-                st.rerun()
-
-    # Display embeddings with checkboxes and individual delete buttons
-    for i, match in enumerate(paginated_embeddings):
-        # Removed card_style for selected items
-        # st.markdown(f"<div style='border: 1px solid #ccc; border-radius: 5px; padding: 10px; margin-bottom: 10px;'>", unsafe_allow_html=True)
-        col_checkbox, col_content, col_delete_individual = st.columns([0.1, 0.7, 0.2])
-        with col_checkbox:
-            checkbox_key = f"checkbox_{match.id}"
-            # Use a callback to update session state directly
-            def on_checkbox_change(embedding_id):
-                if st.session_state[f"checkbox_{embedding_id}"]:
-                    if embedding_id not in st.session_state["selected_embeddings"]:
-                        st.session_state["selected_embeddings"].append(embedding_id)
-                else:
-                    if embedding_id in st.session_state["selected_embeddings"]:
-                        st.session_state["selected_embeddings"].remove(embedding_id)
-            
-            st.checkbox(" ", key=checkbox_key, value=(match.id in st.session_state["selected_embeddings"]), on_change=on_checkbox_change, args=(match.id,), label_visibility="hidden")
-        with col_content:
-            st.markdown(f"**ID:** `{match.id}`")
-            st.markdown(f"**Text:** {match.metadata.get('text', 'N/A')}")
-            st.markdown(f"**Original Text ID:** `{match.metadata.get('original_text_id', 'N/A')}`")
-            st.markdown(f"**Insert Date:** `{match.metadata.get('insert_date', 'N/A')}`")
-        with col_delete_individual:
-            if st.button("Delete", key=f"delete_individual_{match.id}", type="primary"):
-                with st.spinner(f"Deleting embedding {match.id}..."):
-                    if delete_embeddings(rag_index, [match.id], user_id):
-                        # Remove from selected_embeddings if it was selected
-                        if match.id in st.session_state["selected_embeddings"]:
-                            st.session_state["selected_embeddings"].remove(match.id)
-                        st.session_state["delete_message"] = {"type": "success", "content": f"Embedding {match.id} deleted successfully!"}
-                        st.session_state["delete_triggered"] = True # Set flag
-                        st.rerun()
-                    else:
-                        st.session_state["delete_message"] = {"type": "error", "content": f"Failed to delete embedding {match.id}."}
-                        st.session_state["delete_triggered"] = True # Set flag
-                        st.rerun()
-        st.markdown("</div>", unsafe_allow_html=True) # Close the div for card style
-    
-    # No need to reassign selected_embeddings here, it's updated by callbacks
-
-    # Batch delete button at the bottom
-    with st.form("delete_embeddings_form_bottom"):
-        if st.form_submit_button("Delete Selected Embeddings (Bottom)", type="primary"):
-            if st.session_state["selected_embeddings"]:
-                with st.spinner("Deleting selected embeddings..."):
-                    if delete_embeddings(rag_index, st.session_state["selected_embeddings"], user_id):
-                        st.session_state["delete_message"] = {"type": "success", "content": "Selected embeddings deleted successfully!"}
-                        st.session_state["selected_embeddings"] = [] # Clear selection
-                        st.session_state["delete_triggered"] = True # Set flag
-                        st.rerun() # Rerun to refresh the list
-                    else:
-                        st.session_state["delete_message"] = {"type": "error", "content": "Failed to delete embeddings."}
-                        st.session_state["delete_triggered"] = True # Set flag
-                        st.rerun()
-            else:
-                st.session_state["delete_message"] = {"type": "warning", "content": "No embeddings selected for deletion."}
-                st.session_state["delete_triggered"] = True # Set flag
-                st.rerun()
-
-    st.title("Admin Page - Your Embeddings")
+    # Chunks stored by other processes (e.g. the bulk-ingestion CLI) reach the search index at
+    # the next periodic resync, or right away with this button
+    resync_button = st.button("Resync Search Index", key="resync_search_btn")
 
-    if rag_index is None:
-        st.error("Pinecone RAG index not initialized. Please check the connection.")
-        return
-
-    user_id = st.session_state["user_id"]
-    
-    st.subheader("Manage Your Stored Embeddings")
+    if resync_button:
+        text_search_index.expire(user_id)
+        if st.session_state["filtered_ids"] is not None:
+            st.session_state["filtered_ids"] = filter_embedding_ids(user_id)
 
-    embeddings = get_user_embeddings(rag_index, user_id)
-    
-    if not embeddings:
-        st.info("No embeddings found for your account.")
-        return
-
-    # Sort embeddings by insert_date (newest first)
-    embeddings.sort(key=lambda x: x.metadata.get("insert_date", ""), reverse=True)
-
-    # Initialize session state for filters and pagination if not present
-    if "filter_criteria" not in st.session_state:
-        st.session_state["filter_criteria"] = "Text Content"
-    if "search_term" not in st.session_state:
-        st.session_state["search_term"] = ""
-    if "items_per_page" not in st.session_state:
-        st.session_state["items_per_page"] = 10
-    if "current_page" not in st.session_state:
-        st.session_state["current_page"] = 1
-    
-    # Initialize session state for messages
-    if "delete_message" not in st.session_state:
-        st.session_state["delete_message"] = {"type": None, "content": None}
-
-    # Display persistent message if available
-    if st.session_state["delete_message"]["type"] == "success":
-        st.success(st.session_state["delete_message"]["content"])
-        st.session_state["delete_message"] = {"type": None, "content": None} # Clear after display
-    elif st.session_state["delete_message"]["type"] == "error":
-        st.error(st.session_state["delete_message"]["content"])
-        st.session_state["delete_message"] = {"type": None, "content": None} # Clear after display
-    elif st.session_state["delete_message"]["type"] == "warning":
-        st.warning(st.session_state["delete_message"]["content"])
-        st.session_state["delete_message"] = {"type": None, "content": None} # Clear after display
-
-    # Filter and pagination controls within a form
-    with st.form("filter_pagination_form"):
-        col_filter_type, col_search_term = st.columns([0.4, 0.6])
-        with col_filter_type:
-            st.session_state["filter_criteria"] = st.selectbox(
-                "Filter by",
-                options=["Text Content", "ID", "Original Text ID", "Insert Date"],
-                key="filter_criteria_select"
-            )
-        with col_search_term:
-            st.session_state["search_term"] = st.text_input(
-                "Search term",
-                value=st.session_state["search_term"],
-                key="search_term_input"
-            )
-        
-        st.session_state["items_per_page"] = st.selectbox(
-            "Embeddings per page",
-            options=[5, 10, 20, 50],
-            index=[5, 10, 20, 50].index(st.session_state["items_per_page"]),
-            key="items_per_page_select"
-        )
-
-        update_button = st.form_submit_button("Apply Filters & Pagination")
-
-    # Apply filters and pagination only when update_button is clicked or on initial load
+    # Apply filters and pagination only when update_button is clicked
     if update_button:
         st.session_state["current_page"] = 1 # Reset page on filter/pagination change
-        # Filtering logic
-        filtered_embeddings = []
-        search_term_lower = st.session_state["search_term"].lower()
-        for match in embeddings:
-            metadata_value = ""
-            if st.session_state["filter_criteria"] == "Text Content":
-                metadata_value = match.metadata.get("text", "").lower()
-            elif st.session_state["filter_criteria"] == "ID":
-                metadata_value = match.id.lower()
-            elif st.session_state["filter_criteria"] == "Original Text ID":
-                metadata_value = match.metadata.get("original_text_id", "").lower()
-            elif st.session_state["filter_criteria"] == "Insert Date":
-                metadata_value = match.metadata.get("insert_date", "").lower()
-            
-            if search_term_lower in metadata_value:
-                filtered_embeddings.append(match)
-        st.session_state["filtered_embeddings"] = filtered_embeddings
-    elif "filtered_embeddings" not in st.session_state or st.session_state["delete_triggered"]: # Re-evaluate if delete was triggered
-        st.session_state["filtered_embeddings"] = embeddings # Initial load or after delete
+        st.session_state["page_tokens"] = [None]
+        st.session_state["filtered_ids"] = filter_embedding_ids(user_id)
+    elif st.session_state.get("delete_triggered"): # Re-evaluate if delete was triggered
+        # Tokens of later pages may now skip or repeat chunks, so they are listed again
+        del st.session_state["page_tokens"][st.session_state["current_page"]:]
+        if st.session_state["filtered_ids"] is not None:
+            st.session_state["filtered_ids"] = filter_embedding_ids(user_id)
         st.session_state["delete_triggered"] = False # Reset flag
-    
-    filtered_embeddings = st.session_state["filtered_embeddings"]
-
-    if not filtered_embeddings:
-        st.info("No embeddings match your search criteria.")
-        return
-
-    total_pages = (len(filtered_embeddings) + st.session_state["items_per_page"] - 1) // st.session_state["items_per_page"]
-    
-    # Ensure current_page is valid
-    if st.session_state["current_page"] > total_pages and total_pages > 0:
-        st.session_state["current_page"] = total_pages
-    elif st.session_state["current_page"] == 0 and total_pages > 0:
-        st.session_state["current_page"] = 1
-    elif total_pages == 0:
-        st.session_state["current_page"] = 0
 
+    items_per_page = st.session_state["items_per_page"]
+    filtered_ids = st.session_state["filtered_ids"]
+    if filtered_ids is None:
+        # Unfiltered: list one page of IDs from the index, following the continuation token
+        # recorded when the previous page was listed
+        page_tokens = st.session_state["page_tokens"]
+        st.session_state["current_page"] = max(1, min(st.session_state["current_page"], len(page_tokens)))
+        listing = list_user_embedding_ids(rag_index, user_id, items_per_page, page_tokens[st.session_state["current_page"] - 1])
+        if listing is None:
+            return
+        page_ids, next_token = listing
+        if not page_ids and st.session_state["current_page"] > 1: # The last page was emptied by deletes
+            st.session_state["current_page"] -= 1
+            del page_tokens[st.session_state["current_page"]:]
+            st.rerun()
+        if next_token is not None and len(page_tokens) == st.session_state["current_page"]:
+            page_tokens.append(next_token)
+        total_pages = len(page_tokens) # Pages listed so far plus the next one, if any
+        if not page_ids:
+            st.info("No embeddings found for your account.")
+            return
+    else:
+        if not filtered_ids:
+            st.info("No embeddings match your search criteria.")
+            return
+        total_pages = (len(filtered_ids) + items_per_page - 1) // items_per_page
+        st.session_state["current_page"] = max(1, min(st.session_state["current_page"], total_pages))
+        start_idx = (st.session_state["current_page"] - 1) * items_per_page
+        page_ids = filtered_ids[start_idx:start_idx + items_per_page]
 
     # Pagination controls
-    st.write(f"Page {st.session_state['current_page']} of {total_pages}")
+    if filtered_ids is None:
+        st.write(f"Page {st.session_state['current_page']}") # The page count is only known once the last page is listed
+    else:
+        st.write(f"Page {st.session_state['current_page']} of {total_pages}")
     
     # Horizontal pagination buttons
     # Create columns dynamically for page numbers
@@ -574,11 +491,13 @@ def admin_page():
             st.session_state["current_page"] += 1
             st.rerun()
 
-    start_idx = (st.session_state["current_page"] - 1) * st.session_state["items_per_page"]
-    end_idx = start_idx + st.session_state["items_per_page"]
-    paginated_embeddings = filtered_embeddings[start_idx:end_idx]
+    # Only the visible page is fetched with its metadata
+    paginated_embeddings = fetch_embeddings(rag_index, page_ids)
 
-    st.write(f"Displaying {len(paginated_embeddings)} embeddings on this page ({len(filtered_embeddings)} total filtered, {len(embeddings)} total stored).")
+    if filtered_ids is None:
+        st.write(f"Displaying {len(paginated_embeddings)} embeddings on this page.")
+    else:
+        st.write(f"Displaying {len(paginated_embeddings)} embeddings on this page ({len(filtered_ids)} total filtered).")
     
     # Batch delete button at the top
     with st.form("delete_embeddings_form_top"):
@@ -588,7 +507,7 @@ def admin_page():
                     if delete_embeddings(rag_index, st.session_state["selected_embeddings"], user_id):
                         st.session_state["delete_message"] = {"type": "success", "content": "Selected embeddings deleted successfully!"}
                         st.session_state["selected_embeddings"] = [] # Clear selection
-                        st.session_state["delete_triggered"] = True # Set flag to force re-evaluation of filtered_embeddings
+                        st.session_state["delete_triggered"] = True # Set flag to force re-listing of the current page
                         st.rerun() # Rerun to refresh the list
                     else:
                         st.session_state["delete_message"] = {"type": "error", "content": "Failed to delete embeddings."}
@@ -615,7 +534,7 @@ def admin_page():
                     if embedding_id in st.session_state["selected_embeddings"]:
                         st.session_state["selected_embeddings"].remove(embedding_id)
             
-            st.checkbox("", key=checkbox_key, value=(match.id in st.session_state["selected_embeddings"]), on_change=on_checkbox_change, args=(match.id,))
+            st.checkbox(" ", key=checkbox_key, value=(match.id in st.session_state["selected_embeddings"]), on_change=on_checkbox_change, args=(match.id,), label_visibility="hidden")
         with col_content:
             st.markdown(f"**ID:** `{match.id}`")
             st.markdown(f"**Text:** {match.metadata.get('text', 'N/A')}")
@@ -659,16 +578,41 @@ def admin_page():
                 st.rerun()
 
 # --- Main App Logic ---
-if "logged_in" not in st.session_state:
-    st.session_state["logged_in"] = False
-    st.session_state["username"] = None
-    st.session_state["user_id"] = None
-    st.session_state["page"] = "main" # Initialize page state
-
-if st.session_state["logged_in"]:
-    if st.session_state["page"] == "main":
-        main_page()
-    elif st.session_state["page"] == "admin":
-        admin_page() # This function will be defined next
-else:
-    login_page()
+# Per-run profiling (PROFILE_ENABLED) covers session restore and the page code. start() is
+# inside the try, and the profiler stop and the metrics file flush are in the finally, so
+# both happen however the run ends, including runs cut short by st.rerun() or st.stop().
+run_profile = None
+try:
+    if PROFILE_ENABLED:
+        run_profile = RunProfile(st.session_state.get("page", "main") if st.session_state.get("logged_in") else "login",
+                                 detect_action(st.session_state))
+        run_profile.start()
+
+    if "logged_in" not in st.session_state:
+        st.session_state["logged_in"] = False
+        st.session_state["username"] = None
+        st.session_state["user_id"] = None
+        st.session_state["page"] = "main" # Initialize page state
+        restore_session()
+
+    if st.session_state["logged_in"]:
+        index_status()
+        if metrics.enabled and METRICS_PANEL:
+            performance_panel()
+        if PROFILE_ENABLED:
+            profile_panel()
+        if st.session_state["page"] == "main":
+            with metrics.timed("render_main"):
+                main_page()
+        elif st.session_state["page"] == "admin":
+            with metrics.timed("render_admin"):
+                admin_page() # This function will be defined next
+    else:
+        with metrics.timed("render_login"):
+            login_page()
+finally:
+    if run_profile is not None:
+        summary = run_profile.stop()
+        if summary is not None:
+            st.session_state["last_profile"] = summary
+    flush_file() # METRICS_FILE, rewritten at most once a second
@@ -0,0 +1,78 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.modules.setdefault('streamlit', MagicMock()) # pinecone_utils imports streamlit for error reporting
+
+import numpy as np
+from local_vector_store import LocalVectorStore
+
+# Recall@k and query latency of the IVF index against exact search on one user's
+# partition of synthetic clustered embeddings, for a range of nprobe values.
+
+def make_corpus(rows, dimension, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    return centers[labels] + rng.normal(scale=2.0, size=(rows, dimension)).astype(np.float32)
+
+def _query_ms(store, queries, top_k, **kwargs):
+    results = []
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        matches = store.query(vector=query, top_k=top_k, filter={"user_id": "bench"}, **kwargs).matches
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append([match.id for match in matches])
+    return results, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k vs latency of the local IVF index against exact search.")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=500, help="Topics in the synthetic corpus")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0, help="IVF clusters (0: about sqrt(rows))")
+    parser.add_argument("--nprobe", type=int, action="append", help="nprobe values to measure (repeatable)")
+    args = parser.parse_args()
+
+    vectors = make_corpus(args.rows, args.dimension, args.clusters)
+    rng = np.random.default_rng(1)
+    queries = (vectors[rng.choice(args.rows, args.queries, replace=False)]
+               + rng.normal(scale=1.0, size=(args.queries, args.dimension)).astype(np.float32)).tolist()
+
+    exact = LocalVectorStore(args.dimension, ann_min_rows=0)
+    approximate = LocalVectorStore(args.dimension, ann_min_rows=1)
+    for start in range(0, args.rows, 10_000):
+        batch = [{"id": f"bench-{i}", "values": vectors[i], "metadata": {"user_id": "bench"}}
+                 for i in range(start, min(start + 10_000, args.rows))]
+        exact.upsert(vectors=batch)
+        approximate.upsert(vectors=batch)
+
+    started = time.perf_counter()
+    approximate.query(vector=queries[0], top_k=args.top_k, filter={"user_id": "bench"}) # Trains the index
+    if args.nlist:
+        partition = approximate._partitions["bench"]
+        from ann_index import IVFIndex
+        started = time.perf_counter()
+        partition.ann = IVFIndex.build(partition.vectors[:partition.size], nlist=args.nlist)
+    build_seconds = time.perf_counter() - started
+    nlist = approximate._partitions["bench"].ann.nlist
+
+    truth, exact_ms = _query_ms(exact, queries, args.top_k)
+    print(f"{args.rows} rows x {args.dimension} dims, {args.queries} queries, top_k={args.top_k}, nlist={nlist} (built in {build_seconds:.1f}s)")
+    print(f"{'search':<14} {'recall@k':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    print(f"{'exact':<14} {1.0:>9.3f} {statistics.median(exact_ms):>9.2f} {sorted(exact_ms)[int(0.95 * (len(exact_ms) - 1))]:>9.2f}")
+    for nprobe in args.nprobe or [1, 2, 4, 8, 16, 32, 64]:
+        found, latencies = _query_ms(approximate, queries, args.top_k, nprobe=nprobe)
+        recall = statistics.mean(len(set(f) & set(t)) / len(t) for f, t in zip(found, truth))
+        p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+        print(f"{'ivf nprobe=' + str(nprobe):<14} {recall:>9.3f} {statistics.median(latencies):>9.2f} {p95:>9.2f}")
+
+if __name__ == "__main__":
+    main()
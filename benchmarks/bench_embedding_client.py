@@ -0,0 +1,55 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ollama_client import EmbeddingClient
+from stub_ollama import StubOllamaServer
+
+# Compares bare requests.post (a new TCP connection per call, as the app used to do)
+# against the pooled keep-alive EmbeddingClient, one request at a time.
+
+def _measure(post, url, requests_count, model):
+    latencies = []
+    for i in range(requests_count):
+        started = time.perf_counter()
+        response = post(url, json={"model": model, "prompt": f"benchmark chunk {i}"})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def _summary(name, latencies):
+    latencies_ms = sorted(l * 1000 for l in latencies)
+    p95 = latencies_ms[int(0.95 * (len(latencies_ms) - 1))]
+    return f"{name:<24} mean {statistics.mean(latencies_ms):7.3f} ms   p50 {statistics.median(latencies_ms):7.3f} ms   p95 {p95:7.3f} ms"
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request latency of bare requests.post vs the pooled embedding client.")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated server-side latency per request in seconds")
+    args = parser.parse_args()
+
+    with StubOllamaServer(dimension=args.dimension, latency=args.latency) as server:
+        url = f"{server.base_url}/api/embeddings"
+        model = "all-minilm:33m"
+        # Warm up both paths so the first-connection cost is not attributed to either
+        _measure(requests.post, url, 5, model)
+        client = EmbeddingClient()
+        _measure(client.post, url, 5, model)
+
+        bare = _measure(requests.post, url, args.requests, model)
+        pooled = _measure(client.post, url, args.requests, model)
+        client.close()
+
+    print(f"{args.requests} sequential requests against a local stub (dimension={args.dimension}, latency={args.latency}s)")
+    print(_summary("requests.post", bare))
+    print(_summary("EmbeddingClient", pooled))
+    print(f"speedup (mean): {statistics.mean(bare) / statistics.mean(pooled):.2f}x")
+
+if __name__ == "__main__":
+    main()
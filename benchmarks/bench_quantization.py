@@ -0,0 +1,64 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.modules.setdefault('streamlit', MagicMock()) # pinecone_utils imports streamlit for error reporting
+
+import numpy as np
+from local_vector_store import PersistentVectorStore
+from bench_ann import make_corpus
+
+# Recall@k, query latency and the size of what each query scans for the persistent local
+# store without quantization and with float16 / int8 codes plus full-precision re-ranking.
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized vs full-precision search in the persistent local store.")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--first-batch", type=int, default=50, help="Rows in the first upsert, like one document's chunks (int8 ranges are refitted later)")
+    args = parser.parse_args()
+
+    vectors = make_corpus(args.rows, args.dimension, args.clusters)
+    rng = np.random.default_rng(1)
+    queries = (vectors[rng.choice(args.rows, args.queries, replace=False)]
+               + rng.normal(scale=1.0, size=(args.queries, args.dimension)).astype(np.float32)).tolist()
+
+    with tempfile.TemporaryDirectory() as directory:
+        truth = None
+        print(f"{args.rows} rows x {args.dimension} dims, {args.queries} queries, top_k={args.top_k}, rerank factor {args.rerank_factor}")
+        print(f"{'quantization':<13} {'scanned MiB':>12} {'recall@k':>9} {'p50 ms':>9} {'p95 ms':>9}")
+        for mode in ["none", "float16", "int8"]:
+            store = PersistentVectorStore(os.path.join(directory, mode), args.dimension, compaction_interval=0,
+                                          ann_min_rows=0, quantization=mode, rerank_factor=args.rerank_factor)
+            bounds = sorted({0, min(args.first_batch, args.rows), *range(args.first_batch + 10_000, args.rows, 10_000), args.rows})
+            for start, end in zip(bounds, bounds[1:]):
+                store.upsert(vectors=[{"id": f"bench-{i}", "values": vectors[i], "metadata": {"user_id": "bench"}}
+                                      for i in range(start, end)])
+            found = []
+            latencies = []
+            store.query(vector=queries[0], top_k=args.top_k, filter={"user_id": "bench"}) # Warm the page cache
+            for query in queries:
+                started = time.perf_counter()
+                matches = store.query(vector=query, top_k=args.top_k, filter={"user_id": "bench"}).matches
+                latencies.append((time.perf_counter() - started) * 1000)
+                found.append({match.id for match in matches})
+            if truth is None:
+                truth = found
+            recall = statistics.mean(len(f & t) / len(t) for f, t in zip(found, truth))
+            segments = store._partitions["bench"].segments
+            scanned = sum(os.path.getsize(s.codes_path if s.quantizer is not None else s.vector_path) for s in segments)
+            p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+            print(f"{mode:<13} {scanned / 2**20:>12.1f} {recall:>9.3f} {statistics.median(latencies):>9.2f} {p95:>9.2f}")
+            store.close()
+
+if __name__ == "__main__":
+    main()
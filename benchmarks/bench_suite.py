@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.modules.setdefault('streamlit', MagicMock()) # The app modules report errors through streamlit
+os.environ.setdefault("RAG_STATS_PATH", "") # Statistics in memory, so every run counts its own fresh index
+
+import utils
+from local_vector_store import LocalVectorStore
+from ingest_pipeline import run_ingest_pipeline, make_chunk_vector_builder
+from pinecone_utils import DIMENSION, list_user_embedding_ids, fetch_embeddings, get_user_rag_stats
+from query_cache import query_cache
+from retrieval import retrieve_similar, retrieve_many
+from stub_ollama import StubOllamaServer
+from synthetic_corpus import SyntheticCorpus
+
+# --- End-to-End Benchmark Suite ---
+# Runs the app's ingestion, retrieval, admin listing and statistics code paths offline:
+# embeddings come from a local stub of the Ollama API with configurable latency, and the
+# RAG index is the in-process LocalVectorStore, which implements the Pinecone index calls
+# (upsert/query/delete/fetch/list_paginated with user_id filters). The workload is a
+# deterministic synthetic corpus. Results are printed and written as JSON; with
+# --baseline, a run is compared with an earlier result file and exits non-zero when a
+# scenario's p95 latency or throughput regressed by more than --tolerance.
+#   python benchmarks/bench_suite.py --output bench.json
+#   python benchmarks/bench_suite.py --baseline bench.json
+
+def percentile(sorted_values, fraction):
+    return sorted_values[int(fraction * (len(sorted_values) - 1))]
+
+def summarize(latencies, items, seconds):
+    # latencies: seconds per operation; items: units of work done (chunks, queries, pages...)
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        "operations": len(latencies_ms),
+        "items": items,
+        "seconds": round(seconds, 4),
+        "throughput_per_s": round(items / seconds, 2) if seconds else None,
+        "p50_ms": round(percentile(latencies_ms, 0.50), 3),
+        "p95_ms": round(percentile(latencies_ms, 0.95), 3),
+        "p99_ms": round(percentile(latencies_ms, 0.99), 3),
+    }
+
+def _timed(operation, latencies):
+    started = time.perf_counter()
+    result = operation()
+    latencies.append(time.perf_counter() - started)
+    return result
+
+def bench_ingest(index, corpus, concurrency):
+    # One ingestion pipeline run per document, as "Store Embedding" does; items are chunks
+    latencies = []
+    stored = 0
+    started = time.perf_counter()
+    for user_id in corpus.users:
+        for document_id, chunks in corpus.documents(user_id):
+            build_vector = make_chunk_vector_builder(user_id, document_id, "2024-01-01 00:00:00")
+            summary = _timed(lambda: run_ingest_pipeline(index, chunks, build_vector, concurrency=concurrency), latencies)
+            stored += summary["stored"]
+    if stored != corpus.total_chunks:
+        raise RuntimeError(f"Only {stored} of {corpus.total_chunks} chunks were stored")
+    return summarize(latencies, stored, time.perf_counter() - started)
+
+def bench_query(index, corpus, queries_per_user, top_k):
+    # "Retrieve Similar": one embedding request and one index query per call
+    query_cache.clear()
+    latencies = []
+    started = time.perf_counter()
+    for user_id in corpus.users:
+        for query_text in corpus.queries(user_id, queries_per_user):
+            _timed(lambda: retrieve_similar(index, user_id, query_text, top_k), latencies)
+    return summarize(latencies, len(latencies), time.perf_counter() - started)
+
+def bench_retrieve_many(index, corpus, queries_per_user, top_k, concurrency):
+    # Bulk retrieval: one retrieve_many call per user; items are queries
+    query_cache.clear()
+    latencies = []
+    items = 0
+    started = time.perf_counter()
+    for user_id in corpus.users:
+        queries = corpus.queries(user_id, queries_per_user)
+        _timed(lambda: retrieve_many(user_id, queries, top_k, index=index, max_concurrency=concurrency), latencies)
+        items += len(queries)
+    return summarize(latencies, items, time.perf_counter() - started)
+
+def bench_admin_listing(index, corpus, page_size):
+    # Admin page: list one page of IDs, then fetch that page; items are pages
+    latencies = []
+    started = time.perf_counter()
+    for user_id in corpus.users:
+        pagination_token = None
+        while True:
+            def page():
+                ids, next_token = list_user_embedding_ids(index, user_id, page_size, pagination_token)
+                fetch_embeddings(index, ids)
+                return next_token
+            pagination_token = _timed(page, latencies)
+            if pagination_token is None:
+                break
+    return summarize(latencies, len(latencies), time.perf_counter() - started)
+
+def bench_stats(index, corpus, repeats):
+    # Statistics panel, read on every main-page render
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for user_id in corpus.users:
+            _timed(lambda: get_user_rag_stats(index, user_id), latencies)
+    return summarize(latencies, len(latencies), time.perf_counter() - started)
+
+def compare(results, baseline, tolerance):
+    # Returns a list of regression messages
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        if previous["throughput_per_s"] and current["throughput_per_s"] < previous["throughput_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput_per_s']}/s -> {current['throughput_per_s']}/s")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of ingestion, retrieval, admin listing and statistics.")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--documents", type=int, default=10, help="Documents per user")
+    parser.add_argument("--chunks", type=int, default=20, help="Chunks per document")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=50, help="Queries per user")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=10, help="Admin page size")
+    parser.add_argument("--stats-repeats", type=int, default=50, help="Statistics reads per user")
+    parser.add_argument("--latency", type=float, default=0.005, help="Simulated Ollama latency per request in seconds")
+    parser.add_argument("--per-item-latency", type=float, default=0.001, help="Additional simulated latency per text in a batch request")
+    parser.add_argument("--concurrency", type=int, default=4, help="Ingestion and retrieve_many concurrency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression against the baseline")
+    args = parser.parse_args(argv)
+
+    corpus = SyntheticCorpus(args.users, args.documents, args.chunks, args.chunk_size, args.seed)
+    index = LocalVectorStore(DIMENSION)
+    results = {}
+    with StubOllamaServer(dimension=DIMENSION, latency=args.latency, per_item_latency=args.per_item_latency) as server:
+        # Point the embedding client at the stub, without the on-disk embedding cache
+        utils.OLLAMA_EMBEDDING_URL = f"{server.base_url}/api/embeddings"
+        utils.OLLAMA_EMBED_BATCH_URL = f"{server.base_url}/api/embed"
+        utils.embedding_cache = None
+
+        results["ingest"] = bench_ingest(index, corpus, args.concurrency)
+        results["query"] = bench_query(index, corpus, args.queries, args.top_k)
+        results["retrieve_many"] = bench_retrieve_many(index, corpus, args.queries, args.top_k, args.concurrency)
+        results["admin_listing"] = bench_admin_listing(index, corpus, args.page_size)
+        results["stats"] = bench_stats(index, corpus, args.stats_repeats)
+
+    report = {
+        "suite": "rag-stack-local",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args) | {"total_chunks": corpus.total_chunks, "dimension": DIMENSION},
+        "results": results,
+    }
+
+    print(f"{corpus.total_chunks} chunks for {args.users} users, Ollama stub latency {args.latency}s")
+    print(f"{'scenario':<15} {'ops':>6} {'items/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, result in results.items():
+        print(f"{name:<15} {result['operations']:>6} {result['throughput_per_s']:>10.1f} "
+              f"{result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f} {result['p99_ms']:>9.3f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        ignored = {"output", "baseline", "tolerance"}
+        changed = sorted(key for key, value in report["config"].items()
+                         if key not in ignored and baseline.get("config", {}).get(key) != value)
+        if changed:
+            print(f"Warning: the baseline was run with different settings ({', '.join(changed)}); results may not be comparable.")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
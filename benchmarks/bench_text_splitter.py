@@ -0,0 +1,91 @@
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from text_splitting import RecursiveTextSplitter
+from synthetic_corpus import make_vocabulary
+
+# Compares the in-project RecursiveTextSplitter with langchain's
+# RecursiveCharacterTextSplitter: the cost of importing each in a fresh interpreter (what
+# every app cold start and test run pays) and split throughput on a synthetic document
+# with paragraphs and line breaks. Both splitters must return identical chunks.
+# Needs langchain-text-splitters (or langchain) installed for the comparison.
+
+NATIVE_IMPORT = "from text_splitting import RecursiveTextSplitter"
+LANGCHAIN_IMPORT = ("try:\n    from langchain_text_splitters import RecursiveCharacterTextSplitter\n"
+                    "except ImportError:\n    from langchain.text_splitter import RecursiveCharacterTextSplitter")
+
+def import_seconds(statement, repeats):
+    # Wall time of the import statement alone, in a new interpreter each time
+    code = f"import time\nstarted = time.perf_counter()\n{statement}\nprint(time.perf_counter() - started)"
+    timings = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+def make_document(size, seed=0):
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(seed=seed)
+    paragraphs = []
+    length = 0
+    while length < size:
+        lines = [" ".join(rng.choices(vocabulary, k=rng.randint(5, 20))) for _ in range(rng.randint(1, 8))]
+        paragraph = "\n".join(lines)
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:size]
+
+def split_seconds(splitter, text, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        chunks = splitter.split_text(text)
+        timings.append(time.perf_counter() - started)
+    return timings, chunks
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and split throughput of the native splitter vs langchain's.")
+    parser.add_argument("--size", type=int, default=2_000_000, help="Characters in the synthetic document")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        try:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+        except ImportError:
+            sys.exit("langchain-text-splitters is not installed; pip install langchain-text-splitters to compare.")
+
+    native_import = import_seconds(NATIVE_IMPORT, args.repeats)
+    langchain_import = import_seconds(LANGCHAIN_IMPORT, args.repeats)
+
+    text = make_document(args.size)
+    native = RecursiveTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    langchain = RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+                                               length_function=len, is_separator_regex=False)
+    native_split, native_chunks = split_seconds(native, text, args.repeats)
+    langchain_split, langchain_chunks = split_seconds(langchain, text, args.repeats)
+    if native_chunks != langchain_chunks:
+        sys.exit("The splitters returned different chunks.")
+
+    megabytes = len(text) / 1e6
+    print(f"{len(text)} characters -> {len(native_chunks)} chunks (chunk_size={args.chunk_size}, chunk_overlap={args.chunk_overlap}), identical output")
+    print(f"{'':<26} {'import ms':>10} {'split ms':>10} {'M chars/s':>10}")
+    for name, imports, splits in (("RecursiveTextSplitter", native_import, native_split),
+                                  ("langchain", langchain_import, langchain_split)):
+        split_median = statistics.median(splits)
+        print(f"{name:<26} {statistics.median(imports) * 1000:>10.1f} {split_median * 1000:>10.1f} {megabytes / split_median:>10.2f}")
+
+if __name__ == "__main__":
+    main()
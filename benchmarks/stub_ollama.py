@@ -0,0 +1,80 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal stand-in for the Ollama embedding API, for benchmarks only. Serves
+# /api/embeddings (single prompt) and /api/embed (multi-input) over keep-alive
+# HTTP/1.1 and returns deterministic vectors derived from the text.
+
+def fake_embedding(text, dimension):
+    digest = hashlib.sha256(text.encode('utf-8')).digest()
+    return [((digest[i % len(digest)] + i) % 255) / 255.0 - 0.5 for i in range(dimension)]
+
+class _OllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True # Headers and body go out as separate writes on a kept-alive socket
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        if self.path == "/api/embeddings":
+            payload = {"embedding": fake_embedding(body.get("prompt", ""), server.dimension)}
+        elif self.path == "/api/embed" and server.batch_endpoint:
+            inputs = body.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            if server.per_item_latency:
+                time.sleep(server.per_item_latency * len(inputs))
+            payload = {"model": body.get("model"), "embeddings": [fake_embedding(text, server.dimension) for text in inputs]}
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        data = json.dumps(payload).encode('utf-8')
+        with server.stats_lock:
+            server.request_count += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output clean
+
+class StubOllamaServer:
+    def __init__(self, dimension=384, latency=0.0, per_item_latency=0.0, batch_endpoint=True, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), _OllamaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.dimension = dimension
+        self.httpd.latency = latency
+        self.httpd.per_item_latency = per_item_latency
+        self.httpd.batch_endpoint = batch_endpoint
+        self.httpd.request_count = 0
+        self.httpd.stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
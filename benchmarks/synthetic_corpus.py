@@ -0,0 +1,47 @@
+import itertools
+import random
+
+# Deterministic synthetic documents for benchmarks. The same seed always yields the same
+# vocabulary, documents, chunks and queries, so runs on different machines or releases
+# measure identical workloads. Word frequencies follow a Zipf-like distribution, which
+# gives realistic repetition for substring filters and embedding-cache hit rates.
+
+def make_vocabulary(size=5000, seed=0):
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(2, 10))))
+    return sorted(words)
+
+class SyntheticCorpus:
+    def __init__(self, users=4, documents_per_user=10, chunks_per_document=20, chunk_size=500, seed=0):
+        self.users = [f"bench{u}" for u in range(users)]
+        self.documents_per_user = documents_per_user
+        self.chunks_per_document = chunks_per_document
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.vocabulary = make_vocabulary(seed=seed)
+        self._cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(self.vocabulary))))
+
+    def _text(self, rng, length):
+        text = ""
+        while len(text) < length:
+            text += " ".join(rng.choices(self.vocabulary, cum_weights=self._cum_weights, k=length // 4)) + " "
+        return text[:length].strip()
+
+    def documents(self, user_id):
+        # [(document_id, [chunk, ...]), ...] for one user
+        rng = random.Random(f"{self.seed}:{user_id}")
+        return [
+            (f"doc{d:04d}", [self._text(rng, self.chunk_size) for _ in range(self.chunks_per_document)])
+            for d in range(self.documents_per_user)
+        ]
+
+    def queries(self, user_id, count, words=6):
+        rng = random.Random(f"{self.seed}:{user_id}:queries")
+        return [self._text(rng, words * 7) for _ in range(count)]
+
+    @property
+    def total_chunks(self):
+        return len(self.users) * self.documents_per_user * self.chunks_per_document
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+
+# --- Persistent Embedding Cache ---
+# Content-addressed: entries are keyed by (model, dimension, SHA-256 of the normalized
+# text) and stored as float32 blobs in SQLite. The least recently used entries are
+# evicted once max_entries is exceeded, and opening the cache with a different model
+# drops the entries of the previous one.
+
+def normalize_text(text):
+    return unicodedata.normalize("NFC", text).strip()
+
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, path, model, dimension, max_entries=200_000):
+        self.path = path
+        self.model = model
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, dimension INTEGER NOT NULL, text_hash TEXT NOT NULL, "
+            "embedding BLOB NOT NULL, last_access REAL NOT NULL, "
+            "PRIMARY KEY (model, dimension, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._invalidate_stale_model()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._conn.commit()
+
+    def _invalidate_stale_model(self):
+        current = f"{self.model}:{self.dimension}"
+        row = self._conn.execute("SELECT value FROM cache_meta WHERE name = 'model'").fetchone()
+        if row is None or row[0] != current:
+            # OLLAMA_EMBEDDING_MODEL (or DIMENSION) changed: old vectors are useless now
+            self._conn.execute("DELETE FROM embeddings WHERE model != ? OR dimension != ?", (self.model, self.dimension))
+            self._conn.execute("INSERT OR REPLACE INTO cache_meta (name, value) VALUES ('model', ?)", (current,))
+
+    def get_many(self, texts):
+        # Returns a list aligned with texts: the cached embedding or None
+        hashes = [text_hash(text) for text in texts]
+        results = [None] * len(texts)
+        found = {}
+        with self._lock:
+            unique = list(set(hashes))
+            for start in range(0, len(unique), 500): # Stay under SQLite's bound-parameter limit
+                part = unique[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, embedding FROM embeddings WHERE model = ? AND dimension = ? AND text_hash IN ({placeholders})",
+                    [self.model, self.dimension] + part,
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = blob
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND dimension = ? AND text_hash = ?",
+                    [(now, self.model, self.dimension, h) for h in found],
+                )
+                self._conn.commit()
+            for i, h in enumerate(hashes):
+                if h in found:
+                    results[i] = array('f', found[h]).tolist()
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return results
+
+    def get(self, text):
+        return self.get_many([text])[0]
+
+    def put_many(self, texts, embeddings):
+        now = time.time()
+        rows = [
+            (self.model, self.dimension, text_hash(text), array('f', embedding).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+            if embedding is not None and len(embedding) == self.dimension
+        ]
+        if not rows:
+            return
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, dimension, text_hash, embedding, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def put(self, text, embedding):
+        self.put_many([text], [embedding])
+
+    def _evict(self):
+        # Evict down to 90% of the bound so eviction does not run on every insert
+        target = int(self.max_entries * 0.9)
+        excess = self._count - target
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+            (excess,),
+        )
+        self.evictions += excess
+        self._count = target
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
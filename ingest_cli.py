@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from text_splitting import RecursiveTextSplitter, iter_file_chunks, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+
+# --- Offline Bulk Ingestion ---
+# Ingests every matching file under a directory for one user:
+#   python ingest_cli.py --user-id 1 ./documents --pattern "*.txt" --pattern "*.md"
+# Files are read and split in a process pool; the resulting chunks from all files flow
+# through a single embedding/upsert pipeline so batches span document boundaries.
+# Every fully stored document is appended to a checkpoint file, and a rerun with the
+# same checkpoint skips those documents. Document IDs are derived from the user and
+# file path, so a document interrupted half-way is overwritten, not duplicated, on resume.
+# Chunk IDs are positional, so before a document is (re-)ingested, any stored chunk past
+# its new chunk count (left by an earlier run over a longer version of the file) is deleted.
+
+def make_text_splitter(chunk_size, chunk_overlap):
+    return RecursiveTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+def document_id_for(user_id, path):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"rag-stack-local:{user_id}:{os.path.abspath(path)}"))
+
+def find_files(root, patterns):
+    import pathlib
+    found = set()
+    for pattern in patterns:
+        found.update(str(p) for p in pathlib.Path(root).rglob(pattern) if p.is_file())
+    return sorted(found)
+
+def load_checkpoint(path):
+    done = set()
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    done.add(json.loads(line)["path"])
+                except (ValueError, KeyError):
+                    continue # A torn last line from an interrupted write
+    return done
+
+class Checkpoint:
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def record(self, path, document_id, chunk_count):
+        if self._file is None:
+            return
+        self._file.write(json.dumps({"path": path, "document_id": document_id, "chunks": chunk_count, "completed_at": datetime.now().isoformat()}) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+def split_file(path, chunk_size, chunk_overlap):
+    # Runs in a worker process
+    splitter = make_text_splitter(chunk_size, chunk_overlap)
+    with open(path, "rb") as f:
+        return path, list(iter_file_chunks(f, splitter, chunk_size, chunk_overlap))
+
+def iter_split_files(paths, workers, chunk_size, chunk_overlap):
+    # Yields (path, chunks) in input order, keeping a bounded number of files in flight
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for path in paths:
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().result()
+            in_flight.append(pool.submit(split_file, path, chunk_size, chunk_overlap))
+        while in_flight:
+            yield in_flight.popleft().result()
+
+def ingest_directory(index, user_id, paths, checkpoint, workers, chunk_size, chunk_overlap, concurrency, log=print):
+    from ingest_pipeline import run_ingest_pipeline, chunk_content_hash
+    from pinecone_utils import list_document_embedding_ids, delete_embeddings
+
+    insert_date = datetime.now().isoformat()
+    documents = deque() # (path, document_id, first_index, chunk_count, failed) in stream order
+    stats = {"documents": 0, "failed_documents": 0}
+
+    def chunk_id(document_id, chunk_index):
+        return f"{user_id}-{document_id}-{chunk_index}"
+
+    def remove_stale_chunks(path, document_id, chunk_count):
+        # False if the document's stored chunks could not be checked or cleaned up
+        stored = list_document_embedding_ids(index, user_id, document_id)
+        if stored is None:
+            return False
+        current = {chunk_id(document_id, i) for i in range(chunk_count)}
+        stale = [vector_id for vector_id in stored if vector_id not in current]
+        if stale and not delete_embeddings(index, stale, user_id):
+            return False
+        if stale:
+            log(f"removed {len(stale)} stale chunks of {path}")
+        return True
+
+    def chunk_stream():
+        next_index = 0
+        for path, chunks in iter_split_files(paths, workers, chunk_size, chunk_overlap):
+            document_id = document_id_for(user_id, path)
+            if not remove_stale_chunks(path, document_id, len(chunks)):
+                stats["failed_documents"] += 1
+                log(f"FAILED {path}: could not remove chunks left by an earlier run")
+                continue
+            if not chunks:
+                checkpoint.record(path, document_id, 0)
+                continue
+            documents.append([path, document_id, next_index, len(chunks), 0])
+            for i, chunk in enumerate(chunks):
+                yield (document_id, i, chunk)
+            next_index += len(chunks)
+
+    def embed_items(items):
+        from utils import get_ollama_embeddings
+        return get_ollama_embeddings([chunk for _, _, chunk in items])
+
+    def build_vector(i, item, embedding):
+        document_id, chunk_index, chunk = item
+        return {
+            "id": chunk_id(document_id, chunk_index),
+            "values": embedding,
+            "metadata": {"text": chunk, "original_text_id": document_id, "user_id": user_id, "insert_date": insert_date, "content_hash": chunk_content_hash(chunk)},
+        }
+
+    def on_progress(i, vector_id, error):
+        # Chunks are reported in order, so the head document finishes with its last chunk
+        document = documents[0]
+        path, document_id, first_index, chunk_count, _ = document
+        if error:
+            document[4] += 1
+        if i == first_index + chunk_count - 1:
+            documents.popleft()
+            if document[4]:
+                stats["failed_documents"] += 1
+                log(f"FAILED {path}: {document[4]} of {chunk_count} chunks not stored ({error or 'see earlier errors'})")
+            else:
+                stats["documents"] += 1
+                checkpoint.record(path, document_id, chunk_count)
+                log(f"stored {path} ({chunk_count} chunks)")
+
+    summary = run_ingest_pipeline(index, chunk_stream(), build_vector, concurrency=concurrency, on_progress=on_progress, embed_fn=embed_items)
+    summary.update(stats)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory of text files into the RAG index for one user.")
+    parser.add_argument("root", help="Directory to ingest recursively")
+    parser.add_argument("--user-id", required=True, help="user_id the documents are stored under")
+    parser.add_argument("--pattern", action="append", help="Glob for files to ingest (repeatable, default: *.txt and *.md)")
+    parser.add_argument("--checkpoint", default=".ingest_checkpoint.jsonl", help="File recording completed documents; empty string disables resuming")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Processes used for reading and splitting files")
+    parser.add_argument("--concurrency", type=int, default=None, help="Parallel embedding requests (default: INGEST_CONCURRENCY)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_CHUNK_OVERLAP)
+    args = parser.parse_args(argv)
+
+    from ingest_pipeline import INGEST_CONCURRENCY
+    from pinecone_utils import get_rag_index
+
+    paths = find_files(args.root, args.pattern or ["*.txt", "*.md"])
+    done = load_checkpoint(args.checkpoint)
+    pending = [path for path in paths if path not in done]
+    print(f"{len(paths)} files found, {len(paths) - len(pending)} already ingested, {len(pending)} to go.")
+    if not pending:
+        return 0
+
+    index = get_rag_index()
+    if index is None:
+        print("Could not connect to the Pinecone RAG index. Check PINECONE_API_KEY, PINECONE_HOST and RAG_INDEX_NAME.", file=sys.stderr)
+        return 1
+
+    checkpoint = Checkpoint(args.checkpoint)
+    started = time.perf_counter()
+    try:
+        summary = ingest_directory(index, args.user_id, pending, checkpoint, max(1, args.workers), args.chunk_size,
+                                   args.chunk_overlap, args.concurrency or INGEST_CONCURRENCY)
+    finally:
+        checkpoint.close()
+    elapsed = time.perf_counter() - started
+    print(f"Done in {elapsed:.1f}s: {summary['documents']} documents and {summary['stored']} chunks stored, "
+          f"{summary['failed_documents']} documents failed.")
+    return 1 if summary["failed_documents"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import os
+import hashlib
+import queue
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from utils import get_ollama_embeddings
+from pinecone_utils import bulk_upsert, get_document_chunk_hashes, delete_embeddings
+
+load_dotenv() # Load environment variables from .env file
+
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", 4)) # Parallel embedding requests in flight
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", 8)) # Chunks handed to each embedding task
+INGEST_UPSERT_BATCH_SIZE = int(os.getenv("INGEST_UPSERT_BATCH_SIZE", 100)) # Vectors per upsert request
+
+_DONE = object()
+
+# --- Chunk Ingestion Pipeline ---
+# Stage 1 (caller thread): reads chunks and submits embedding tasks, at most
+#   2 * concurrency at a time so a fast reader cannot run ahead of the backends.
+# Stage 2 (thread pool): embeds each group of chunks and hands the vectors on.
+# Stage 3 (upsert thread): groups vectors into batched upserts.
+# Progress is reported back on the caller thread in chunk order, which keeps
+# Streamlit calls inside on_progress on the script thread.
+# If the upsert stage raises (build_vector or bulk_upsert), it keeps consuming the queue
+# so embedding workers are not blocked, reading stops, every chunk not yet reported is
+# reported as failed, and the exception is re-raised in the caller.
+
+class _OrderedReporter:
+    def __init__(self, on_progress):
+        self.on_progress = on_progress
+        self.next_index = 0
+        self.pending = {}
+        self.stored = 0
+        self.failed = 0
+
+    def add(self, event):
+        i, vector_id, error = event
+        self.pending[i] = (vector_id, error)
+        while self.next_index in self.pending:
+            vector_id, error = self.pending.pop(self.next_index)
+            if error is None:
+                self.stored += 1
+            else:
+                self.failed += 1
+            if self.on_progress:
+                self.on_progress(self.next_index, vector_id, error)
+            self.next_index += 1
+
+def _upsert_batch(index, batch, progress_queue):
+    result = bulk_upsert(index, [vector for _, vector in batch])
+    errors = {}
+    for vectors, error in result["failed_batches"]:
+        for vector in vectors:
+            errors[vector["id"]] = error
+    for i, vector in batch:
+        if vector["id"] in errors:
+            progress_queue.put((i, None, f"Error storing embedding in Pinecone: {errors[vector['id']]}"))
+        else:
+            progress_queue.put((i, vector["id"], None))
+
+def chunk_content_hash(chunk):
+    return hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+
+def make_chunk_vector_builder(user_id, document_id, insert_date, random_ids=False):
+    # build_vector for run_ingest_pipeline using the app's chunk ID and metadata layout.
+    # Each chunk gets a unique ID, but all chunks share the document ID as original_text_id.
+    # Positional IDs ("-0", "-1", ...) would collide with chunks kept from an earlier
+    # version of the document, so document updates use random suffixes instead.
+    def build_vector(i, chunk, embedding):
+        suffix = uuid.uuid4().hex[:16] if random_ids else i
+        return {
+            "id": f"{user_id}-{document_id}-{suffix}",
+            "values": embedding,
+            "metadata": {"text": chunk, "original_text_id": document_id, "user_id": user_id, "insert_date": insert_date, "content_hash": chunk_content_hash(chunk)},
+        }
+    return build_vector
+
+def run_ingest_pipeline(index, chunks, build_vector, concurrency=INGEST_CONCURRENCY,
+                        embed_batch_size=INGEST_EMBED_BATCH_SIZE, upsert_batch_size=INGEST_UPSERT_BATCH_SIZE,
+                        on_progress=None, embed_fn=None):
+    # `chunks` may be any iterable, including a generator that is still reading its input.
+    # build_vector(i, chunk, embedding) returns the vector dict to upsert for chunk i.
+    # on_progress(i, vector_id, error) is called once per chunk, in order.
+    embed_fn = embed_fn or get_ollama_embeddings
+    concurrency = max(1, concurrency)
+    embed_batch_size = max(1, embed_batch_size)
+    upsert_batch_size = max(1, upsert_batch_size)
+    upsert_queue = queue.Queue(maxsize=concurrency * 2)
+    progress_queue = queue.Queue()
+    in_flight = threading.BoundedSemaphore(concurrency * 2)
+    reporter = _OrderedReporter(on_progress)
+    upsert_errors = [] # Exception that stopped the upsert stage, if any
+
+    def embed_task(start, texts):
+        try:
+            embeddings = embed_fn(texts)
+        except Exception:
+            embeddings = None
+        if embeddings is None or len(embeddings) != len(texts):
+            embeddings = [None] * len(texts)
+        upsert_queue.put((start, texts, embeddings))
+        in_flight.release()
+
+    def upsert_stage():
+        pending = []
+        try:
+            while True:
+                item = upsert_queue.get()
+                if item is _DONE:
+                    break
+                start, texts, embeddings = item
+                for offset, (text, embedding) in enumerate(zip(texts, embeddings)):
+                    if embedding is None:
+                        progress_queue.put((start + offset, None, "Could not get embedding from Ollama."))
+                    else:
+                        pending.append((start + offset, build_vector(start + offset, text, embedding)))
+                while len(pending) >= upsert_batch_size:
+                    _upsert_batch(index, pending[:upsert_batch_size], progress_queue)
+                    pending = pending[upsert_batch_size:]
+            if pending:
+                _upsert_batch(index, pending, progress_queue)
+        except Exception as e:
+            upsert_errors.append(e)
+            # Unblock embedding workers waiting on the bounded queue; their chunks are
+            # reported as failed by the caller
+            while item is not _DONE:
+                item = upsert_queue.get()
+        finally:
+            progress_queue.put(_DONE)
+
+    def drain():
+        while True:
+            try:
+                event = progress_queue.get_nowait()
+            except queue.Empty:
+                return
+            reporter.add(event)
+
+    upserter = threading.Thread(target=upsert_stage, daemon=True)
+    upserter.start()
+    total = 0
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            def submit(start, texts):
+                # Wait for a free slot, reporting progress while blocked
+                while not in_flight.acquire(timeout=0.05):
+                    drain()
+                pool.submit(embed_task, start, texts)
+
+            batch = []
+            for chunk in chunks:
+                if upsert_errors:
+                    break # Nothing more can be stored; stop reading the input
+                batch.append(chunk)
+                total += 1
+                if len(batch) == embed_batch_size:
+                    submit(total - len(batch), batch)
+                    batch = []
+                drain()
+            if batch and not upsert_errors:
+                submit(total - len(batch), batch)
+    finally:
+        upsert_queue.put(_DONE)
+
+    while True:
+        event = progress_queue.get()
+        if event is _DONE:
+            break
+        reporter.add(event)
+    upserter.join()
+    if upsert_errors:
+        error = upsert_errors[0]
+        for i in range(reporter.next_index, total):
+            if i not in reporter.pending:
+                reporter.add((i, None, f"Error storing embedding in Pinecone: {error}"))
+        raise error
+    return {"total_chunks": total, "stored": reporter.stored, "failed": reporter.failed}
+
+# --- Incremental Document Updates ---
+def plan_document_update(existing_hashes, chunks):
+    # existing_hashes: {vector_id: content_hash} of the indexed version of the document.
+    # Returns (chunks_to_insert, ids_to_delete, unchanged_count). A stored chunk is kept
+    # once per identical new chunk; everything else is embedded or deleted.
+    available = {}
+    for vector_id, content_hash in existing_hashes.items():
+        available.setdefault(content_hash, []).append(vector_id)
+    to_insert = []
+    unchanged = 0
+    for chunk in chunks:
+        ids = available.get(chunk_content_hash(chunk))
+        if ids:
+            ids.pop()
+            unchanged += 1
+        else:
+            to_insert.append(chunk)
+    to_delete = [vector_id for ids in available.values() for vector_id in ids]
+    return to_insert, to_delete, unchanged
+
+def update_document(index, user_id, document_id, chunks, insert_date, concurrency=INGEST_CONCURRENCY, on_progress=None):
+    # Re-ingests a revised document under its existing original_text_id: only new or changed
+    # chunks are embedded and upserted, and chunks that disappeared are deleted afterwards.
+    # Returns None if the current version could not be read.
+    existing_hashes = get_document_chunk_hashes(index, user_id, document_id)
+    if existing_hashes is None:
+        return None
+    to_insert, to_delete, unchanged = plan_document_update(existing_hashes, chunks)
+    build_vector = make_chunk_vector_builder(user_id, document_id, insert_date, random_ids=True)
+    summary = run_ingest_pipeline(index, to_insert, build_vector, concurrency=concurrency, on_progress=on_progress)
+
+    deleted = 0
+    # Keep the old chunks if any replacement failed, so no content goes missing
+    if to_delete and not summary["failed"]:
+        if delete_embeddings(index, to_delete, user_id):
+            deleted = len(to_delete)
+    return {"unchanged": unchanged, "inserted": summary["stored"], "failed": summary["failed"], "deleted": deleted, "stale": len(to_delete) - deleted}
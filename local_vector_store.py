@@ -0,0 +1,839 @@
+import bisect
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from ann_index import IVFIndex, LOCAL_ANN_MIN_ROWS, LOCAL_ANN_NPROBE
+from quantization import QUANTIZATION_MODES, INT8_MIN_FIT_ROWS, make_quantizer, quantizer_from_params
+from pinecone_utils import (
+    VectorStore, VectorRecord, QueryResponse, FetchResponse, ListResponse, Pagination, IndexStats, matches_filter,
+)
+
+load_dotenv() # Load environment variables from .env file
+
+LOCAL_STORE_SEGMENT_ROWS = int(os.getenv("LOCAL_STORE_SEGMENT_ROWS", 50_000)) # Rows appended to a segment before a new one is started
+LOCAL_STORE_COMPACTION_INTERVAL = float(os.getenv("LOCAL_STORE_COMPACTION_INTERVAL", 60)) # Seconds between background compaction passes; 0 disables
+LOCAL_STORE_COMPACTION_RATIO = float(os.getenv("LOCAL_STORE_COMPACTION_RATIO", 0.2)) # Fraction of dead rows that makes a partition worth compacting
+LOCAL_STORE_RERANK_FACTOR = int(os.getenv("LOCAL_STORE_RERANK_FACTOR", 4)) # Quantized search re-ranks top_k * this many candidates at full precision
+
+# --- Local Vector Store ---
+# An in-process replacement for the Pinecone index. Vectors are grouped by a metadata
+# field ("user_id" for the RAG index) into one contiguous float32 matrix per value,
+# L2-normalized on insert, so a cosine top-k is a single matrix-vector product plus
+# argpartition. Queries that pin the partition field (all of the app's RAG queries)
+# only touch that partition's rows; any other filter is evaluated against each
+# candidate's metadata. When ann_min_rows is set (off by default, since it trades recall
+# for latency), partitions with at least that many rows answer unfiltered queries through
+# an IVF index (ann_index.py) instead of scoring every row.
+
+def _normalize(values):
+    norm = float(np.linalg.norm(values))
+    return (values / norm if norm > 0 else values), norm
+
+def _unpack_vectors(vectors, dimension):
+    # Accepts Pinecone-style dicts or (id, values[, metadata]) tuples
+    records = []
+    for vector in vectors:
+        if isinstance(vector, dict):
+            vector_id, values, metadata = vector["id"], vector["values"], dict(vector.get("metadata") or {})
+        else:
+            vector_id, values, metadata = vector[0], vector[1], dict(vector[2]) if len(vector) > 2 else {}
+        values = np.asarray(values, dtype=np.float32)
+        if values.shape != (dimension,):
+            raise ValueError(f"Vector {vector_id} has dimension {values.size}, expected {dimension}")
+        records.append((vector_id, values, metadata))
+    return records
+
+def _partition_key(query_filter, field):
+    # (True, value) when the filter pins the partition field to a single value
+    if not query_filter or field is None:
+        return False, None
+    condition = query_filter.get(field)
+    if isinstance(condition, dict):
+        if set(condition) == {"$eq"}:
+            return True, condition["$eq"]
+        return False, None
+    if condition is not None:
+        return True, condition
+    for part in query_filter.get("$and", []):
+        found, key = _partition_key(part, field)
+        if found:
+            return True, key
+    return False, None
+
+def _needs_filtering(query_filter, field, key):
+    # False when the filter only pins the partition, which the partition lookup already did
+    return bool(query_filter) and query_filter != {field: key}
+
+def _top_rows(scores, rows, k):
+    # Yields (score, row) for the k best scores; rows maps score positions back to rows
+    k = min(k, len(scores))
+    if k <= 0:
+        return
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    for t in top:
+        yield float(scores[t]), int(rows[t]) if rows is not None else int(t)
+
+def _filter_rows(metadata, query_filter, live=None):
+    mask = np.fromiter((matches_filter(m, query_filter) for m in metadata), dtype=bool, count=len(metadata))
+    if live is not None:
+        mask &= live
+    return np.flatnonzero(mask)
+
+def _ann_rows(ann, query_vector, top_k, nprobe):
+    # Candidate rows from the ANN index, or None to fall back to an exact scan. All-zero
+    # "list everything" query vectors and probes with fewer than top_k rows go exact.
+    if ann is None or not query_vector.any():
+        return None
+    rows = ann.candidates(query_vector, nprobe)
+    return rows if len(rows) >= top_k else None
+
+def _prefix_partition_keys(keys, prefix):
+    # Partitions that can hold IDs starting with prefix. The app's IDs start with
+    # "{partition value}-" (chunk IDs with "{user_id}-"), so a partition is skipped when its
+    # ID prefix and the requested one diverge; a None partition (no partition field) never is.
+    if not prefix:
+        return list(keys)
+    return [key for key in keys
+            if key is None or prefix.startswith(f"{key}-") or f"{key}-".startswith(prefix)]
+
+def _list_page(sorted_id_lists, prefix, limit, pagination_token):
+    # IDs in lexicographic order; the token is the last ID of the previous page. Each list
+    # is already sorted, so a page bisects to its start and reads at most limit + 1 IDs
+    # per list, independent of the partition size.
+    prefix = prefix or ""
+    heads = []
+    for ids in sorted_id_lists:
+        start = bisect.bisect_left(ids, prefix)
+        if pagination_token is not None:
+            start = max(start, bisect.bisect_right(ids, pagination_token))
+        end = start
+        while end < len(ids) and end - start <= limit and ids[end].startswith(prefix):
+            end += 1
+        heads.append(ids[start:end])
+    ids = list(itertools.islice(heapq.merge(*heads), limit + 1))
+    page = ids[:limit]
+    pagination = Pagination(page[-1]) if len(ids) > limit else None
+    return ListResponse([VectorRecord(vector_id) for vector_id in page], pagination)
+
+class _Partition:
+    def __init__(self, dimension, capacity=16):
+        self.vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self.norms = np.zeros(capacity, dtype=np.float32)
+        self.ids = []
+        self.metadata = []
+        self.ann = None
+        self._sorted_ids = None # Cached sorted(ids) for listing; dropped when IDs change
+
+    @property
+    def size(self):
+        return len(self.ids)
+
+    def sorted_ids(self):
+        if self._sorted_ids is None:
+            self._sorted_ids = sorted(self.ids)
+        return self._sorted_ids
+
+    def add(self, vector_id, values, metadata):
+        row = self.size
+        if row == len(self.vectors):
+            # Grow geometrically so appends stay amortized O(1)
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+            self.norms = np.concatenate([self.norms, np.zeros_like(self.norms)])
+        self.vectors[row], self.norms[row] = _normalize(values)
+        self._sorted_ids = None
+        self.ids.append(vector_id)
+        self.metadata.append(metadata)
+        if self.ann is not None:
+            self.ann.add(self.vectors[row:row + 1])
+        return row
+
+    def replace(self, row, values, metadata):
+        self.vectors[row], self.norms[row] = _normalize(values)
+        self.metadata[row] = metadata
+        if self.ann is not None:
+            self.ann.update(row, self.vectors[row])
+
+    def remove(self, row):
+        # Moves the last row into the gap to keep the matrix contiguous.
+        # Returns the ID of the moved vector (None if the last row was removed).
+        last = self.size - 1
+        moved = None
+        self._sorted_ids = None
+        if self.ann is not None:
+            self.ann.remove(row)
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.norms[row] = self.norms[last]
+            self.ids[row] = self.ids[last]
+            self.metadata[row] = self.metadata[last]
+            moved = self.ids[row]
+        self.ids.pop()
+        self.metadata.pop()
+        return moved
+
+    def values(self, row):
+        return (self.vectors[row] * self.norms[row]).tolist()
+
+class LocalVectorStore(VectorStore):
+    def __init__(self, dimension, partition_field="user_id", ann_min_rows=LOCAL_ANN_MIN_ROWS, nprobe=LOCAL_ANN_NPROBE):
+        self.dimension = dimension
+        self.partition_field = partition_field
+        self.ann_min_rows = ann_min_rows
+        self.nprobe = nprobe
+        self._partitions = {} # partition value -> _Partition
+        self._locations = {} # vector id -> (partition value, row)
+        self._lock = threading.RLock()
+
+    def _key(self, metadata):
+        return metadata.get(self.partition_field) if self.partition_field else None
+
+    def upsert(self, vectors, **kwargs):
+        records = _unpack_vectors(vectors, self.dimension)
+        with self._lock:
+            for vector_id, values, metadata in records:
+                key = self._key(metadata)
+                location = self._locations.get(vector_id)
+                if location is not None and location[0] == key:
+                    self._partitions[key].replace(location[1], values, metadata)
+                    continue
+                if location is not None:
+                    self._remove(vector_id)
+                partition = self._partitions.get(key)
+                if partition is None:
+                    partition = self._partitions[key] = _Partition(self.dimension)
+                self._locations[vector_id] = (key, partition.add(vector_id, values, metadata))
+        return {"upserted_count": len(records)}
+
+    def _partition_ann(self, partition):
+        # Builds the partition's IVF index once it is large enough, and retrains it after growth
+        if self.ann_min_rows <= 0 or partition.size < self.ann_min_rows:
+            partition.ann = None
+        elif partition.ann is None or partition.ann.needs_rebuild(partition.size):
+            partition.ann = IVFIndex.build(partition.vectors[:partition.size])
+        return partition.ann
+
+    def _remove(self, vector_id):
+        key, row = self._locations.pop(vector_id)
+        partition = self._partitions[key]
+        moved = partition.remove(row)
+        if moved is not None:
+            self._locations[moved] = (key, row)
+        if partition.size == 0:
+            del self._partitions[key]
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, filter=None, **kwargs):
+        query_vector, _ = _normalize(np.asarray(vector, dtype=np.float32))
+        pinned, key = _partition_key(filter, self.partition_field)
+        filtered = _needs_filtering(filter, self.partition_field, key)
+        candidates = []
+        with self._lock:
+            partitions = [self._partitions.get(key)] if pinned else list(self._partitions.values())
+            for partition in partitions:
+                if partition is None or partition.size == 0:
+                    continue
+                rows = None
+                if filtered:
+                    rows = _filter_rows(partition.metadata, filter)
+                else:
+                    rows = _ann_rows(self._partition_ann(partition), query_vector, top_k, kwargs.get("nprobe", self.nprobe))
+                scores = partition.vectors[:partition.size] @ query_vector if rows is None else partition.vectors[rows] @ query_vector
+                candidates.extend((score, partition, row) for score, row in _top_rows(scores, rows, top_k))
+            candidates.sort(key=lambda candidate: -candidate[0])
+            matches = [
+                VectorRecord(
+                    partition.ids[row],
+                    values=partition.values(row) if include_values else None,
+                    metadata=dict(partition.metadata[row]) if include_metadata else None,
+                    score=score,
+                )
+                for score, partition, row in candidates[:top_k]
+            ]
+        return QueryResponse(matches)
+
+    def delete(self, ids=None, filter=None, delete_all=False, **kwargs):
+        with self._lock:
+            if delete_all:
+                self._partitions.clear()
+                self._locations.clear()
+                return {}
+            targets = [vector_id for vector_id in (ids or []) if vector_id in self._locations]
+            if filter:
+                pinned, key = _partition_key(filter, self.partition_field)
+                partitions = [self._partitions.get(key)] if pinned else list(self._partitions.values())
+                for partition in partitions:
+                    if partition is not None:
+                        targets.extend(vector_id for vector_id, metadata in zip(partition.ids, partition.metadata)
+                                       if matches_filter(metadata, filter))
+            for vector_id in set(targets):
+                self._remove(vector_id)
+        return {}
+
+    def fetch(self, ids, **kwargs):
+        vectors = {}
+        with self._lock:
+            for vector_id in ids:
+                location = self._locations.get(vector_id)
+                if location is None:
+                    continue
+                partition = self._partitions[location[0]]
+                vectors[vector_id] = VectorRecord(vector_id, values=partition.values(location[1]),
+                                                  metadata=dict(partition.metadata[location[1]]))
+        return FetchResponse(vectors)
+
+    def list_paginated(self, prefix=None, limit=100, pagination_token=None, **kwargs):
+        with self._lock:
+            id_lists = [self._partitions[key].sorted_ids() for key in _prefix_partition_keys(self._partitions, prefix)]
+            return _list_page(id_lists, prefix, limit, pagination_token)
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            return IndexStats(self.dimension, len(self._locations))
+
+# --- Persistent Segment Format ---
+# PersistentVectorStore keeps the same partitions on disk under one directory:
+#   manifest.json            dimension, next segment number and each partition's segment list
+#   seg-00000001.f32         append-only raw float32 rows (normalized), opened with numpy.memmap
+#   seg-00000001.jsonl       sidecar, one line per row: {"id", "norm", "metadata"}, or a
+#                            {"deleted": id} tombstone for a row in an earlier line or segment
+# The last segment of a partition is its active segment; writes append to it until it
+# holds LOCAL_STORE_SEGMENT_ROWS rows. Opening the store only reads the manifest. A
+# partition's sidecars are read and its segments mapped the first time it is touched, so
+# memory tracks the partitions (and pages) queries actually use. Segments large enough
+# for an IVF index save it next to them (seg-00000001.ivf.npz), so it survives restarts;
+# rows appended after it was saved are assigned when it is loaded. With quantization,
+# each segment also keeps compressed rows (seg-00000001.codes, with the scale/offset in
+# seg-00000001.quant.json); queries scan the codes, and only the best
+# top_k * rerank_factor candidates are re-scored from the float32 rows, so the float32
+# pages a query touches are a small fraction of the partition. Compaction rewrites a
+# partition's live rows into one new segment once enough of its rows are dead, then swaps
+# the manifest and removes the old files; it runs on a background thread.
+# Vector IDs are assumed unique within a partition value; the app's IDs start with the
+# user ID, so an ID never moves between unloaded partitions.
+
+MANIFEST_VERSION = 1
+
+class _Segment:
+    def __init__(self, directory, number, dimension, quantization="none"):
+        self.number = number
+        self.dimension = dimension
+        self.quantization = quantization
+        self.vector_path = os.path.join(directory, f"seg-{number:08d}.f32")
+        self.sidecar_path = os.path.join(directory, f"seg-{number:08d}.jsonl")
+        self.ann_path = os.path.join(directory, f"seg-{number:08d}.ivf.npz")
+        self.codes_path = os.path.join(directory, f"seg-{number:08d}.codes")
+        self.quant_path = os.path.join(directory, f"seg-{number:08d}.quant.json")
+        self.ann = None
+        self.quantizer = None
+        self.codes = None
+        self.ids = []
+        self.metadata = []
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.live = np.zeros(0, dtype=bool)
+        self.dead = 0
+        self.vectors = np.zeros((0, dimension), dtype=np.float32)
+
+    @property
+    def rows(self):
+        return len(self.ids)
+
+    def remap(self):
+        if self.rows:
+            self.vectors = np.memmap(self.vector_path, dtype=np.float32, mode="r", shape=(self.rows, self.dimension))
+            if self.quantizer is not None:
+                self.codes = np.memmap(self.codes_path, dtype=self.quantizer.dtype, mode="r", shape=(self.rows, self.dimension))
+
+    def load_quantizer(self, truncate=False):
+        # Uses the segment's codes only if they match the configured mode and cover every row;
+        # otherwise the segment is scanned at full precision until compaction rewrites it.
+        # truncate drops codes of rows lost to a torn write, so later appends stay aligned.
+        self.quantizer = None
+        if self.quantization == "none" or not os.path.exists(self.quant_path):
+            return
+        with open(self.quant_path, "r", encoding="utf-8") as f:
+            quantizer = quantizer_from_params(json.load(f))
+        expected = self.rows * self.dimension * np.dtype(quantizer.dtype).itemsize
+        if quantizer.name == self.quantization and os.path.exists(self.codes_path) and os.path.getsize(self.codes_path) >= expected:
+            self.quantizer = quantizer
+            if truncate and os.path.getsize(self.codes_path) > expected:
+                with open(self.codes_path, "r+b") as f:
+                    f.truncate(expected)
+
+    def values(self, row):
+        return (np.asarray(self.vectors[row]) * self.norms[row]).tolist()
+
+    def kill(self, row):
+        if self.live[row]:
+            self.live[row] = False
+            self.dead += 1
+
+    def append(self, ids, vectors, norms, metadata):
+        # vectors are normalized float32 rows. They are written before the sidecar, so a
+        # crash never leaves a sidecar line without its vector.
+        with open(self.vector_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        if self.quantization != "none" and self.quantizer is None and self.rows == 0:
+            # The first rows of a segment fix its quantization parameters, unless they are
+            # too few to fit them (see _refit_quantizer)
+            self.quantizer = make_quantizer(self.quantization, vectors)
+            self._write_quantizer()
+        if self.quantizer is not None:
+            with open(self.codes_path, "ab") as f:
+                f.write(self.quantizer.encode(vectors).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self._append_lines([{"id": vector_id, "norm": float(norm), "metadata": meta} for vector_id, norm, meta in zip(ids, norms, metadata)])
+        self.ids.extend(ids)
+        self.metadata.extend(metadata)
+        self.norms = np.concatenate([self.norms, np.asarray(norms, dtype=np.float32)])
+        self.live = np.concatenate([self.live, np.ones(len(ids), dtype=bool)])
+        self.remap()
+        if self.quantizer is not None and not self.quantizer.fitted and self.rows >= INT8_MIN_FIT_ROWS:
+            self._refit_quantizer()
+        if self.ann is not None:
+            self.ann.add(vectors)
+
+    def _write_quantizer(self):
+        tmp_path = self.quant_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.quantizer.params(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.quant_path)
+
+    def _refit_quantizer(self, block_size=8192):
+        # A segment usually starts with one small upsert, too few rows to fit int8 ranges, so
+        # it starts on the [-1, 1] fallback. Once enough rows are stored, the ranges are fitted
+        # to them and every row is re-encoded. The parameters are removed first: after a crash
+        # in between, load_quantizer finds none and the segment is searched at full precision.
+        quantizer = make_quantizer(self.quantization, self.vectors)
+        os.remove(self.quant_path)
+        tmp_path = self.codes_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for start in range(0, self.rows, block_size):
+                f.write(quantizer.encode(self.vectors[start:start + block_size]).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.codes_path)
+        self.quantizer = quantizer
+        self._write_quantizer()
+        self.remap()
+
+    def append_tombstones(self, ids):
+        self._append_lines([{"deleted": vector_id} for vector_id in ids])
+
+    def _append_lines(self, records):
+        with open(self.sidecar_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove_files(self):
+        for path in (self.vector_path, self.sidecar_path, self.ann_path, self.codes_path, self.quant_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+class _SegmentedPartition:
+    def __init__(self, key, segments):
+        self.key = key
+        self.segments = segments
+        self.locations = {} # vector id -> (segment, row)
+        self.version = 0 # Bumped on every write, so compaction can detect concurrent changes
+        self._sorted_ids = None # (version, sorted live IDs) for listing
+
+    @property
+    def active(self):
+        return self.segments[-1]
+
+    @property
+    def live_count(self):
+        return len(self.locations)
+
+    @property
+    def dead_count(self):
+        return sum(segment.dead for segment in self.segments)
+
+    def sorted_ids(self):
+        if self._sorted_ids is None or self._sorted_ids[0] != self.version:
+            self._sorted_ids = (self.version, sorted(self.locations))
+        return self._sorted_ids[1]
+
+    def forget(self, vector_id):
+        location = self.locations.pop(vector_id, None)
+        if location is not None:
+            location[0].kill(location[1])
+        return location is not None
+
+    def load(self):
+        # Replays the sidecars in order. A torn last line (crash mid-write) is dropped, and
+        # the active segment's files are truncated to the last complete row.
+        for segment in self.segments:
+            norms = []
+            valid_bytes = 0
+            if os.path.exists(segment.sidecar_path):
+                with open(segment.sidecar_path, "rb") as f:
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            break
+                        valid_bytes += len(line)
+                        if "deleted" in record:
+                            self.locations.pop(record["deleted"], None)
+                            continue
+                        self.locations[record["id"]] = (segment, len(segment.ids))
+                        segment.ids.append(record["id"])
+                        segment.metadata.append(record["metadata"])
+                        norms.append(record["norm"])
+            vector_rows = os.path.getsize(segment.vector_path) // (4 * segment.dimension) if os.path.exists(segment.vector_path) else 0
+            for row in range(vector_rows, len(segment.ids)):
+                # The sidecar is written after the vectors, so this only happens if a file was damaged
+                if self.locations.get(segment.ids[row]) == (segment, row):
+                    del self.locations[segment.ids[row]]
+            del segment.ids[vector_rows:], segment.metadata[vector_rows:], norms[vector_rows:]
+            segment.norms = np.array(norms, dtype=np.float32)
+            if segment is self.active:
+                self._truncate(segment, valid_bytes)
+        # A row is live if the replay left its ID pointing at it
+        for segment in self.segments:
+            segment.live = np.zeros(segment.rows, dtype=bool)
+        for segment, row in self.locations.values():
+            segment.live[row] = True
+        for segment in self.segments:
+            segment.dead = segment.rows - int(segment.live.sum())
+            segment.load_quantizer(truncate=segment is self.active)
+            segment.remap()
+
+    def _truncate(self, segment, valid_bytes):
+        if os.path.exists(segment.sidecar_path) and os.path.getsize(segment.sidecar_path) > valid_bytes:
+            with open(segment.sidecar_path, "r+b") as f:
+                f.truncate(valid_bytes)
+        expected = segment.rows * 4 * segment.dimension
+        if os.path.exists(segment.vector_path) and os.path.getsize(segment.vector_path) > expected:
+            with open(segment.vector_path, "r+b") as f:
+                f.truncate(expected)
+
+class PersistentVectorStore(VectorStore):
+    def __init__(self, path, dimension, partition_field="user_id", segment_rows=LOCAL_STORE_SEGMENT_ROWS,
+                 compaction_interval=LOCAL_STORE_COMPACTION_INTERVAL, compaction_ratio=LOCAL_STORE_COMPACTION_RATIO,
+                 ann_min_rows=LOCAL_ANN_MIN_ROWS, nprobe=LOCAL_ANN_NPROBE, quantization="none", rerank_factor=LOCAL_STORE_RERANK_FACTOR):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {quantization} (expected one of {', '.join(QUANTIZATION_MODES)})")
+        self.path = path
+        self.dimension = dimension
+        self.partition_field = partition_field
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.ann_min_rows = ann_min_rows
+        self.nprobe = nprobe
+        self.segment_rows = segment_rows
+        self.compaction_ratio = compaction_ratio
+        self._lock = threading.RLock()
+        self._partitions = {} # partition value -> _SegmentedPartition, once loaded
+        self._owners = {} # vector id -> partition value, for loaded partitions
+        os.makedirs(path, exist_ok=True)
+        self._manifest_path = os.path.join(path, "manifest.json")
+        self._manifest = self._read_manifest()
+        self._stop = threading.Event()
+        self._compactor = None
+        if compaction_interval > 0:
+            self._compactor = threading.Thread(target=self._compaction_loop, args=(compaction_interval,), daemon=True)
+            self._compactor.start()
+
+    # Manifest
+    def _read_manifest(self):
+        if not os.path.exists(self._manifest_path):
+            return {"version": MANIFEST_VERSION, "dimension": self.dimension, "next_segment": 1, "partitions": []}
+        with open(self._manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["dimension"] != self.dimension:
+            raise ValueError(f"Vector store at {self.path} has dimension {manifest['dimension']}, expected {self.dimension}")
+        return manifest
+
+    def _write_manifest(self):
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path)
+
+    def _manifest_entry(self, key):
+        for entry in self._manifest["partitions"]:
+            if entry["key"] == key:
+                return entry
+        return None
+
+    def _new_segment(self):
+        number = self._manifest["next_segment"]
+        self._manifest["next_segment"] = number + 1
+        return _Segment(self.path, number, self.dimension, self.quantization)
+
+    # Partitions
+    def _key(self, metadata):
+        return metadata.get(self.partition_field) if self.partition_field else None
+
+    def _partition(self, key, create=False):
+        partition = self._partitions.get(key)
+        if partition is not None:
+            return partition
+        entry = self._manifest_entry(key)
+        if entry is None:
+            if not create:
+                return None
+            segment = self._new_segment()
+            self._manifest["partitions"].append({"key": key, "segments": [segment.number]})
+            self._write_manifest()
+            partition = _SegmentedPartition(key, [segment])
+        else:
+            partition = _SegmentedPartition(key, [_Segment(self.path, number, self.dimension, self.quantization) for number in entry["segments"]])
+            partition.load()
+        self._partitions[key] = partition
+        for vector_id in partition.locations:
+            self._owners[vector_id] = key
+        return partition
+
+    def _segment_ann(self, segment):
+        if self.ann_min_rows <= 0 or segment.rows < self.ann_min_rows:
+            return None
+        if segment.ann is None and os.path.exists(segment.ann_path):
+            try:
+                ann = IVFIndex.load(segment.ann_path)
+                if ann.size <= segment.rows:
+                    ann.add(segment.vectors[ann.size:])
+                    segment.ann = ann
+            except Exception:
+                pass # Rebuilt below
+        if segment.ann is None or segment.ann.needs_rebuild(segment.rows):
+            segment.ann = IVFIndex.build(segment.vectors)
+            segment.ann.save(segment.ann_path)
+        return segment.ann
+
+    def _all_partitions(self):
+        return [self._partition(entry["key"]) for entry in list(self._manifest["partitions"])]
+
+    def _locate(self, ids):
+        # Loads every partition if some IDs are not in the loaded ones
+        if any(vector_id not in self._owners for vector_id in ids) and len(self._partitions) < len(self._manifest["partitions"]):
+            self._all_partitions()
+        return {vector_id: self._owners[vector_id] for vector_id in ids if vector_id in self._owners}
+
+    def _delete_from(self, partition, ids):
+        ids = [vector_id for vector_id in ids if vector_id in partition.locations]
+        if not ids:
+            return
+        partition.active.append_tombstones(ids)
+        for vector_id in ids:
+            partition.forget(vector_id)
+            self._owners.pop(vector_id, None)
+        partition.version += 1
+
+    # VectorStore
+    def upsert(self, vectors, **kwargs):
+        records = _unpack_vectors(vectors, self.dimension)
+        with self._lock:
+            groups = {}
+            for vector_id, values, metadata in records:
+                groups.setdefault(self._key(metadata), {})[vector_id] = (values, metadata) # Last write of an ID wins
+            for key, group in groups.items():
+                partition = self._partition(key, create=True)
+                for vector_id in group:
+                    owner = self._owners.get(vector_id)
+                    if owner is not None and owner != key:
+                        self._delete_from(self._partitions[owner], [vector_id])
+                items = list(group.items())
+                while items:
+                    if partition.active.rows >= self.segment_rows:
+                        segment = self._new_segment()
+                        partition.segments.append(segment)
+                        self._manifest_entry(key)["segments"].append(segment.number)
+                        self._write_manifest()
+                    room = self.segment_rows - partition.active.rows
+                    part, items = items[:room], items[room:]
+                    ids = [vector_id for vector_id, _ in part]
+                    normalized = [_normalize(values) for _, (values, _) in part]
+                    segment = partition.active
+                    first_row = segment.rows
+                    for vector_id in ids:
+                        partition.forget(vector_id)
+                    segment.append(ids, np.stack([values for values, _ in normalized]), [norm for _, norm in normalized],
+                                   [metadata for _, (_, metadata) in part])
+                    for offset, vector_id in enumerate(ids):
+                        partition.locations[vector_id] = (segment, first_row + offset)
+                        self._owners[vector_id] = key
+                partition.version += 1
+        return {"upserted_count": len(records)}
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, filter=None, **kwargs):
+        query_vector, _ = _normalize(np.asarray(vector, dtype=np.float32))
+        pinned, key = _partition_key(filter, self.partition_field)
+        filtered = _needs_filtering(filter, self.partition_field, key)
+        candidates = []
+        with self._lock:
+            partitions = [self._partition(key)] if pinned else self._all_partitions()
+            for partition in partitions:
+                if partition is None:
+                    continue
+                for segment in partition.segments:
+                    if segment.rows == 0 or segment.rows == segment.dead:
+                        continue
+                    if filtered:
+                        rows = _filter_rows(segment.metadata, filter, segment.live)
+                    else:
+                        rows = _ann_rows(self._segment_ann(segment), query_vector, top_k, kwargs.get("nprobe", self.nprobe))
+                        if rows is not None and segment.dead:
+                            rows = rows[segment.live[rows]]
+                        elif rows is None and segment.dead:
+                            rows = np.flatnonzero(segment.live)
+                    rows = self._quantized_candidates(segment, rows, query_vector, top_k)
+                    scores = segment.vectors @ query_vector if rows is None else segment.vectors[rows] @ query_vector
+                    candidates.extend((score, segment, row) for score, row in _top_rows(scores, rows, top_k))
+            candidates.sort(key=lambda candidate: -candidate[0])
+            matches = [
+                VectorRecord(
+                    segment.ids[row],
+                    values=segment.values(row) if include_values else None,
+                    metadata=dict(segment.metadata[row]) if include_metadata else None,
+                    score=score,
+                )
+                for score, segment, row in candidates[:top_k]
+            ]
+        return QueryResponse(matches)
+
+    def _quantized_candidates(self, segment, rows, query_vector, top_k):
+        # Narrows rows (None: all rows) to the best candidates by their quantized scores;
+        # the caller re-scores those at full precision
+        keep = max(top_k * self.rerank_factor, 16)
+        if segment.quantizer is None or (segment.rows if rows is None else len(rows)) <= keep:
+            return rows
+        approximate = segment.quantizer.scores(segment.codes if rows is None else segment.codes[rows], query_vector)
+        best = np.argpartition(-approximate, keep - 1)[:keep]
+        return best if rows is None else rows[best]
+
+    def delete(self, ids=None, filter=None, delete_all=False, **kwargs):
+        with self._lock:
+            if delete_all:
+                for partition in self._all_partitions():
+                    for segment in partition.segments:
+                        segment.remove_files()
+                self._partitions.clear()
+                self._owners.clear()
+                self._manifest["partitions"] = []
+                self._write_manifest()
+                return {}
+            targets = {}
+            for vector_id, key in self._locate(ids or []).items():
+                targets.setdefault(key, []).append(vector_id)
+            if filter:
+                pinned, key = _partition_key(filter, self.partition_field)
+                partitions = [self._partition(key)] if pinned else self._all_partitions()
+                for partition in partitions:
+                    if partition is not None:
+                        targets.setdefault(partition.key, []).extend(
+                            vector_id for vector_id, (segment, row) in partition.locations.items()
+                            if matches_filter(segment.metadata[row], filter))
+            for key, vector_ids in targets.items():
+                self._delete_from(self._partitions[key], list(dict.fromkeys(vector_ids)))
+        return {}
+
+    def fetch(self, ids, **kwargs):
+        vectors = {}
+        with self._lock:
+            for vector_id, key in self._locate(ids).items():
+                segment, row = self._partitions[key].locations[vector_id]
+                vectors[vector_id] = VectorRecord(vector_id, values=segment.values(row), metadata=dict(segment.metadata[row]))
+        return FetchResponse(vectors)
+
+    def list_paginated(self, prefix=None, limit=100, pagination_token=None, **kwargs):
+        # Only the partitions the prefix can fall into are loaded (one for a user's prefix)
+        with self._lock:
+            keys = _prefix_partition_keys([entry["key"] for entry in self._manifest["partitions"]], prefix)
+            id_lists = [self._partition(key).sorted_ids() for key in keys]
+            return _list_page(id_lists, prefix, limit, pagination_token)
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            return IndexStats(self.dimension, sum(partition.live_count for partition in self._all_partitions()))
+
+    # Compaction
+    def compact(self, force=False):
+        # Compacts every loaded partition whose dead-row fraction reached compaction_ratio
+        # (or that has any dead rows, with force). Returns the number of partitions compacted.
+        with self._lock:
+            partitions = list(self._partitions.values())
+        compacted = 0
+        for partition in partitions:
+            dead = partition.dead_count
+            total = dead + partition.live_count
+            if dead and (force or dead / total >= self.compaction_ratio):
+                if self._compact_partition(partition):
+                    compacted += 1
+        return compacted
+
+    def _compact_partition(self, partition):
+        # Copies the live rows under the lock, writes the new segment without it, and swaps
+        # it in only if the partition was not written to in the meantime.
+        with self._lock:
+            if self._partitions.get(partition.key) is not partition:
+                return False
+            version = partition.version
+            segment = self._new_segment()
+            self._write_manifest() # Reserve the segment number
+            ids, blocks, norms, metadata = [], [], [], []
+            for old in partition.segments:
+                rows = np.flatnonzero(old.live)
+                if len(rows):
+                    ids.extend(old.ids[row] for row in rows)
+                    blocks.append(np.asarray(old.vectors[rows]))
+                    norms.append(old.norms[rows])
+                    metadata.extend(old.metadata[row] for row in rows)
+        try:
+            if ids:
+                segment.append(ids, np.concatenate(blocks), np.concatenate(norms), metadata)
+            else:
+                open(segment.vector_path, "wb").close()
+                open(segment.sidecar_path, "wb").close()
+        except Exception:
+            segment.remove_files()
+            raise
+        with self._lock:
+            if partition.version != version or self._partitions.get(partition.key) is not partition:
+                segment.remove_files()
+                return False
+            old_segments = partition.segments
+            partition.segments = [segment]
+            partition.locations = {vector_id: (segment, row) for row, vector_id in enumerate(segment.ids)}
+            partition.version += 1
+            self._manifest_entry(partition.key)["segments"] = [segment.number]
+            self._write_manifest()
+            for old in old_segments:
+                old.vectors = None # Release the mapping before the file goes away
+                old.remove_files()
+        return True
+
+    def _compaction_loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.compact()
+            except Exception:
+                logging.getLogger(__name__).exception("Vector store compaction failed")
+
+    def ping(self):
+        # Checks the directory without loading any partition (describe_index_stats loads them all)
+        if not os.access(self.path, os.R_OK | os.W_OK):
+            raise OSError(f"Vector store directory {self.path} is not readable and writable")
+        if os.path.exists(self._manifest_path) and not os.access(self._manifest_path, os.R_OK):
+            raise OSError(f"Vector store manifest {self._manifest_path} is not readable")
+
+    def close(self):
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
@@ -0,0 +1,254 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv() # Load environment variables from .env file
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true" # Record per-stage latency histograms and counters
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0)) # Serve Prometheus text at http://<host>:<port>/metrics; 0 disables the endpoint
+METRICS_FILE = os.getenv("METRICS_FILE", "") # Also write Prometheus text to this file (for node_exporter's textfile collector); empty disables
+METRICS_PANEL = os.getenv("METRICS_PANEL", "false").lower() == "true" # Show the performance panel in the app sidebar
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# --- Stage Metrics ---
+# Per-stage latency histograms (rag_stage_seconds{stage=...}), error counters and event
+# counters, kept in process memory and exported in the Prometheus text format. Stages
+# are the call sites that can dominate a request: embedding, index queries, statistics,
+# chunking, upserts, deletes, listing and page rendering. With METRICS_ENABLED unset,
+# timed() returns a shared no-op context manager and observe()/count() return at once,
+# so the instrumented paths pay one attribute check.
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation, as
+        # Prometheus' histogram_quantile does; observations above the last bound report it
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+class MetricsRegistry:
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._histograms = {} # stage -> Histogram
+        self._errors = {} # stage -> count
+        self._counters = {} # event -> count
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, event, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + value
+
+    def timed(self, stage):
+        if not self.enabled:
+            return _NOT_TIMED
+        return self._timer(stage)
+
+    @contextmanager
+    def _timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception: # Not BaseException: st.rerun() and st.stop() are not errors
+            with self._lock:
+                self._errors[stage] = self._errors.get(stage, 0) + 1
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def instrument(self, stage):
+        # Decorator form of timed() for whole functions
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self._timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def timed_iter(self, stage, iterable):
+        # Yields from iterable, timing only the work done inside it (not the consumer's)
+        # and recording the total once it is exhausted or closed
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - started
+                    return
+                elapsed += time.perf_counter() - started
+                yield item
+        finally:
+            self.observe(stage, elapsed)
+
+    def snapshot(self):
+        # {stage: {"count", "errors", "mean_ms", "p50_ms", "p95_ms", "p99_ms"}} for the panel
+        with self._lock:
+            stages = {}
+            for stage, histogram in sorted(self._histograms.items()):
+                stages[stage] = {
+                    "count": histogram.count,
+                    "errors": self._errors.get(stage, 0),
+                    "mean_ms": 1000 * histogram.sum / histogram.count if histogram.count else 0.0,
+                    "p50_ms": 1000 * histogram.quantile(0.50),
+                    "p95_ms": 1000 * histogram.quantile(0.95),
+                    "p99_ms": 1000 * histogram.quantile(0.99),
+                }
+            return stages
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def export_prometheus(self):
+        lines = []
+        with self._lock:
+            lines.append("# HELP rag_stage_seconds Latency of instrumented stages.")
+            lines.append("# TYPE rag_stage_seconds histogram")
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            lines.append("# HELP rag_stage_errors_total Instrumented stages that raised.")
+            lines.append("# TYPE rag_stage_errors_total counter")
+            for stage, errors in sorted(self._errors.items()):
+                lines.append(f'rag_stage_errors_total{{stage="{stage}"}} {errors}')
+            lines.append("# HELP rag_events_total Counted events (chunks upserted, vectors deleted, ...).")
+            lines.append("# TYPE rag_events_total counter")
+            for event, value in sorted(self._counters.items()):
+                lines.append(f'rag_events_total{{event="{event}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.export_prometheus())
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._errors.clear()
+            self._counters.clear()
+
+class _NotTimed:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOT_TIMED = _NotTimed()
+
+metrics = MetricsRegistry()
+
+# --- Export ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/healthz" and _health_check is not None:
+            # 200 when every index answered, 503 otherwise; the body is the check's report
+            report = _health_check()
+            data = json.dumps(report).encode('utf-8')
+            self.send_response(200 if report["ok"] else 503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if path != "/metrics":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = metrics.export_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+_exporter_lock = threading.Lock()
+_exporter = None
+_health_check = None # Callable returning {"ok": bool, ...}, served at /healthz
+_file_written_at = 0.0
+
+def start_exporter(port=METRICS_PORT, health_check=None):
+    # Starts the /metrics endpoint once per process (Streamlit reruns call this every time).
+    # With health_check, the same server also answers /healthz.
+    global _exporter, _health_check
+    if not metrics.enabled or not port:
+        return None
+    with _exporter_lock:
+        if health_check is not None:
+            _health_check = health_check
+        if _exporter is None:
+            _exporter = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            _exporter.daemon_threads = True
+            threading.Thread(target=_exporter.serve_forever, daemon=True).start()
+        return _exporter
+
+def flush_file(path=METRICS_FILE, min_interval=1.0):
+    # Rewrites the metrics file at most once per min_interval seconds
+    global _file_written_at
+    if not metrics.enabled or not path:
+        return
+    now = time.monotonic()
+    with _exporter_lock:
+        if now - _file_written_at < min_interval:
+            return
+        _file_written_at = now
+    metrics.write_file(path)
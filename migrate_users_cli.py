@@ -0,0 +1,34 @@
+import argparse
+import sys
+
+# --- User Store Migration ---
+# Copies the users in the Pinecone user index (USER_INDEX_NAME) into the SQLite user store:
+#   python migrate_users_cli.py --path users.db
+# Then set USER_STORE_BACKEND=sqlite (and USER_STORE_PATH to the same file). User IDs are
+# kept, so every user's stored chunks stay theirs. Users already in the SQLite store are
+# skipped, so the migration can be re-run to pick up late registrations.
+
+def main(argv=None):
+    from user_store import SQLiteUserStore, migrate_users, USER_STORE_PATH
+
+    parser = argparse.ArgumentParser(description="Copy users from the Pinecone user index into the SQLite user store.")
+    parser.add_argument("--path", default=USER_STORE_PATH, help="SQLite user store file (default: USER_STORE_PATH)")
+    args = parser.parse_args(argv)
+
+    from pinecone_utils import get_user_index
+
+    index = get_user_index()
+    if index is None:
+        print("Could not connect to the Pinecone user index. Check PINECONE_API_KEY, PINECONE_HOST and USER_INDEX_NAME.", file=sys.stderr)
+        return 1
+
+    store = SQLiteUserStore(args.path)
+    try:
+        copied, skipped = migrate_users(index, store)
+        print(f"{copied} users copied, {skipped} already present; {store.count()} users in {args.path}.")
+    finally:
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv() # Load environment variables from .env file
+
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", 16)) # Keep-alive connections kept per host; size for the number of concurrent workers
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", 3.0)) # Seconds to establish a connection
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", 60.0)) # Seconds to wait for a response
+OLLAMA_MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", 3))
+OLLAMA_BACKOFF_FACTOR = float(os.getenv("OLLAMA_BACKOFF_FACTOR", 0.25)) # First retry waits this long, doubling each time
+OLLAMA_RETRY_BUDGET = float(os.getenv("OLLAMA_RETRY_BUDGET", 10.0)) # Total seconds a single call may spend on retries
+OLLAMA_BREAKER_THRESHOLD = int(os.getenv("OLLAMA_BREAKER_THRESHOLD", 5)) # Consecutive failures before the circuit opens
+OLLAMA_BREAKER_RESET = float(os.getenv("OLLAMA_BREAKER_RESET", 30.0)) # Seconds before a trial request is let through
+
+# Overload and gateway errors are transient. A 500 is not retried and does not count toward
+# the breaker: Ollama returns it for deterministic failures (a model that fails to load,
+# bad input), so a retry would fail again and one bad request could open the breaker.
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    # Raised without touching the network while the breaker considers Ollama down
+    pass
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=OLLAMA_BREAKER_THRESHOLD, reset_timeout=OLLAMA_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            # Half-open: after the reset timeout let a single trial request through
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+class EmbeddingClient:
+    # Shared keep-alive HTTP client for the Ollama embedding service. Every call has
+    # connect/read timeouts, transient failures are retried with exponential backoff
+    # inside a per-call time budget, and a circuit breaker fails calls fast once
+    # Ollama is known to be down.
+    def __init__(self, pool_size=OLLAMA_POOL_SIZE, connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+                 read_timeout=OLLAMA_READ_TIMEOUT, max_retries=OLLAMA_MAX_RETRIES,
+                 backoff_factor=OLLAMA_BACKOFF_FACTOR, retry_budget=OLLAMA_RETRY_BUDGET, breaker=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.retry_budget = retry_budget
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _backoff(self, attempt):
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        return random.uniform(0, self.backoff_factor * (2 ** attempt))
+
+    def post(self, url, json):
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"Ollama circuit breaker is open; not sending request to {url}")
+
+        deadline = time.monotonic() + self.retry_budget
+        attempt = 0
+        while True:
+            error = None
+            response = None
+            try:
+                response = self.session.post(url, json=json, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    # Any non-retryable answer (including 4xx) means the server is up
+                    self.breaker.record_success()
+                    return response
+
+            delay = self._backoff(attempt)
+            attempt += 1
+            if attempt > self.max_retries or time.monotonic() + delay > deadline or self.breaker.is_open:
+                self.breaker.record_failure()
+                if error is not None:
+                    raise error
+                return response # Let the caller surface the HTTP error via raise_for_status
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
@@ -2,7 +2,17 @@ import streamlit as st
 from pinecone.grpc import PineconeGRPC
 from pinecone import ServerlessSpec
 import os
+import json
+import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from query_cache import query_cache
+from trigram_index import text_search_index
+from rag_stats import rag_stats
+from metrics import metrics
 
 load_dotenv() # Load environment variables from .env file
 
@@ -12,13 +22,24 @@ PINECONE_HOST = os.getenv("PINECONE_HOST")
 RAG_INDEX_NAME = os.getenv("RAG_INDEX_NAME")
 USER_INDEX_NAME = os.getenv("USER_INDEX_NAME")
 DIMENSION = int(os.getenv("DIMENSION", 384)) # Dimension for all-minilm:33m, with default
+RAG_INDEX_QUANTIZATION = os.getenv("RAG_INDEX_QUANTIZATION", "none").lower() # "none", "float16" or "int8"; local persistent store only
+USER_INDEX_QUANTIZATION = os.getenv("USER_INDEX_QUANTIZATION", "none").lower() # As above, for the user index
+PINECONE_UPSERT_BATCH_SIZE = int(os.getenv("PINECONE_UPSERT_BATCH_SIZE", 200)) # Max vectors per upsert request (Pinecone allows 1000)
+PINECONE_UPSERT_MAX_BYTES = int(os.getenv("PINECONE_UPSERT_MAX_BYTES", 2 * 1024 * 1024)) # Max size of one upsert request
+PINECONE_UPSERT_CONCURRENCY = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", 4)) # Upsert requests in flight at once
+USER_INDEX_LEGACY_LOOKUP = os.getenv("USER_INDEX_LEGACY_LOOKUP", "true").lower() == "true" # Fall back to a filtered query for user records stored before they were keyed by username
+PINECONE_FETCH_BATCH_SIZE = int(os.getenv("PINECONE_FETCH_BATCH_SIZE", 100)) # Max IDs per fetch request
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower() # "pinecone" or "local" (in-process NumPy store)
+LOCAL_VECTOR_STORE_PATH = os.getenv("LOCAL_VECTOR_STORE_PATH", "") # Directory for the local store's segments; empty keeps it in memory only
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 30)) # Seconds a health check result is reused by the sidebar status and /healthz
 
-def initialize_pinecone_rag_index():
+def initialize_pinecone_rag_index(pc=None):
     if not PINECONE_API_KEY or not PINECONE_HOST:
         st.error("Pinecone API Key or Host is not set. Please check your .env file.")
         return None
     try:
-        pc = PineconeGRPC(api_key=PINECONE_API_KEY, host=PINECONE_HOST, ssl_verify=False)
+        if pc is None:
+            pc = PineconeGRPC(api_key=PINECONE_API_KEY, host=PINECONE_HOST, ssl_verify=False)
         if not pc.has_index(RAG_INDEX_NAME):
             st.info(f"Pinecone RAG index '{RAG_INDEX_NAME}' not found. Creating it...")
             pc.create_index(
@@ -38,12 +59,13 @@ def initialize_pinecone_rag_index():
         st.error(f"Error connecting to Pinecone RAG index. Please check your Pinecone configuration (API Key, Host, network connectivity): {e}")
         return None
 
-def initialize_pinecone_user_index():
+def initialize_pinecone_user_index(pc=None):
     if not PINECONE_API_KEY or not PINECONE_HOST:
         st.error("Pinecone API Key or Host is not set. Please check your .env file.")
         return None
     try:
-        pc = PineconeGRPC(api_key=PINECONE_API_KEY, host=PINECONE_HOST, ssl_verify=False)
+        if pc is None:
+            pc = PineconeGRPC(api_key=PINECONE_API_KEY, host=PINECONE_HOST, ssl_verify=False)
         if not pc.has_index(USER_INDEX_NAME):
             st.info(f"Pinecone User index '{USER_INDEX_NAME}' not found. Creating it...")
             pc.create_index(
@@ -63,33 +85,381 @@ def initialize_pinecone_user_index():
         st.error(f"Error connecting to Pinecone User index. Please check your Pinecone configuration (API Key, Host, network connectivity): {e}")
         return None
 
+# --- Vector Store Interface ---
+# Everything in this module talks to an index through the subset of the Pinecone index
+# API below, so any VectorStore can be passed where an index is expected:
+#   upsert(vectors)                   vectors are dicts with "id", "values" and "metadata"
+#   query(vector, top_k, include_metadata, include_values, filter) -> QueryResponse
+#   delete(ids=None, filter=None)
+#   fetch(ids) -> FetchResponse
+#   list_paginated(prefix, limit, pagination_token) -> ListResponse
+#   describe_index_stats() -> IndexStats
+# PineconeVectorStore forwards to a Pinecone index; LocalVectorStore (local_vector_store.py)
+# answers the same calls in-process.
+
+class VectorRecord:
+    def __init__(self, id, values=None, metadata=None, score=None):
+        self.id = id
+        self.values = values if values is not None else []
+        self.metadata = metadata if metadata is not None else {}
+        self.score = score
+
+class QueryResponse:
+    def __init__(self, matches):
+        self.matches = matches
+
+class FetchResponse:
+    def __init__(self, vectors):
+        self.vectors = vectors # {id: VectorRecord}
+
+class Pagination:
+    def __init__(self, next):
+        self.next = next
+
+class ListResponse:
+    def __init__(self, vectors, pagination):
+        self.vectors = vectors # [VectorRecord] with only the id set
+        self.pagination = pagination # None on the last page
+
+class IndexStats:
+    def __init__(self, dimension, total_vector_count):
+        self.dimension = dimension
+        self.total_vector_count = total_vector_count
+
+class VectorStore:
+    def upsert(self, vectors, **kwargs):
+        raise NotImplementedError
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, filter=None, **kwargs):
+        raise NotImplementedError
+
+    def delete(self, ids=None, filter=None, **kwargs):
+        raise NotImplementedError
+
+    def fetch(self, ids, **kwargs):
+        raise NotImplementedError
+
+    def list_paginated(self, prefix=None, limit=100, pagination_token=None, **kwargs):
+        raise NotImplementedError
+
+    def describe_index_stats(self, **kwargs):
+        raise NotImplementedError
+
+    def ping(self):
+        # Raises if the index cannot be reached; used by the health check, so it must stay cheap
+        self.describe_index_stats()
+
+class PineconeVectorStore(VectorStore):
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, vectors, **kwargs):
+        return self.index.upsert(vectors=vectors, **kwargs)
+
+    def upsert_async(self, vectors, **kwargs):
+        # Lets bulk_upsert pipeline requests over the gRPC channel
+        return self.index.upsert_async(vectors=vectors, **kwargs)
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, filter=None, **kwargs):
+        return self.index.query(vector=vector, top_k=top_k, include_metadata=include_metadata,
+                                include_values=include_values, filter=filter, **kwargs)
+
+    def delete(self, ids=None, filter=None, **kwargs):
+        if filter is not None:
+            kwargs["filter"] = filter
+        return self.index.delete(ids=ids, **kwargs)
+
+    def fetch(self, ids, **kwargs):
+        return self.index.fetch(ids=ids, **kwargs)
+
+    def list_paginated(self, prefix=None, limit=100, pagination_token=None, **kwargs):
+        return self.index.list_paginated(prefix=prefix, limit=limit, pagination_token=pagination_token, **kwargs)
+
+    def describe_index_stats(self, **kwargs):
+        return self.index.describe_index_stats(**kwargs)
+
+def _matches_condition(metadata, field, condition):
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    present = field in metadata
+    value = metadata.get(field)
+    values = value if isinstance(value, list) else [value] # List fields match on any element
+    for operator, operand in condition.items():
+        if operator == "$exists":
+            ok = present == bool(operand)
+        elif not present:
+            ok = operator in ("$ne", "$nin")
+        elif operator == "$eq":
+            ok = operand in values
+        elif operator == "$ne":
+            ok = operand not in values
+        elif operator == "$in":
+            ok = any(v in operand for v in values)
+        elif operator == "$nin":
+            ok = not any(v in operand for v in values)
+        elif operator in ("$gt", "$gte", "$lt", "$lte"):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                ok = False
+            elif operator == "$gt":
+                ok = value > operand
+            elif operator == "$gte":
+                ok = value >= operand
+            elif operator == "$lt":
+                ok = value < operand
+            else:
+                ok = value <= operand
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        if not ok:
+            return False
+    return True
+
+def matches_filter(metadata, query_filter):
+    # Evaluates a Pinecone metadata filter ($eq, $ne, $in, $nin, $gt, $gte, $lt, $lte,
+    # $exists, $and, $or; a bare value means $eq) against one metadata dict
+    if not query_filter:
+        return True
+    for key, condition in query_filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, part) for part in condition):
+                return False
+        elif not _matches_condition(metadata, key, condition):
+            return False
+    return True
+
+# --- Connection Registry ---
+# Streamlit re-executes app.py on every interaction, but imported modules live for the
+# whole process. The registry creates the Pinecone client and each index handle once per
+# process, on first use, and hands the same objects (and their gRPC channels) to every
+# rerun and thread. Failed initializations are not cached, so a later call retries.
+_registry_lock = threading.Lock()
+_registry = {}
+
+def get_pinecone_client():
+    with _registry_lock:
+        if "client" not in _registry:
+            _registry["client"] = PineconeGRPC(api_key=PINECONE_API_KEY, host=PINECONE_HOST, ssl_verify=False)
+        return _registry["client"]
+
+def _get_registered_index(name, initialize):
+    with _registry_lock:
+        index = _registry.get(name)
+    if index is not None:
+        return index
+    if not PINECONE_API_KEY or not PINECONE_HOST:
+        return initialize() # Reports the missing configuration
+    try:
+        client = get_pinecone_client()
+    except Exception as e:
+        st.error(f"Error creating Pinecone client: {e}")
+        return None
+    with _registry_lock:
+        # Re-check under the lock so concurrent first calls initialize only once
+        if name not in _registry:
+            index = initialize(client)
+            if index is not None:
+                _registry[name] = index
+        return _registry.get(name)
+
+def _get_local_store(name, partition_field, quantization):
+    from local_vector_store import LocalVectorStore, PersistentVectorStore
+    with _registry_lock:
+        if name not in _registry:
+            if LOCAL_VECTOR_STORE_PATH:
+                _registry[name] = PersistentVectorStore(os.path.join(LOCAL_VECTOR_STORE_PATH, name), DIMENSION, partition_field,
+                                                        quantization=quantization)
+            else:
+                _registry[name] = LocalVectorStore(DIMENSION, partition_field)
+        return _registry[name]
+
+def _pinecone_store(initialize):
+    def initialize_store(pc=None):
+        index = initialize(pc)
+        return PineconeVectorStore(index) if index is not None else None
+    return initialize_store
+
+def get_rag_index():
+    if VECTOR_STORE_BACKEND == "local":
+        return _get_local_store("rag_index", "user_id", RAG_INDEX_QUANTIZATION) # Every RAG query is filtered by user_id
+    return _get_registered_index("rag_index", _pinecone_store(initialize_pinecone_rag_index))
+
+def get_user_index():
+    if VECTOR_STORE_BACKEND == "local":
+        return _get_local_store("user_index", None, USER_INDEX_QUANTIZATION) # One partition; users are looked up by username
+    return _get_registered_index("user_index", _pinecone_store(initialize_pinecone_user_index))
+
+_health_report = None # (time.monotonic(), report) of the last health check
+
+def pinecone_health_check(max_age=0):
+    # Pings every index handle the registry has created. Returns
+    # {"ok": bool, "indexes": {name: {"ok": bool, "latency_ms": float, "error": str | None}}}
+    # A report younger than max_age seconds is returned as is, so callers on every page
+    # run (the sidebar status) do not add a round trip each time.
+    global _health_report
+    cached = _health_report
+    if cached is not None and time.monotonic() - cached[0] < max_age:
+        return cached[1]
+    with _registry_lock:
+        indexes = {name: index for name, index in _registry.items() if name != "client"}
+    report = {"ok": bool(indexes), "indexes": {}}
+    for name, index in indexes.items():
+        started = time.perf_counter()
+        try:
+            index.ping()
+            report["indexes"][name] = {"ok": True, "latency_ms": (time.perf_counter() - started) * 1000, "error": None}
+        except Exception as e:
+            report["ok"] = False
+            report["indexes"][name] = {"ok": False, "latency_ms": (time.perf_counter() - started) * 1000, "error": str(e)}
+    _health_report = (time.monotonic(), report)
+    return report
+
+def reset_connections():
+    # Drops all cached handles; the next get_* call reconnects
+    global _health_report
+    with _registry_lock:
+        for handle in _registry.values():
+            if isinstance(handle, VectorStore) and hasattr(handle, "close"):
+                handle.close() # Stops the local store's compaction thread
+        _registry.clear()
+    _health_report = None
+
+def user_record_id(username):
+    # User records are keyed by a hash of the username, so looking a user up is a single fetch
+    return "user-" + hashlib.sha256(username.encode('utf-8')).hexdigest()
+
+_user_registration_lock = threading.Lock() # Serializes the registrations made by this process
+
 def add_user_to_pinecone_index(user_index, username, hashed_password, user_id):
+    # Pinecone has no conditional writes, so the record is fetched again right before the
+    # upsert and a taken username is refused (False, without an error). Registrations in
+    # this process are serialized; two processes registering the same username at the same
+    # moment can still overwrite each other (USER_STORE_BACKEND=sqlite refuses atomically).
+    record_id = user_record_id(username)
     try:
-        # Store user data with a dummy vector, actual data in metadata
-        user_index.upsert(vectors=[
-            {"id": user_id, "values": [0.0] * DIMENSION, "metadata": {"username": username, "password": hashed_password, "user_id": user_id}}
-        ])
+        with _user_registration_lock:
+            if record_id in user_index.fetch(ids=[record_id]).vectors:
+                return False
+            # Store user data with a dummy vector, actual data in metadata
+            user_index.upsert(vectors=[
+                {"id": record_id, "values": [0.0] * DIMENSION, "metadata": {"username": username, "password": hashed_password, "user_id": user_id}}
+            ])
         return True
     except Exception as e:
         st.error(f"Error adding user to Pinecone: {e}")
         return False
 
+def _estimate_vector_bytes(vector):
+    # Approximate encoded size: 4 bytes per float, the ID, JSON metadata and framing overhead
+    return 4 * len(vector["values"]) + len(vector["id"]) + len(json.dumps(vector.get("metadata", {}))) + 32
+
+def batch_vectors(vectors, batch_size=PINECONE_UPSERT_BATCH_SIZE, max_request_bytes=PINECONE_UPSERT_MAX_BYTES):
+    # Split vectors into batches bounded by both count and estimated request size
+    batches = []
+    current = []
+    current_bytes = 0
+    for vector in vectors:
+        size = _estimate_vector_bytes(vector)
+        if current and (len(current) >= batch_size or current_bytes + size > max_request_bytes):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(vector)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+def _upsert_batches(index, batches, max_concurrency):
+    # Yields (batch, error) for every batch, keeping at most max_concurrency requests in flight.
+    # The gRPC index returns futures from upsert_async; other index objects go through a thread pool.
+    if hasattr(index, "upsert_async"):
+        submit = lambda batch: index.upsert_async(vectors=batch)
+        executor = None
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        submit = lambda batch: executor.submit(index.upsert, vectors=batch)
+    try:
+        in_flight = deque()
+        for batch in batches:
+            if len(in_flight) >= max_concurrency:
+                yield _collect_upsert(*in_flight.popleft())
+            try:
+                in_flight.append((batch, submit(batch)))
+            except Exception as e:
+                yield batch, e
+        while in_flight:
+            yield _collect_upsert(*in_flight.popleft())
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+def _collect_upsert(batch, future):
+    try:
+        future.result()
+        return batch, None
+    except Exception as e:
+        return batch, e
+
+@metrics.instrument("upsert")
+def bulk_upsert(index, vectors, batch_size=PINECONE_UPSERT_BATCH_SIZE, max_request_bytes=PINECONE_UPSERT_MAX_BYTES,
+                max_concurrency=PINECONE_UPSERT_CONCURRENCY, max_retries=1):
+    # Upserts vectors in size-bounded batches issued concurrently. A failed batch does not
+    # abort the rest; it is retried up to max_retries times and then reported in
+    # "failed_batches" as (vectors, error message) so the caller can retry or surface it.
+    pending = batch_vectors(vectors, batch_size, max_request_bytes)
+    upserted_count = 0
+    failed_batches = []
+    for _ in range(max_retries + 1):
+        failed_batches = []
+        for batch, error in _upsert_batches(index, pending, max(1, max_concurrency)):
+            if error is None:
+                upserted_count += len(batch)
+                text_search_index.add_vectors(batch)
+                _record_stats(rag_stats.record_upserts, batch)
+            else:
+                failed_batches.append((batch, str(error)))
+        if not failed_batches:
+            break
+        pending = [batch for batch, _ in failed_batches]
+    metrics.count("vectors_upserted", upserted_count)
+    # Cached query results for the users written to are no longer valid
+    for user_id in {vector.get("metadata", {}).get("user_id") for vector in vectors}:
+        if user_id is not None:
+            query_cache.invalidate_user(user_id)
+    return {"upserted_count": upserted_count, "failed_batches": failed_batches}
+
 def get_user_from_pinecone_index(user_index, username):
     try:
-        # Query with a filter to find the user by username
-        results = user_index.query(
-            vector=[0.0] * DIMENSION, # Dummy vector
-            top_k=1,
-            include_metadata=True,
-            filter={"username": username}
-        )
-        if results.matches:
-            return results.matches[0].metadata
+        record_id = user_record_id(username)
+        record = user_index.fetch(ids=[record_id]).vectors.get(record_id)
+        if record is not None:
+            return dict(record.metadata)
+        if USER_INDEX_LEGACY_LOOKUP:
+            return _get_legacy_user(user_index, username)
         return None
     except Exception as e:
         st.error(f"Error retrieving user from Pinecone: {e}")
         return None
 
+def _get_legacy_user(user_index, username):
+    # Records stored before user_record_id existed are keyed by user_id: find one with a
+    # filtered query and re-key it, so the user's next lookup is a fetch
+    results = user_index.query(
+        vector=[0.0] * DIMENSION, # Dummy vector
+        top_k=1,
+        include_metadata=True,
+        filter={"username": username}
+    )
+    if not results.matches:
+        return None
+    match = results.matches[0]
+    user_index.upsert(vectors=[{"id": user_record_id(username), "values": [0.0] * DIMENSION, "metadata": dict(match.metadata)}])
+    user_index.delete(ids=[match.id])
+    return dict(match.metadata)
+
 def get_all_users_from_pinecone_index(user_index):
     try:
         # To get all users, query with a dummy vector and a high top_k
@@ -103,56 +473,155 @@ def get_all_users_from_pinecone_index(user_index):
         st.error(f"Error retrieving all users from Pinecone: {e}")
         return []
 
-def get_user_embeddings(index, user_id):
+def user_id_prefix(user_id):
+    # Chunk IDs are "{user_id}-{document_id}-{suffix}", so all of a user's chunks share this prefix
+    return f"{user_id}-"
+
+def document_id_prefix(user_id, document_id):
+    # Prefix shared by the chunks of one document
+    return f"{user_id_prefix(user_id)}{document_id}-"
+
+def _list_ids_with_prefix(index, prefix, page_size=100):
+    # Every ID starting with prefix, following the continuation tokens; raises on error
+    ids = []
+    pagination_token = None
+    while True:
+        page = index.list_paginated(prefix=prefix, limit=page_size, pagination_token=pagination_token)
+        ids.extend(vector.id for vector in page.vectors)
+        pagination = getattr(page, "pagination", None)
+        pagination_token = pagination.next if pagination else None
+        if not pagination_token:
+            return ids
+
+@metrics.instrument("list_ids")
+def list_document_embedding_ids(index, user_id, document_id):
+    # Every chunk ID stored for one document, or None on error
     try:
-        # Pinecone's query method is primarily for similarity search.
-        # To retrieve all vectors for a user, we can query with a dummy vector
-        # and a high top_k, filtered by user_id.
-        # This might not be efficient for a very large number of embeddings,
-        # but works for typical admin page scenarios.
-        results = index.query(
-            vector=[0.0] * DIMENSION, # Dummy vector
-            top_k=10000, # A sufficiently large number to retrieve all (or most)
-            include_metadata=True,
-            filter={"user_id": user_id}
-        )
-        return results.matches
+        return _list_ids_with_prefix(index, document_id_prefix(user_id, document_id))
+    except Exception as e:
+        st.error(f"Error listing document embeddings from Pinecone: {e}")
+        return None
+
+@metrics.instrument("list_ids")
+def list_user_embedding_ids(index, user_id, limit=100, pagination_token=None):
+    # One page of the user's chunk IDs, in ID order, without values or metadata.
+    # Returns (ids, next_token), where next_token is None on the last page, or None on error.
+    try:
+        page = index.list_paginated(prefix=user_id_prefix(user_id), limit=limit, pagination_token=pagination_token)
+        pagination = getattr(page, "pagination", None)
+        next_token = pagination.next if pagination else None
+        return [vector.id for vector in page.vectors], next_token or None
+    except Exception as e:
+        st.error(f"Error listing user embeddings from Pinecone: {e}")
+        return None
+
+def list_all_user_embedding_ids(index, user_id, page_size=100):
+    # Every chunk ID of the user, following the continuation tokens; None on error
+    ids = []
+    pagination_token = None
+    while True:
+        page = list_user_embedding_ids(index, user_id, page_size, pagination_token)
+        if page is None:
+            return None
+        page_ids, pagination_token = page
+        ids.extend(page_ids)
+        if pagination_token is None:
+            return ids
+
+@metrics.instrument("fetch")
+def fetch_embeddings(index, ids, batch_size=PINECONE_FETCH_BATCH_SIZE):
+    # Records (id, values, metadata) for the given IDs, in the same order. IDs that are no
+    # longer stored are skipped.
+    try:
+        records = {}
+        for start in range(0, len(ids), batch_size):
+            records.update(index.fetch(ids=ids[start:start + batch_size]).vectors)
+        return [records[vector_id] for vector_id in ids if vector_id in records]
     except Exception as e:
-        st.error(f"Error retrieving user embeddings from Pinecone: {e}")
+        st.error(f"Error fetching embeddings from Pinecone: {e}")
+        return []
+
+def get_user_embeddings(index, user_id):
+    # All of a user's chunks. Lists IDs page by page and fetches them in batches, so nothing
+    # is truncated; the admin page uses list_user_embedding_ids/fetch_embeddings per page instead.
+    ids = list_all_user_embedding_ids(index, user_id)
+    if not ids:
         return []
+    return fetch_embeddings(index, ids)
+
+def get_document_chunk_hashes(index, user_id, original_text_id):
+    # Returns {vector_id: content_hash} for the chunks currently stored for one document,
+    # or None on error. The document's chunk IDs are listed by their prefix and fetched in
+    # batches, so documents of any size are read completely. Chunks stored before content
+    # hashes existed hash their text here.
+    try:
+        ids = _list_ids_with_prefix(index, document_id_prefix(user_id, original_text_id))
+        hashes = {}
+        for start in range(0, len(ids), PINECONE_FETCH_BATCH_SIZE):
+            for vector_id, record in index.fetch(ids=ids[start:start + PINECONE_FETCH_BATCH_SIZE]).vectors.items():
+                metadata = record.metadata or {}
+                if metadata.get("user_id") != user_id or metadata.get("original_text_id") != original_text_id:
+                    continue
+                content_hash = metadata.get("content_hash")
+                if content_hash is None:
+                    content_hash = hashlib.sha256(metadata.get("text", "").encode('utf-8')).hexdigest()
+                hashes[vector_id] = content_hash
+        return hashes
+    except Exception as e:
+        st.error(f"Error retrieving document chunks from Pinecone: {e}")
+        return None
 
+@metrics.instrument("delete")
 def delete_embeddings(index, ids, user_id):
     try:
         # The IDs passed here are already filtered by user_id from get_user_embeddings.
         # Pinecone's delete operation does not allow explicit IDs and a filter simultaneously.
         # Therefore, we only pass the IDs.
         index.delete(ids=ids)
+        query_cache.invalidate_user(user_id)
+        text_search_index.remove(user_id, ids)
+        _record_stats(rag_stats.record_deletes, user_id, ids)
+        metrics.count("vectors_deleted", len(ids))
         st.success(f"Successfully deleted {len(ids)} embeddings for user {user_id}.")
         return True
     except Exception as e:
         st.error(f"Error deleting embeddings from Pinecone: {e}")
         return False
 
+def _record_stats(update, *args):
+    # A failed statistics update must not fail the write itself; the background
+    # reconciliation corrects the counts later
+    try:
+        update(*args)
+    except Exception:
+        pass
+
+def reconcile_user_rag_stats(index, user_id):
+    # Recounts the user's statistics from the IDs listed in the index, fetching only chunks
+    # the statistics store has not seen. Returns the statistics, or None on error.
+    return rag_stats.reconcile(user_id, lambda uid: list_all_user_embedding_ids(index, uid),
+                               lambda missing: fetch_embeddings(index, missing))
+
+def start_rag_stats_reconciler():
+    # Starts the background reconciliation of the RAG statistics once per process. The RAG
+    # index is looked up on every pass, so a reconnect after reset_connections() is used.
+    def list_ids(user_id):
+        index = get_rag_index()
+        return None if index is None else list_all_user_embedding_ids(index, user_id)
+    def fetch(ids):
+        index = get_rag_index()
+        return [] if index is None else fetch_embeddings(index, ids)
+    rag_stats.start_reconciler(list_ids, fetch)
+
+@metrics.instrument("rag_stats")
 def get_user_rag_stats(index, user_id):
+    # Reads the incrementally maintained counters; only a user never counted before (e.g.
+    # data stored before the statistics store existed) is counted from the index, once.
     try:
-        # Query to get all embeddings for a specific user
-        results = index.query(
-            vector=[0.0] * DIMENSION, # Dummy vector
-            top_k=10000, # A sufficiently large number to retrieve all
-            include_metadata=True,
-            filter={"user_id": user_id}
-        )
-        
-        total_chunks = len(results.matches)
-        
-        unique_original_text_ids = set()
-        for match in results.matches:
-            if "original_text_id" in match.metadata:
-                unique_original_text_ids.add(match.metadata["original_text_id"])
-        
-        total_documents = len(unique_original_text_ids)
-        
-        return {"total_documents": total_documents, "total_chunks": total_chunks}
+        stats = rag_stats.get(user_id)
+        if stats is None:
+            stats = reconcile_user_rag_stats(index, user_id)
+        return stats or {"total_documents": 0, "total_chunks": 0}
     except Exception as e:
         st.error(f"Error retrieving RAG statistics for user {user_id} from Pinecone: {e}")
         return {"total_documents": 0, "total_chunks": 0}
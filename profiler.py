@@ -0,0 +1,108 @@
+import cProfile
+import itertools
+import os
+import pstats
+import re
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv() # Load environment variables from .env file
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "false").lower() == "true" # Profile every script run with cProfile
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles") # Directory receiving one .prof file per profiled run
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 200)) # Newest .prof files kept in PROFILE_DIR; older ones are deleted
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", 15)) # Functions listed in the sidebar summary
+PROFILE_SORT = os.getenv("PROFILE_SORT", "tottime") # Summary order: "tottime" (own time) or "cumtime" (including callees)
+
+# --- Per-Rerun Profiler ---
+# Streamlit executes app.py top to bottom on every interaction. With PROFILE_ENABLED set,
+# each run is profiled with cProfile and written to PROFILE_DIR as
+# "<time>-<page>-<action>.prof", readable with pstats or snakeviz. The action is the
+# widget keys whose values changed since the previous run (a pressed button, an edited
+# input), "load" for a session's first run, or "rerun". Only one run is profiled at a time
+# per process (cProfile cannot nest); runs of other sessions meanwhile are not profiled.
+
+_profile_lock = threading.Lock()
+_file_counter = itertools.count(1)
+_ACTION_STATE_KEY = "_profiler_widget_state"
+
+def _tag(text):
+    return re.sub(r"[^A-Za-z0-9_.]+", "_", str(text)).strip("_")[:60] or "none"
+
+def detect_action(session_state):
+    # Keyed widgets whose values changed since the previous run. A bool going back to
+    # False is skipped: a pressed button reads True for one run and then resets.
+    current = {key: value for key, value in session_state.items()
+               if not str(key).startswith("_") and isinstance(value, (bool, int, float, str))}
+    previous = session_state.get(_ACTION_STATE_KEY)
+    session_state[_ACTION_STATE_KEY] = current
+    if previous is None:
+        return "load"
+    changed = sorted(str(key) for key, value in current.items()
+                     if previous.get(key) != value and not (isinstance(value, bool) and not value))
+    return "+".join(changed) or "rerun"
+
+def top_functions(profile, n=PROFILE_TOP_N, sort=PROFILE_SORT):
+    # [{"function", "calls", "own_ms", "cumulative_ms"}, ...] for the n most expensive functions
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in pstats.Stats(profile).stats.items():
+        location = f"{os.path.basename(filename)}:{line}" if line else filename
+        rows.append({"function": f"{location}({name})", "calls": calls,
+                     "own_ms": own * 1000, "cumulative_ms": cumulative * 1000})
+    key = "cumulative_ms" if sort == "cumtime" else "own_ms"
+    rows.sort(key=lambda row: row[key], reverse=True)
+    return rows[:n]
+
+def rotate(directory, keep=PROFILE_KEEP):
+    # File names start with a sortable timestamp, so the oldest sort first
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".prof"))
+    for name in names[:max(0, len(names) - keep)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+def write_profile(profile, page, action, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S") + f"-{next(_file_counter) % 10000:04d}"
+    path = os.path.join(directory, f"{stamp}-{_tag(page)}-{_tag(action)}.prof")
+    profile.dump_stats(path)
+    rotate(directory, keep)
+    return path
+
+class RunProfile:
+    # start() inside a try around the page code and stop() in its finally, so a run ending
+    # in st.rerun()/st.stop() or an error is still recorded and the lock is always released
+    def __init__(self, page, action, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+        self.page = page
+        self.action = action
+        self.directory = directory
+        self.keep = keep
+        self._profile = None
+        self._started = None
+
+    def start(self):
+        # False when another run is being profiled
+        if not _profile_lock.acquire(blocking=False):
+            return False
+        self._profile = cProfile.Profile()
+        self._started = time.perf_counter()
+        self._profile.enable()
+        return True
+
+    def stop(self):
+        # {"page", "action", "seconds", "path", "top"}, or None if this run was not profiled
+        if self._profile is None:
+            return None
+        self._profile.disable()
+        seconds = time.perf_counter() - self._started
+        _profile_lock.release()
+        try:
+            path = write_profile(self._profile, self.page, self.action, self.directory, self.keep)
+        except OSError:
+            path = None
+        summary = {"page": self.page, "action": self.action, "seconds": seconds,
+                   "path": path, "top": top_functions(self._profile)}
+        self._profile = None
+        return summary
@@ -0,0 +1,94 @@
+import numpy as np
+
+# --- Scalar Quantization ---
+# Compressed copies of normalized float32 rows that are cheap to scan. Scores computed
+# from the codes are approximate, so callers re-rank the best candidates against the
+# full-precision rows.
+#   float16: half the bytes, nearly lossless for unit vectors.
+#   int8:    a quarter of the bytes; each dimension is mapped linearly onto [-128, 127]
+#            with a per-dimension scale and offset fitted to the first rows seen, and
+#            values outside the fitted range are clipped. Too few rows to fit a range
+#            fall back to [-1, 1], which holds every component of a unit vector; such a
+#            quantizer is not "fitted", and its owner refits it once enough rows exist.
+
+QUANTIZATION_MODES = ("none", "float16", "int8")
+INT8_MIN_FIT_ROWS = 256 # Rows needed to fit int8 ranges from the data
+
+def _block_scores(codes, query, block_size=1024):
+    # codes @ query in float32, converting one cache-sized block at a time
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), block_size):
+        scores[start:start + block_size] = np.asarray(codes[start:start + block_size], dtype=np.float32) @ query
+    return scores
+
+class Float16Quantizer:
+    name = "float16"
+    dtype = np.float16
+    fitted = True # Nothing to fit
+
+    def encode(self, vectors):
+        return np.asarray(vectors, dtype=np.float16)
+
+    def scores(self, codes, query):
+        return _block_scores(codes, query)
+
+    def params(self):
+        return {"name": self.name}
+
+class Int8Quantizer:
+    name = "int8"
+    dtype = np.int8
+
+    def __init__(self, offset, scale, fitted=True):
+        self.offset = np.asarray(offset, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.fitted = fitted # False while on the [-1, 1] fallback range
+
+    @classmethod
+    def fit(cls, vectors, margin=0.1, min_rows=INT8_MIN_FIT_ROWS):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        fitted = len(vectors) >= min_rows
+        if not fitted:
+            low = np.full(vectors.shape[1], -1.0, dtype=np.float32)
+            high = np.full(vectors.shape[1], 1.0, dtype=np.float32)
+        else:
+            # Widen the observed range a little so later rows are rarely clipped
+            low = np.min(vectors, axis=0)
+            high = np.max(vectors, axis=0)
+            spread = np.maximum(high - low, 1e-6)
+            low = low - margin * spread
+            high = high + margin * spread
+        scale = (high - low) / 255.0
+        return cls(low + 128.0 * scale, scale, fitted)
+
+    def encode(self, vectors):
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.offset) / self.scale)
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def scores(self, codes, query):
+        # x ~ offset + scale * code, so x . q = offset . q + code . (scale * q)
+        return _block_scores(codes, self.scale * query) + float(self.offset @ query)
+
+    def params(self):
+        return {"name": self.name, "offset": self.offset.tolist(), "scale": self.scale.tolist(), "fitted": self.fitted}
+
+def make_quantizer(mode, sample):
+    # sample: the first rows to be encoded, used to fit int8 ranges
+    if mode == "float16":
+        return Float16Quantizer()
+    if mode == "int8":
+        return Int8Quantizer.fit(sample)
+    if mode in (None, "", "none"):
+        return None
+    raise ValueError(f"Unknown quantization mode: {mode} (expected one of {', '.join(QUANTIZATION_MODES)})")
+
+def quantizer_from_params(params):
+    if params["name"] == "float16":
+        return Float16Quantizer()
+    if params["name"] == "int8":
+        fitted = params.get("fitted")
+        if fitted is None:
+            # Written before "fitted" was recorded: the fallback range has scale 2/255 everywhere
+            fitted = not np.allclose(params["scale"], 2.0 / 255.0)
+        return Int8Quantizer(params["offset"], params["scale"], fitted)
+    raise ValueError(f"Unknown quantization mode: {params['name']}")
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv() # Load environment variables from .env file
+
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 300)) # Seconds a cached result stays valid; 0 disables the cache
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", 1024))
+
+# --- Query Result Cache ---
+# Results are keyed by (user_id, query hash, top_k, filter). Every user has a
+# generation number that is bumped whenever their vectors are written or deleted;
+# an entry is only served while its generation is current, so invalidating a user
+# is O(1) and results computed concurrently with a write are never served afterwards.
+
+class QueryCache:
+    def __init__(self, ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(user_id, query_text, top_k, query_filter):
+        query_hash = hashlib.sha256(query_text.encode('utf-8')).hexdigest()
+        return (user_id, query_hash, top_k, json.dumps(query_filter, sort_keys=True, default=str))
+
+    def generation(self, user_id):
+        # Capture this before running a query and pass it to put()
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def get(self, user_id, query_text, top_k, query_filter):
+        if self.ttl <= 0:
+            return None
+        key = self.make_key(user_id, query_text, top_k, query_filter)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, generation, value = entry
+                if expires_at > time.monotonic() and generation == self._generations.get(user_id, 0):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, user_id, query_text, top_k, query_filter, value, generation):
+        if self.ttl <= 0:
+            return
+        key = self.make_key(user_id, query_text, top_k, query_filter)
+        with self._lock:
+            if generation != self._generations.get(user_id, 0):
+                return # The user's data changed while this query ran
+            self._entries[key] = (time.monotonic() + self.ttl, generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+query_cache = QueryCache()
@@ -0,0 +1,197 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv() # Load environment variables from .env file
+
+RAG_STATS_PATH = os.getenv("RAG_STATS_PATH", "rag_stats.db") # SQLite file for the per-user RAG statistics (next to users.db); empty keeps them in memory for the process
+RAG_STATS_RECONCILE_INTERVAL = float(os.getenv("RAG_STATS_RECONCILE_INTERVAL", 3600)) # Seconds between background reconciliation passes; 0 disables
+
+# --- Incremental RAG Statistics ---
+# Per-user chunk and document counts for the statistics panel, maintained as chunks are
+# stored and deleted instead of being recounted from the index on every render.
+#   chunks      one row per stored chunk: (user_id, vector_id, original_text_id)
+#   documents   live chunk count of every (user_id, original_text_id)
+#   user_stats  total_chunks and total_documents per user, read by the panel; reconciled_at
+#               is NULL until the user has been counted from the index once
+# The chunk ledger makes updates idempotent: re-storing a chunk or retrying a delete does
+# not change the counts. Writes from other processes sharing the file (the bulk-ingestion
+# CLI) are counted too; writes that bypass pinecone_utils are corrected by reconcile(),
+# which compares the ledger with the IDs actually listed from the index. Writes for a user
+# who has not been counted yet keep the ledger current, but the row stays provisional (it
+# only covers the chunks written since) and get() ignores it until the first reconcile.
+
+class RagStats:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reconciler = None
+        self._closed = threading.Event() # Stops the reconciler
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Transactions are opened explicitly (BEGIN IMMEDIATE) so that a read followed by
+        # a write cannot be invalidated by another process writing in between
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "user_id TEXT NOT NULL, vector_id TEXT NOT NULL, original_text_id TEXT, "
+            "PRIMARY KEY (user_id, vector_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "user_id TEXT NOT NULL, original_text_id TEXT NOT NULL, chunks INTEGER NOT NULL, "
+            "PRIMARY KEY (user_id, original_text_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_stats ("
+            "user_id TEXT PRIMARY KEY, total_chunks INTEGER NOT NULL, total_documents INTEGER NOT NULL, "
+            "reconciled_at REAL)"
+        )
+
+    def get(self, user_id):
+        # {"total_documents", "total_chunks"}, or None for a user that has never been counted
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT total_documents, total_chunks FROM user_stats WHERE user_id = ? AND reconciled_at IS NOT NULL",
+                (str(user_id),),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"total_documents": row[0], "total_chunks": row[1]}
+
+    def users(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT user_id FROM user_stats")]
+
+    def record_upserts(self, vectors):
+        # vectors: upserted Pinecone vector dicts; vectors without a user_id are not chunks
+        rows = [(str(vector["metadata"]["user_id"]), vector["id"], vector["metadata"].get("original_text_id"))
+                for vector in vectors if vector.get("metadata", {}).get("user_id") is not None]
+        if rows:
+            with self._lock, self._transaction():
+                for user_id, vector_id, document_id in rows:
+                    self._add(user_id, vector_id, document_id)
+
+    def record_deletes(self, user_id, ids):
+        with self._lock, self._transaction():
+            for vector_id in ids:
+                self._remove(str(user_id), vector_id)
+
+    def reconcile(self, user_id, list_ids, fetch):
+        # Corrects the user's counts against the index. list_ids(user_id) returns every chunk
+        # ID the index lists for the user (None on error); fetch(ids) returns the records (with
+        # metadata) of chunks missing from the ledger. Returns the corrected statistics, or
+        # None if the listing failed.
+        # The ledger is read before listing: a chunk recorded while the listing runs is then
+        # neither in the snapshot nor removed for being absent from the listing.
+        user_id = str(user_id)
+        with self._lock:
+            known = {row[0] for row in self._conn.execute("SELECT vector_id FROM chunks WHERE user_id = ?", (user_id,))}
+        ids = list_ids(user_id)
+        if ids is None:
+            return None
+        current = set(ids)
+        missing = [vector_id for vector_id in ids if vector_id not in known]
+        records = fetch(missing) if missing else []
+        with self._lock, self._transaction():
+            for vector_id in known - current:
+                self._remove(user_id, vector_id)
+            for record in records:
+                self._add(user_id, record.id, (record.metadata or {}).get("original_text_id"))
+            self._conn.execute(
+                "INSERT INTO user_stats (user_id, total_chunks, total_documents, reconciled_at) VALUES (?, 0, 0, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET reconciled_at = excluded.reconciled_at",
+                (user_id, time.time()),
+            )
+        return self.get(user_id)
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _add(self, user_id, vector_id, document_id):
+        inserted = self._conn.execute(
+            "INSERT OR IGNORE INTO chunks (user_id, vector_id, original_text_id) VALUES (?, ?, ?)",
+            (user_id, vector_id, document_id),
+        ).rowcount
+        if not inserted:
+            return
+        new_document = 0
+        if document_id is not None:
+            new_document = self._conn.execute(
+                "INSERT OR IGNORE INTO documents (user_id, original_text_id, chunks) VALUES (?, ?, 1)",
+                (user_id, document_id),
+            ).rowcount
+            if not new_document:
+                self._conn.execute(
+                    "UPDATE documents SET chunks = chunks + 1 WHERE user_id = ? AND original_text_id = ?",
+                    (user_id, document_id),
+                )
+        self._conn.execute(
+            "INSERT INTO user_stats (user_id, total_chunks, total_documents) VALUES (?, 1, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET total_chunks = total_chunks + 1, "
+            "total_documents = total_documents + excluded.total_documents",
+            (user_id, new_document),
+        )
+
+    def _remove(self, user_id, vector_id):
+        row = self._conn.execute(
+            "SELECT original_text_id FROM chunks WHERE user_id = ? AND vector_id = ?", (user_id, vector_id)
+        ).fetchone()
+        if row is None:
+            return
+        self._conn.execute("DELETE FROM chunks WHERE user_id = ? AND vector_id = ?", (user_id, vector_id))
+        removed_document = 0
+        if row[0] is not None:
+            self._conn.execute(
+                "UPDATE documents SET chunks = chunks - 1 WHERE user_id = ? AND original_text_id = ?", (user_id, row[0])
+            )
+            removed_document = self._conn.execute(
+                "DELETE FROM documents WHERE user_id = ? AND original_text_id = ? AND chunks <= 0", (user_id, row[0])
+            ).rowcount
+        self._conn.execute(
+            "UPDATE user_stats SET total_chunks = total_chunks - 1, total_documents = total_documents - ? WHERE user_id = ?",
+            (removed_document, user_id),
+        )
+
+    def start_reconciler(self, list_ids, fetch, interval=RAG_STATS_RECONCILE_INTERVAL):
+        # Starts (once) a daemon thread that reconciles every counted user each interval
+        # seconds. list_ids(user_id) returns all of the user's chunk IDs, or None on error;
+        # both callables are invoked on every pass, so they should resolve the index then.
+        with self._lock:
+            if interval <= 0 or self._reconciler is not None:
+                return
+            self._reconciler = threading.Thread(target=self._reconcile_loop, args=(list_ids, fetch, interval), daemon=True)
+            self._reconciler.start()
+
+    def _reconcile_loop(self, list_ids, fetch, interval):
+        while not self._closed.wait(interval):
+            for user_id in self.users():
+                if self._closed.is_set():
+                    return
+                try:
+                    self.reconcile(user_id, list_ids, fetch)
+                except Exception:
+                    # Retried on the next pass
+                    logging.getLogger(__name__).exception("RAG statistics reconciliation failed for user %s", user_id)
+
+    def close(self):
+        self._closed.set()
+        if self._reconciler is not None:
+            self._reconciler.join() # Outside the lock: a running pass still needs it
+        with self._lock:
+            self._conn.close()
+
+rag_stats = RagStats(RAG_STATS_PATH or ":memory:")
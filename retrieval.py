@@ -0,0 +1,90 @@
+import os
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from utils import get_ollama_embedding, get_ollama_embeddings
+from query_cache import query_cache
+from metrics import metrics
+
+load_dotenv() # Load environment variables from .env file
+
+RETRIEVAL_CONCURRENCY = int(os.getenv("RETRIEVAL_CONCURRENCY", 8)) # Index queries in flight at once in retrieve_many
+
+# --- Similarity Retrieval ---
+def retrieve_similar(index, user_id, query_text, top_k=5):
+    # Returns the list of matches for the user's query, or None if it could not be answered.
+    # Repeated queries are served from the query cache until the user's data changes.
+    query_filter = {"user_id": user_id} # Filter by user ID
+    cached = query_cache.get(user_id, query_text, top_k, query_filter)
+    if cached is not None:
+        metrics.count("query_cache_hits")
+        return cached
+
+    generation = query_cache.generation(user_id)
+    query_embedding = get_ollama_embedding(query_text)
+    if not query_embedding:
+        return None
+    try:
+        with metrics.timed("index_query"):
+            results = index.query(
+                vector=query_embedding,
+                top_k=top_k,
+                include_metadata=True,
+                filter=query_filter
+            )
+    except Exception as e:
+        st.error(f"Error retrieving similar embeddings from Pinecone: {e}")
+        return None
+    matches = list(results.matches)
+    query_cache.put(user_id, query_text, top_k, query_filter, matches, generation)
+    return matches
+
+def retrieve_many(user_id, queries, top_k=5, index=None, max_concurrency=RETRIEVAL_CONCURRENCY):
+    # Bulk form of retrieve_similar for evaluation and dashboard jobs. Returns a list aligned
+    # with queries: the matches for each query, or None where it could not be answered.
+    # Identical queries are answered once; cached results are reused; the remaining
+    # queries are embedded in batches and then queried with up to max_concurrency index
+    # requests in flight.
+    if index is None:
+        from pinecone_utils import get_rag_index
+        index = get_rag_index()
+        if index is None:
+            st.error("Pinecone RAG index not initialized. Please check the connection.")
+            return [None] * len(queries)
+    query_filter = {"user_id": user_id} # Filter by user ID
+    unique = list(dict.fromkeys(queries))
+    results = {}
+    generation = query_cache.generation(user_id)
+    pending = []
+    for query_text in unique:
+        cached = query_cache.get(user_id, query_text, top_k, query_filter)
+        if cached is not None:
+            metrics.count("query_cache_hits")
+            results[query_text] = cached
+        else:
+            pending.append(query_text)
+
+    if pending:
+        embeddings = get_ollama_embeddings(pending)
+
+        def run_query(embedding):
+            with metrics.timed("index_query"):
+                return list(index.query(vector=embedding, top_k=top_k, include_metadata=True, filter=query_filter).matches)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            futures = {query_text: executor.submit(run_query, embedding)
+                       for query_text, embedding in zip(pending, embeddings) if embedding}
+        errors = []
+        for query_text, future in futures.items():
+            try:
+                matches = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            results[query_text] = matches
+            query_cache.put(user_id, query_text, top_k, query_filter, matches, generation)
+        if errors:
+            # Reported once, from the calling thread
+            st.error(f"Error retrieving similar embeddings from Pinecone for {len(errors)} queries: {errors[0]}")
+
+    return [results.get(query_text) for query_text in queries]
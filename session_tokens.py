@@ -0,0 +1,122 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv() # Load environment variables from .env file
+
+SESSION_SECRET = os.getenv("SESSION_SECRET", "") # Key signing session tokens; empty uses a random key, so sessions end when the process restarts
+SESSION_TTL = int(os.getenv("SESSION_TTL", 3600)) # Seconds a login stays valid across browser reloads; 0 disables session tokens
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "sessions.db") # SQLite file of live session IDs (next to users.db); empty keeps them in memory for the process
+
+# --- Signed Session Tokens ---
+# A token is base64url(JSON payload) + "." + base64url(HMAC-SHA256 of the payload), with
+# the payload {"user_id", "username", "sid", "exp"}. A reload restores the login by
+# checking the signature and expiry, and that the random session ID "sid" is still in the
+# session store: no password verification and no user-store lookup. Logging out deletes
+# the session ID, so a copy of the token (the URL in browser history, a proxy log or a
+# shared link) stops working; changing SESSION_SECRET ends every session.
+
+class SessionStore:
+    # Session IDs of the tokens issued and not yet revoked, with their expiry. One
+    # connection shared under a lock, so an in-memory store is shared by all threads.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def add(self, session_id, user_id, expires_at, now=None):
+        # Expired sessions are purged as new ones are added, so the table stays small
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now if now is not None else time.time(),))
+            self._conn.execute("INSERT OR REPLACE INTO sessions (session_id, user_id, expires_at) VALUES (?, ?, ?)",
+                               (session_id, str(user_id), expires_at))
+
+    def active(self, session_id, now=None):
+        with self._lock:
+            row = self._conn.execute("SELECT expires_at FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row is not None and row[0] > (now if now is not None else time.time())
+
+    def revoke(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+session_store = SessionStore(SESSION_STORE_PATH or ":memory:")
+_secret = SESSION_SECRET.encode('utf-8') if SESSION_SECRET else secrets.token_bytes(32)
+
+def warn_if_no_secret(secret=SESSION_SECRET, ttl=SESSION_TTL):
+    # Without SESSION_SECRET each process signs with its own random key: a restart logs
+    # everybody out, and with several workers a token is only accepted by the one that issued it
+    if ttl > 0 and not secret:
+        logging.getLogger(__name__).warning(
+            "SESSION_SECRET is not set; session tokens are signed with a random per-process key, so they "
+            "stop working when the app restarts and are rejected by other workers. Set SESSION_SECRET to "
+            "a long random string.")
+        return True
+    return False
+
+warn_if_no_secret() # Once per process, at startup
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode('ascii')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _sign(payload, secret):
+    return hmac.new(secret, payload.encode('ascii'), hashlib.sha256).digest()
+
+def issue_token(user_id, username, ttl=SESSION_TTL, secret=None, now=None, store=None):
+    now = now if now is not None else time.time()
+    expires_at = int(now + ttl)
+    session_id = secrets.token_urlsafe(16)
+    (store or session_store).add(session_id, user_id, expires_at, now=now)
+    payload = _b64encode(json.dumps({"user_id": user_id, "username": username, "sid": session_id, "exp": expires_at},
+                                    separators=(",", ":")).encode('utf-8'))
+    return payload + "." + _b64encode(_sign(payload, secret or _secret))
+
+def _claims(token, secret):
+    # The payload of a correctly signed token, or None
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(_b64decode(signature), _sign(payload, secret or _secret)):
+            return None
+        claims = json.loads(_b64decode(payload))
+        return claims if isinstance(claims, dict) else None
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+def verify_token(token, secret=None, now=None, store=None):
+    # {"user_id", "username"} for a valid, unexpired, unrevoked token; None otherwise
+    claims = _claims(token, secret)
+    if claims is None or not isinstance(claims.get("sid"), str):
+        return None
+    try:
+        now = now if now is not None else time.time()
+        if claims["exp"] <= now or not (store or session_store).active(claims["sid"], now=now):
+            return None
+        return {"user_id": claims["user_id"], "username": claims["username"]}
+    except (KeyError, TypeError):
+        return None
+
+def revoke_token(token, secret=None, store=None):
+    # Ends the token's session; a token that was not issued by us is ignored
+    claims = _claims(token, secret)
+    if claims is not None and isinstance(claims.get("sid"), str):
+        (store or session_store).revoke(claims["sid"])
@@ -0,0 +1,17 @@
+import pytest
+import os
+import sys
+from unittest.mock import MagicMock
+
+# Keep the statistics and session stores in memory instead of writing into the checkout
+os.environ.setdefault("RAG_STATS_PATH", "")
+os.environ.setdefault("SESSION_STORE_PATH", "")
+
+# All test modules share one Streamlit mock, whichever module imports the app code
+# first. Reset it before every test so st.* assertions only see that test's calls.
+sys.modules['streamlit'] = MagicMock()
+
+@pytest.fixture(autouse=True)
+def reset_streamlit_mock():
+    sys.modules['streamlit'].reset_mock()
+    yield
@@ -0,0 +1,123 @@
+import pytest
+from unittest.mock import MagicMock
+import sys
+import os
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing ann_index
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from ann_index import IVFIndex, kmeans, assign
+from local_vector_store import LocalVectorStore, PersistentVectorStore
+
+DIM = 32
+
+def clustered(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, DIM))
+    vectors = centers[rng.integers(0, 20, size=rows)] + rng.normal(scale=0.3, size=(rows, DIM))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def test_kmeans_centroids_are_unit_vectors():
+    centroids = kmeans(clustered(2000), 16)
+    assert centroids.shape == (16, DIM)
+    assert np.allclose(np.linalg.norm(centroids, axis=1), 1.0, atol=1e-5)
+
+def test_candidates_contain_the_query_row_and_all_rows_at_full_probe():
+    vectors = clustered(3000)
+    index = IVFIndex.build(vectors, nlist=32)
+    for row in [0, 17, 2999]:
+        assert row in index.candidates(vectors[row], nprobe=1)
+    assert len(index.candidates(vectors[0], nprobe=index.nlist)) == 3000
+
+def test_add_update_and_remove_track_the_matrix():
+    vectors = clustered(1000)
+    index = IVFIndex.build(vectors[:600], nlist=8)
+    index.add(vectors[600:])
+    assert index.size == 1000
+    assert np.array_equal(index.labels, assign(vectors, index.centroids))
+    index.update(5, vectors[900])
+    assert index.labels[5] == index.labels[900]
+    last_label = index.labels[999]
+    index.remove(3)
+    assert index.size == 999 and index.labels[3] == last_label
+    assert not index.needs_rebuild(1199, growth=2.0)
+    assert index.needs_rebuild(1201, growth=2.0)
+
+def test_save_and_load(tmp_path):
+    vectors = clustered(500)
+    index = IVFIndex.build(vectors, nlist=8)
+    path = str(tmp_path / "index.ivf.npz")
+    index.save(path)
+    loaded = IVFIndex.load(path)
+    assert np.array_equal(loaded.labels, index.labels)
+    assert np.array_equal(loaded.centroids, index.centroids)
+    assert loaded.trained_rows == 500
+
+def store_vectors(store, vectors, user_id="u1"):
+    store.upsert(vectors=[{"id": f"{user_id}-{i}", "values": v.tolist(), "metadata": {"user_id": user_id}} for i, v in enumerate(vectors)])
+
+def test_local_store_uses_ann_above_threshold():
+    vectors = clustered(2000)
+    store = LocalVectorStore(DIM, ann_min_rows=1000, nprobe=4)
+    store_vectors(store, vectors[:999])
+    store.query(vector=vectors[0].tolist(), top_k=5, filter={"user_id": "u1"})
+    assert store._partitions["u1"].ann is None
+    store_vectors(store, vectors)
+    results = store.query(vector=vectors[42].tolist(), top_k=5, filter={"user_id": "u1"})
+    partition = store._partitions["u1"]
+    assert partition.ann is not None and partition.ann.size == partition.size
+    assert results.matches[0].id == "u1-42"
+    # Full probe gives exactly the exact-search answer
+    exact = LocalVectorStore(DIM, ann_min_rows=0)
+    store_vectors(exact, vectors)
+    query = clustered(1, seed=7)[0].tolist()
+    full = store.query(vector=query, top_k=10, filter={"user_id": "u1"}, nprobe=partition.ann.nlist)
+    assert [m.id for m in full.matches] == [m.id for m in exact.query(vector=query, top_k=10, filter={"user_id": "u1"}).matches]
+    # Deletes keep the index aligned with the swap-removed matrix
+    store.delete(ids=[f"u1-{i}" for i in range(0, 2000, 3)])
+    assert partition.ann.size == partition.size
+    assert store.query(vector=vectors[43].tolist(), top_k=1, filter={"user_id": "u1"}).matches[0].id == "u1-43"
+
+def test_local_store_zero_vector_listing_stays_exact():
+    store = LocalVectorStore(DIM, ann_min_rows=100)
+    store_vectors(store, clustered(500))
+    assert len(store.query(vector=[0.0] * DIM, top_k=10000, filter={"user_id": "u1"}).matches) == 500
+
+def test_persistent_store_saves_and_extends_ann(tmp_path):
+    vectors = clustered(1500)
+    store = PersistentVectorStore(str(tmp_path), DIM, compaction_interval=0, ann_min_rows=1000)
+    store_vectors(store, vectors[:1200])
+    store.query(vector=vectors[0].tolist(), top_k=5, filter={"user_id": "u1"})
+    segment = store._partitions["u1"].active
+    assert os.path.exists(segment.ann_path)
+    store.close()
+
+    reopened = PersistentVectorStore(str(tmp_path), DIM, compaction_interval=0, ann_min_rows=1000)
+    reopened.upsert(vectors=[{"id": f"u1-{i}", "values": vectors[i].tolist(), "metadata": {"user_id": "u1"}} for i in range(1200, 1500)])
+    reopened.delete(ids=["u1-1300"])
+    assert reopened.query(vector=vectors[1400].tolist(), top_k=1, filter={"user_id": "u1"}).matches[0].id == "u1-1400"
+    segment = reopened._partitions["u1"].active
+    assert segment.ann.size == 1500 and segment.ann.trained_rows == 1200 # Loaded and extended, not retrained
+    assert "u1-1300" not in {m.id for m in reopened.query(vector=vectors[1300].tolist(), top_k=5, filter={"user_id": "u1"}).matches}
+
+def test_default_settings_keep_exact_recall(tmp_path):
+    # Approximate search is opt-in: a partition past the old 20,000-row threshold is still
+    # searched exactly, so recall@10 against brute force stays 1.0
+    vectors = clustered(25_000)
+    queries = clustered(20, seed=9)
+    truth = [set(np.argsort(-(vectors @ query))[:10].tolist()) for query in queries]
+    for store in (LocalVectorStore(DIM), PersistentVectorStore(str(tmp_path), DIM, compaction_interval=0)):
+        store_vectors(store, vectors)
+        found = [{int(m.id.split("-")[1]) for m in store.query(vector=query.tolist(), top_k=10, filter={"user_id": "u1"}).matches}
+                 for query in queries]
+        recall = np.mean([len(f & t) / 10 for f, t in zip(found, truth)])
+        assert recall == 1.0
+    assert store._partitions["u1"].active.ann is None
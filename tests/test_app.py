@@ -0,0 +1,46 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import runpy
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing the app's modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+APP_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+
+class Rerun(BaseException):
+    # Stands in for Streamlit's RerunException, which st.rerun() raises to end the run
+    pass
+
+def run_app():
+    # One script run of app.py, without connecting to Pinecone or starting the exporter
+    with patch('pinecone_utils.get_rag_index', return_value=MagicMock()), \
+         patch('pinecone_utils.start_rag_stats_reconciler'), \
+         patch('metrics.start_exporter'):
+        runpy.run_path(APP_PATH, run_name="__main__")
+
+def test_run_ended_by_rerun_still_flushes_metrics_and_stops_profile():
+    session_state = st.session_state
+    st.session_state = {"logged_in": False}
+    st.title.side_effect = Rerun() # The login page ends the run, as st.rerun() does
+    try:
+        with patch('metrics.flush_file') as flush_file, \
+             patch('profiler.PROFILE_ENABLED', True), \
+             patch('profiler.RunProfile') as run_profile:
+            run_profile.return_value.stop.return_value = {"total_ms": 1.0}
+            with pytest.raises(Rerun):
+                run_app()
+        flush_file.assert_called_once()
+        run_profile.return_value.stop.assert_called_once()
+        assert st.session_state["last_profile"] == {"total_ms": 1.0}
+    finally:
+        st.title.side_effect = None
+        st.session_state = session_state
@@ -0,0 +1,56 @@
+import pytest
+import sys
+import os
+
+# Add the parent directory to the sys.path to allow importing embedding_cache
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from embedding_cache import EmbeddingCache
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "embeddings.sqlite3")
+
+def test_cache_roundtrip_and_counters(cache_path):
+    cache = EmbeddingCache(cache_path, "model-a", 3)
+    assert cache.get("hello") is None
+    cache.put("hello", [0.5, 0.25, -1.0])
+    # Normalization: surrounding whitespace does not change the key
+    assert cache.get("  hello\n") == [0.5, 0.25, -1.0]
+    assert cache.get_many(["hello", "other"]) == [[0.5, 0.25, -1.0], None]
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["entries"] == 1
+
+def test_cache_rejects_wrong_dimension(cache_path):
+    cache = EmbeddingCache(cache_path, "model-a", 3)
+    cache.put("hello", [0.1, 0.2])
+    assert cache.get("hello") is None
+
+def test_cache_persists_and_invalidates_on_model_change(cache_path):
+    cache = EmbeddingCache(cache_path, "model-a", 3)
+    cache.put("hello", [1.0, 2.0, 3.0])
+    cache.close()
+
+    reopened = EmbeddingCache(cache_path, "model-a", 3)
+    assert reopened.get("hello") == [1.0, 2.0, 3.0]
+    reopened.close()
+
+    other_model = EmbeddingCache(cache_path, "model-b", 3)
+    assert other_model.get("hello") is None
+    assert other_model.stats()["entries"] == 0
+
+def test_cache_evicts_least_recently_used(cache_path, monkeypatch):
+    clock = iter(range(100, 1000))
+    monkeypatch.setattr("embedding_cache.time.time", lambda: next(clock))
+    cache = EmbeddingCache(cache_path, "model-a", 1, max_entries=10)
+    for i in range(10):
+        cache.put(f"text {i}", [float(i)])
+    cache.get("text 0") # Touch the oldest entry so it survives eviction
+    cache.put("text 10", [10.0])
+
+    assert cache.stats()["entries"] == 9
+    assert cache.get("text 0") == [0.0]
+    assert cache.get("text 1") is None
+    assert cache.get("text 10") == [10.0]
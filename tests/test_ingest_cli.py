@@ -0,0 +1,112 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import json
+import sys
+import os
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing ingest_cli
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ingest_cli
+from ingest_cli import Checkpoint, load_checkpoint, find_files, ingest_directory, document_id_for, split_file, iter_split_files, make_text_splitter
+from local_vector_store import LocalVectorStore
+
+class LineSplitter:
+    # Stand-in for the text splitter: one chunk per non-empty line
+    def split_text(self, text):
+        return [line for line in text.split("\n") if line.strip()]
+
+def empty_index():
+    # An index without stored chunks, recording upserts
+    index = MagicMock(spec=["upsert", "list_paginated"])
+    index.list_paginated.return_value = MagicMock(vectors=[], pagination=None)
+    return index
+
+def _split_in_process(paths, workers, chunk_size, chunk_overlap):
+    for path in paths:
+        yield split_file(path, chunk_size, chunk_overlap)
+
+@pytest.fixture
+def documents(tmp_path):
+    (tmp_path / "a.txt").write_text("first\nsecond\n")
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "nested" / "b.md").write_text("third\n")
+    (tmp_path / "empty.txt").write_text("")
+    (tmp_path / "skip.bin").write_bytes(b"\x00")
+    return tmp_path
+
+@pytest.fixture(autouse=True)
+def in_process_splitting():
+    with patch('ingest_cli.make_text_splitter', return_value=LineSplitter()), \
+         patch('ingest_cli.iter_split_files', side_effect=_split_in_process):
+        yield
+
+def test_find_files_matches_patterns_recursively(documents):
+    files = find_files(str(documents), ["*.txt", "*.md"])
+    assert [os.path.relpath(f, documents) for f in files] == ["a.txt", "empty.txt", os.path.join("nested", "b.md")]
+
+def test_ingest_directory_stores_chunks_and_checkpoints(documents, tmp_path):
+    index = empty_index()
+    checkpoint_path = str(tmp_path / "checkpoint.jsonl")
+    paths = find_files(str(documents), ["*.txt", "*.md"])
+    checkpoint = Checkpoint(checkpoint_path)
+    with patch('utils.get_ollama_embeddings', side_effect=lambda texts: [[1.0] for _ in texts]):
+        summary = ingest_directory(index, "7", paths, checkpoint, workers=1, chunk_size=100, chunk_overlap=0, concurrency=2, log=lambda msg: None)
+    checkpoint.close()
+
+    assert summary["stored"] == 3
+    assert summary["documents"] == 2
+    vectors = [v for call in index.upsert.call_args_list for v in call.kwargs["vectors"]]
+    a_id = document_id_for("7", paths[0])
+    assert {v["id"] for v in vectors} == {f"7-{a_id}-0", f"7-{a_id}-1", f"7-{document_id_for('7', paths[2])}-0"}
+    assert load_checkpoint(checkpoint_path) == set(paths) # Empty files count as done
+
+def test_failed_documents_are_not_checkpointed(documents, tmp_path):
+    index = empty_index()
+    checkpoint_path = str(tmp_path / "checkpoint.jsonl")
+    paths = find_files(str(documents), ["*.md"])
+    checkpoint = Checkpoint(checkpoint_path)
+    with patch('utils.get_ollama_embeddings', side_effect=lambda texts: [None for _ in texts]):
+        summary = ingest_directory(index, "7", paths, checkpoint, workers=1, chunk_size=100, chunk_overlap=0, concurrency=1, log=lambda msg: None)
+    checkpoint.close()
+    assert summary["failed_documents"] == 1
+    assert load_checkpoint(checkpoint_path) == set()
+
+def test_load_checkpoint_ignores_torn_lines(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    path.write_text(json.dumps({"path": "a.txt", "document_id": "x", "chunks": 1}) + "\n" + '{"path": "b.t')
+    assert load_checkpoint(str(path)) == {"a.txt"}
+
+def test_resume_deletes_chunks_past_the_new_chunk_count(tmp_path):
+    # An earlier, interrupted run stored three chunks of a file that now has two lines
+    path = tmp_path / "a.txt"
+    path.write_text("first\nsecond\n")
+    document_id = document_id_for("7", str(path))
+    index = LocalVectorStore(1)
+    index.upsert(vectors=[{"id": f"7-{document_id}-{i}", "values": [1.0], "metadata": {"user_id": "7", "original_text_id": document_id}}
+                          for i in range(3)])
+    index.upsert(vectors=[{"id": "7-other-0", "values": [1.0], "metadata": {"user_id": "7", "original_text_id": "other"}}])
+    with patch('utils.get_ollama_embeddings', side_effect=lambda texts: [[1.0] for _ in texts]):
+        summary = ingest_directory(index, "7", [str(path)], Checkpoint(""), workers=1, chunk_size=100, chunk_overlap=0, concurrency=1, log=lambda msg: None)
+    assert summary["documents"] == 1
+    assert sorted(v.id for v in index.list_paginated(prefix="7-", limit=100).vectors) == sorted([f"7-{document_id}-0", f"7-{document_id}-1", "7-other-0"])
+
+def test_iter_split_files_uses_a_real_process_pool(tmp_path):
+    paths = []
+    for n in range(5):
+        path = tmp_path / f"{n}.txt"
+        path.write_text(" ".join(f"word{n}-{i}" for i in range(200)))
+        paths.append(str(path))
+    # The real splitter, in this process and in the workers
+    with patch('ingest_cli.make_text_splitter', make_text_splitter):
+        expected = [split_file(path, 100, 10) for path in paths]
+        results = list(iter_split_files(paths, 2, 100, 10))
+    assert results == expected # Input order, whichever worker finished first
+    assert all(len(chunks) > 1 for _, chunks in results)
@@ -0,0 +1,143 @@
+import pytest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing ingest_pipeline
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ingest_pipeline import run_ingest_pipeline, plan_document_update, update_document, chunk_content_hash
+
+def build_vector(i, chunk, embedding):
+    return {"id": f"chunk-{i}", "values": embedding, "metadata": {"text": chunk}}
+
+def test_pipeline_stores_all_chunks_in_batches():
+    index = MagicMock(spec=["upsert"])
+    chunks = [f"text {i}" for i in range(10)]
+    embed_fn = lambda texts: [[float(len(t))] for t in texts]
+
+    summary = run_ingest_pipeline(index, chunks, build_vector, concurrency=3, embed_batch_size=2, upsert_batch_size=4, embed_fn=embed_fn)
+    assert summary == {"total_chunks": 10, "stored": 10, "failed": 0}
+    upserted = [v["id"] for call in index.upsert.call_args_list for v in call.kwargs["vectors"]]
+    assert sorted(upserted) == sorted(f"chunk-{i}" for i in range(10))
+    assert all(len(call.kwargs["vectors"]) <= 4 for call in index.upsert.call_args_list)
+
+def test_pipeline_reports_progress_in_order():
+    index = MagicMock(spec=["upsert"])
+    events = []
+
+    def embed_fn(texts):
+        # Later chunks finish first
+        time.sleep(0.02 if texts[0] == "a" else 0)
+        return [[1.0] for _ in texts]
+
+    run_ingest_pipeline(index, iter(["a", "b", "c", "d"]), build_vector, concurrency=4, embed_batch_size=1, upsert_batch_size=1,
+                        on_progress=lambda i, vector_id, error: events.append((i, vector_id, error)), embed_fn=embed_fn)
+    assert events == [(i, f"chunk-{i}", None) for i in range(4)]
+
+def test_pipeline_reports_embedding_and_upsert_failures():
+    index = MagicMock(spec=["upsert"])
+    index.upsert.side_effect = lambda vectors: (_ for _ in ()).throw(Exception("boom")) if vectors[0]["id"] == "chunk-2" else None
+    events = []
+    embed_fn = lambda texts: [None if t == "bad" else [1.0] for t in texts]
+
+    summary = run_ingest_pipeline(index, ["ok", "bad", "ok"], build_vector, embed_batch_size=1, upsert_batch_size=1,
+                                  on_progress=lambda i, vector_id, error: events.append((i, error)), embed_fn=embed_fn)
+    assert summary == {"total_chunks": 3, "stored": 1, "failed": 2}
+    assert events[0] == (0, None)
+    assert events[1] == (1, "Could not get embedding from Ollama.")
+    assert "boom" in events[2][1]
+
+def test_pipeline_reraises_when_build_vector_raises():
+    index = MagicMock(spec=["upsert"])
+    events = []
+
+    def failing_build_vector(i, chunk, embedding):
+        if i == 3:
+            raise ValueError("bad metadata")
+        return build_vector(i, chunk, embedding)
+
+    result = []
+    worker = threading.Thread(target=lambda: result.append(_run_catching(
+        index, [str(i) for i in range(50)], failing_build_vector, events)), daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+    assert not worker.is_alive(), "run_ingest_pipeline hung after build_vector raised"
+    assert isinstance(result[0], ValueError)
+    # Every chunk that was read is reported exactly once, in order; chunks from 3 on failed
+    assert [i for i, _ in events] == list(range(len(events)))
+    assert all(error is None for i, error in events[:3])
+    assert all("bad metadata" in error for i, error in events[3:])
+
+def _run_catching(index, chunks, build_vector_fn, events):
+    try:
+        run_ingest_pipeline(index, chunks, build_vector_fn, concurrency=2, embed_batch_size=1, upsert_batch_size=1,
+                            on_progress=lambda i, vector_id, error: events.append((i, error)),
+                            embed_fn=lambda texts: [[1.0] for _ in texts])
+    except Exception as e:
+        return e
+
+def test_pipeline_bounds_embedding_concurrency():
+    index = MagicMock(spec=["upsert"])
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def embed_fn(texts):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.01)
+        with lock:
+            active.pop()
+        return [[1.0] for _ in texts]
+
+    run_ingest_pipeline(index, [str(i) for i in range(20)], build_vector, concurrency=2, embed_batch_size=1, embed_fn=embed_fn)
+    assert max(peak) <= 2
+
+# Test incremental document updates
+def test_plan_document_update_diffs_by_content():
+    existing = {"u-doc-0": chunk_content_hash("kept"), "u-doc-1": chunk_content_hash("removed"), "u-doc-2": chunk_content_hash("dup")}
+    to_insert, to_delete, unchanged = plan_document_update(existing, ["kept", "dup", "dup", "new"])
+    assert to_insert == ["dup", "new"] # Only one stored copy of "dup" can be reused
+    assert to_delete == ["u-doc-1"]
+    assert unchanged == 2
+
+@patch('ingest_pipeline.delete_embeddings', return_value=True)
+@patch('ingest_pipeline.get_document_chunk_hashes')
+def test_update_document_embeds_only_changed_chunks(mock_hashes, mock_delete):
+    mock_hashes.return_value = {"u-doc-0": chunk_content_hash("kept"), "u-doc-1": chunk_content_hash("old")}
+    index = MagicMock(spec=["upsert"])
+    embedded = []
+    def embed_fn(texts):
+        embedded.extend(texts)
+        return [[1.0] for _ in texts]
+
+    with patch('ingest_pipeline.get_ollama_embeddings', side_effect=embed_fn):
+        result = update_document(index, "u", "doc", ["kept", "changed"], "2024-01-01T00:00:00")
+
+    assert embedded == ["changed"]
+    assert result == {"unchanged": 1, "inserted": 1, "failed": 0, "deleted": 1, "stale": 0}
+    mock_delete.assert_called_once_with(index, ["u-doc-1"], "u")
+    vector = index.upsert.call_args.kwargs["vectors"][0]
+    assert vector["id"].startswith("u-doc-") and vector["id"] not in ("u-doc-0", "u-doc-1")
+    assert vector["metadata"]["content_hash"] == chunk_content_hash("changed")
+
+@patch('ingest_pipeline.delete_embeddings')
+@patch('ingest_pipeline.get_document_chunk_hashes', return_value={"u-doc-0": "stale-hash"})
+def test_update_document_keeps_old_chunks_when_insert_fails(mock_hashes, mock_delete):
+    index = MagicMock(spec=["upsert"])
+    with patch('ingest_pipeline.get_ollama_embeddings', side_effect=lambda texts: [None for _ in texts]):
+        result = update_document(index, "u", "doc", ["changed"], "2024-01-01T00:00:00")
+    assert result["failed"] == 1
+    assert result["stale"] == 1
+    mock_delete.assert_not_called()
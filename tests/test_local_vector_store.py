@@ -0,0 +1,289 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing local_vector_store
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pinecone_utils
+from local_vector_store import LocalVectorStore
+from rag_stats import RagStats
+from pinecone_utils import (
+    matches_filter, get_user_embeddings, get_user_rag_stats, delete_embeddings, bulk_upsert,
+    get_document_chunk_hashes, get_rag_index, reset_connections,
+)
+
+DIM = pinecone_utils.DIMENSION # The helpers query with DIMENSION-sized dummy vectors
+
+def make_vector(vector_id, values, **metadata):
+    return {"id": vector_id, "values": list(values), "metadata": metadata}
+
+@pytest.fixture
+def store():
+    return LocalVectorStore(DIM)
+
+@pytest.fixture
+def populated(store):
+    rng = np.random.default_rng(0)
+    vectors = []
+    for i in range(300):
+        user_id = f"user{i % 3}"
+        vectors.append(make_vector(f"{user_id}-doc{i % 7}-{i}", rng.normal(size=DIM),
+                                   user_id=user_id, original_text_id=f"doc{i % 7}", rank=i))
+    store.upsert(vectors=vectors)
+    return store, vectors
+
+def brute_force(vectors, query, top_k, query_filter):
+    query = np.asarray(query) / np.linalg.norm(query)
+    scored = []
+    for vector in vectors:
+        if matches_filter(vector["metadata"], query_filter):
+            values = np.asarray(vector["values"])
+            scored.append((float(values @ query / np.linalg.norm(values)), vector["id"]))
+    scored.sort(reverse=True)
+    return [vector_id for _, vector_id in scored[:top_k]]
+
+def test_query_matches_brute_force(populated):
+    store, vectors = populated
+    query = np.random.default_rng(1).normal(size=DIM)
+    for query_filter in [{"user_id": "user1"}, {"user_id": "user2", "rank": {"$gte": 150}}, {"original_text_id": {"$in": ["doc1", "doc2"]}}, None]:
+        results = store.query(vector=query.tolist(), top_k=10, include_metadata=True, filter=query_filter)
+        assert [match.id for match in results.matches] == brute_force(vectors, query, 10, query_filter)
+        scores = [match.score for match in results.matches]
+        assert scores == sorted(scores, reverse=True)
+
+def test_query_include_flags(populated):
+    store, vectors = populated
+    results = store.query(vector=vectors[0]["values"], top_k=1, include_metadata=True, include_values=True, filter={"user_id": "user0"})
+    match = results.matches[0]
+    assert match.id == vectors[0]["id"]
+    assert match.score == pytest.approx(1.0, abs=1e-5)
+    assert match.values == pytest.approx(vectors[0]["values"], abs=1e-5)
+    assert match.metadata["rank"] == 0
+    assert store.query(vector=vectors[0]["values"], top_k=1).matches[0].metadata == {}
+
+def test_query_with_zero_vector_lists_user_rows(populated):
+    store, _ = populated
+    results = store.query(vector=[0.0] * DIM, top_k=10000, include_metadata=True, filter={"user_id": "user1"})
+    assert len(results.matches) == 100
+    assert all(match.metadata["user_id"] == "user1" for match in results.matches)
+
+def test_upsert_overwrites_and_moves_between_users(store):
+    store.upsert(vectors=[make_vector("a", [1.0] + [0.0] * (DIM - 1), user_id="u1", text="old")])
+    store.upsert(vectors=[make_vector("a", [0.0, 1.0] + [0.0] * (DIM - 2), user_id="u1", text="new")])
+    fetched = store.fetch(ids=["a"]).vectors["a"]
+    assert fetched.metadata["text"] == "new"
+    assert fetched.values[1] == pytest.approx(1.0)
+
+    store.upsert(vectors=[make_vector("a", [1.0] * DIM, user_id="u2")])
+    assert store.query(vector=[1.0] * DIM, top_k=5, filter={"user_id": "u1"}).matches == []
+    assert [m.id for m in store.query(vector=[1.0] * DIM, top_k=5, filter={"user_id": "u2"}).matches] == ["a"]
+    assert store.describe_index_stats().total_vector_count == 1
+
+def test_upsert_rejects_wrong_dimension(store):
+    with pytest.raises(ValueError):
+        store.upsert(vectors=[make_vector("a", [1.0, 2.0], user_id="u1")])
+
+def test_delete_keeps_remaining_rows_addressable(populated):
+    store, vectors = populated
+    removed = [vector["id"] for vector in vectors[:150:2]]
+    store.delete(ids=removed)
+    assert store.describe_index_stats().total_vector_count == 300 - len(removed)
+    assert store.fetch(ids=removed).vectors == {}
+    remaining = [vector for vector in vectors if vector["id"] not in set(removed)]
+    for vector in remaining[::17]:
+        fetched = store.fetch(ids=[vector["id"]]).vectors[vector["id"]]
+        assert fetched.values == pytest.approx(vector["values"], abs=1e-5)
+        assert fetched.metadata == vector["metadata"]
+    query = np.random.default_rng(2).normal(size=DIM)
+    results = store.query(vector=query.tolist(), top_k=10, filter={"user_id": "user0"})
+    assert [m.id for m in results.matches] == brute_force(remaining, query, 10, {"user_id": "user0"})
+
+def test_delete_by_filter(populated):
+    store, _ = populated
+    store.delete(filter={"user_id": "user2", "original_text_id": "doc3"})
+    results = store.query(vector=[0.0] * DIM, top_k=1000, include_metadata=True, filter={"user_id": "user2"})
+    assert results.matches
+    assert all(match.metadata["original_text_id"] != "doc3" for match in results.matches)
+
+def test_list_paginated(populated):
+    store, vectors = populated
+    expected = sorted(vector["id"] for vector in vectors if vector["id"].startswith("user1-"))
+    listed = []
+    token = None
+    while True:
+        page = store.list_paginated(prefix="user1-", limit=30, pagination_token=token)
+        listed.extend(record.id for record in page.vectors)
+        if page.pagination is None:
+            break
+        token = page.pagination.next
+    assert listed == expected
+
+def test_list_paginated_sees_writes_and_spans_partitions(populated):
+    store, vectors = populated
+    first = store.list_paginated(prefix="user1-doc1-", limit=1000)
+    store.upsert(vectors=[make_vector("user1-doc1-new", np.ones(DIM), user_id="user1")])
+    store.delete(ids=[first.vectors[0].id])
+    second = [record.id for record in store.list_paginated(prefix="user1-doc1-", limit=1000).vectors]
+    assert "user1-doc1-new" in second and first.vectors[0].id not in second
+    assert len(second) == len(first.vectors)
+    all_ids = [record.id for record in store.list_paginated(limit=1000).vectors]
+    assert all_ids == sorted(all_ids) and len(all_ids) == len(vectors)
+
+def test_matches_filter_operators():
+    metadata = {"user_id": "u1", "rank": 5, "tags": ["a", "b"]}
+    assert matches_filter(metadata, {"user_id": "u1", "rank": {"$gt": 4, "$lte": 5}})
+    assert not matches_filter(metadata, {"rank": {"$lt": 5}})
+    assert matches_filter(metadata, {"tags": "a"})
+    assert matches_filter(metadata, {"tags": {"$nin": ["c"]}})
+    assert matches_filter(metadata, {"missing": {"$exists": False}, "rank": {"$ne": 4}})
+    assert matches_filter(metadata, {"$or": [{"user_id": "u2"}, {"rank": {"$in": [5, 6]}}]})
+    assert not matches_filter(metadata, {"$and": [{"user_id": "u1"}, {"rank": {"$gte": 6}}]})
+    assert not matches_filter(metadata, {"user_id": {"$gt": 1}})
+    with pytest.raises(ValueError):
+        matches_filter(metadata, {"rank": {"$regex": "5"}})
+
+def test_pinecone_utils_helpers_run_against_local_store(store):
+    vectors = [make_vector(f"u1-doc-{i}", np.eye(DIM)[i], text=f"chunk {i}", user_id="u1", original_text_id="doc", content_hash=f"h{i}")
+               for i in range(4)]
+    vectors.append(make_vector("u2-other-0", np.ones(DIM), text="other", user_id="u2", original_text_id="other"))
+    with patch.object(pinecone_utils, "rag_stats", RagStats(":memory:")):
+        result = bulk_upsert(store, vectors, batch_size=2)
+        assert result == {"upserted_count": 5, "failed_batches": []}
+
+        assert len(get_user_embeddings(store, "u1")) == 4
+        assert get_user_rag_stats(store, "u1") == {"total_documents": 1, "total_chunks": 4}
+        assert get_document_chunk_hashes(store, "u1", "doc") == {f"u1-doc-{i}": f"h{i}" for i in range(4)}
+        assert delete_embeddings(store, ["u1-doc-0", "u1-doc-1"], "u1")
+        assert get_user_rag_stats(store, "u1") == {"total_documents": 1, "total_chunks": 2}
+        assert get_user_rag_stats(store, "u2") == {"total_documents": 1, "total_chunks": 1}
+
+def test_local_backend_selected_by_env():
+    reset_connections()
+    try:
+        with patch.object(pinecone_utils, "VECTOR_STORE_BACKEND", "local"), \
+             patch('pinecone_utils.PineconeGRPC') as mock_pinecone_grpc:
+            index = get_rag_index()
+            assert isinstance(index, LocalVectorStore)
+            assert get_rag_index() is index
+            mock_pinecone_grpc.assert_not_called()
+    finally:
+        reset_connections()
+
+# Test the persistent segment format
+import local_vector_store
+from local_vector_store import PersistentVectorStore
+
+def open_store(path, **kwargs):
+    kwargs.setdefault("compaction_interval", 0)
+    return PersistentVectorStore(str(path), DIM, **kwargs)
+
+def live_ids(store, user_id):
+    return {m.id for m in store.query(vector=[0.0] * DIM, top_k=100000, filter={"user_id": user_id}).matches}
+
+def test_persistent_store_reopens_with_same_results(tmp_path):
+    rng = np.random.default_rng(3)
+    vectors = [make_vector(f"user{i % 2}-d-{i}", rng.normal(size=DIM), user_id=f"user{i % 2}", rank=i) for i in range(120)]
+    store = open_store(tmp_path, segment_rows=25)
+    for start in range(0, len(vectors), 40):
+        store.upsert(vectors=vectors[start:start + 40])
+    store.delete(ids=[v["id"] for v in vectors[:30]])
+    store.upsert(vectors=[make_vector("user0-d-2", np.ones(DIM), user_id="user0", rank=-1)]) # Re-insert after delete
+    query = rng.normal(size=DIM).tolist()
+    before = [(m.id, round(m.score, 5)) for m in store.query(vector=query, top_k=10, filter={"user_id": "user1"}).matches]
+    expected_user0 = live_ids(store, "user0")
+    store.close()
+
+    reopened = open_store(tmp_path, segment_rows=25)
+    assert reopened._partitions == {} # Opening reads only the manifest
+    after = [(m.id, round(m.score, 5)) for m in reopened.query(vector=query, top_k=10, filter={"user_id": "user1"}).matches]
+    assert after == before
+    assert list(reopened._partitions) == ["user1"] # Only the queried partition was loaded
+    assert live_ids(reopened, "user0") == expected_user0
+    assert "user0-d-2" in expected_user0 and "user0-d-4" not in expected_user0
+    fetched = reopened.fetch(ids=["user0-d-2"]).vectors["user0-d-2"]
+    assert fetched.values == pytest.approx([1.0] * DIM, abs=1e-5)
+    assert fetched.metadata["rank"] == -1
+    assert reopened.describe_index_stats().total_vector_count == 91
+    assert isinstance(reopened._partitions["user1"].segments[0].vectors, np.memmap)
+
+def test_persistent_store_lists_only_the_prefixed_partition(tmp_path):
+    store = open_store(tmp_path)
+    store.upsert(vectors=[make_vector(f"user{i % 3}-d-{i:03d}", np.eye(DIM)[i % DIM], user_id=f"user{i % 3}") for i in range(90)])
+    store.close()
+    reopened = open_store(tmp_path)
+    listed = []
+    token = None
+    while True:
+        page = reopened.list_paginated(prefix="user2-", limit=7, pagination_token=token)
+        listed.extend(record.id for record in page.vectors)
+        if page.pagination is None:
+            break
+        token = page.pagination.next
+    assert listed == [f"user2-d-{i:03d}" for i in range(2, 90, 3)]
+    assert list(reopened._partitions) == ["user2"] # Other users' partitions stay on disk
+    assert len(reopened.list_paginated(limit=1000).vectors) == 90
+
+def test_persistent_store_compaction_folds_deletes(tmp_path):
+    store = open_store(tmp_path, segment_rows=10)
+    store.upsert(vectors=[make_vector(f"u1-{i:03d}", np.eye(DIM)[i], user_id="u1") for i in range(40)])
+    store.delete(ids=[f"u1-{i:03d}" for i in range(0, 40, 2)])
+    partition = store._partitions["u1"]
+    assert len(partition.segments) == 4 and partition.dead_count == 20
+    assert store.compact() == 1
+    assert len(partition.segments) == 1 and partition.dead_count == 0
+    files = sorted(os.listdir(tmp_path))
+    assert files == ["manifest.json", f"seg-{partition.active.number:08d}.f32", f"seg-{partition.active.number:08d}.jsonl"]
+    expected = {f"u1-{i:03d}" for i in range(1, 40, 2)}
+    assert live_ids(store, "u1") == expected
+    store.close()
+    assert live_ids(open_store(tmp_path), "u1") == expected
+
+def test_persistent_store_compaction_aborts_on_concurrent_write(tmp_path):
+    store = open_store(tmp_path)
+    store.upsert(vectors=[make_vector(f"u1-{i}", np.eye(DIM)[i], user_id="u1") for i in range(4)])
+    store.delete(ids=["u1-0"])
+    partition = store._partitions["u1"]
+    original_append = local_vector_store._Segment.append
+
+    def append_during_write(segment, *args):
+        # The new segment is written outside the store lock; a write lands meanwhile
+        if segment is not partition.active:
+            store.upsert(vectors=[make_vector("u1-9", np.eye(DIM)[9], user_id="u1")])
+        return original_append(segment, *args)
+
+    with patch.object(local_vector_store._Segment, "append", append_during_write):
+        assert store._compact_partition(partition) is False
+    assert live_ids(store, "u1") == {"u1-1", "u1-2", "u1-3", "u1-9"}
+    assert len(os.listdir(tmp_path)) == 3 # The abandoned segment's files were removed
+
+def test_persistent_store_recovers_from_torn_write(tmp_path):
+    store = open_store(tmp_path)
+    store.upsert(vectors=[make_vector(f"u1-{i}", np.eye(DIM)[i], user_id="u1") for i in range(3)])
+    segment = store._partitions["u1"].active
+    store.close()
+    # A crash after the vector bytes were written but mid-way through the sidecar line
+    with open(segment.vector_path, "ab") as f:
+        f.write(np.ones(DIM, dtype=np.float32).tobytes())
+    with open(segment.sidecar_path, "a") as f:
+        f.write('{"id":"u1-3","no')
+    reopened = open_store(tmp_path)
+    assert live_ids(reopened, "u1") == {"u1-0", "u1-1", "u1-2"}
+    reopened.upsert(vectors=[make_vector("u1-4", np.eye(DIM)[4], user_id="u1")])
+    assert reopened.fetch(ids=["u1-4"]).vectors["u1-4"].values == pytest.approx(list(np.eye(DIM)[4]), abs=1e-6)
+    reopened.close()
+    assert live_ids(open_store(tmp_path), "u1") == {"u1-0", "u1-1", "u1-2", "u1-4"}
+
+def test_persistent_store_rejects_other_dimension(tmp_path):
+    open_store(tmp_path).upsert(vectors=[make_vector("u1-0", np.eye(DIM)[0], user_id="u1")])
+    with pytest.raises(ValueError):
+        PersistentVectorStore(str(tmp_path), DIM + 1, compaction_interval=0)
@@ -0,0 +1,122 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing metrics
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import metrics as metrics_module
+from metrics import MetricsRegistry, Histogram, metrics
+from retrieval import retrieve_similar
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    with registry.timed("stage"):
+        pass
+    registry.count("event")
+    assert list(registry.timed_iter("stage", [1, 2])) == [1, 2]
+    assert registry.instrument("stage")(lambda x: x * 2)(3) == 6
+    assert registry.snapshot() == {}
+    assert registry.counters() == {}
+
+def test_timed_records_latency_and_errors():
+    registry = MetricsRegistry(enabled=True)
+    with registry.timed("stage"):
+        pass
+    with pytest.raises(ValueError):
+        with registry.timed("stage"):
+            raise ValueError("boom")
+    stats = registry.snapshot()["stage"]
+    assert stats["count"] == 2
+    assert stats["errors"] == 1
+
+def test_instrument_decorator():
+    registry = MetricsRegistry(enabled=True)
+
+    @registry.instrument("double")
+    def double(x):
+        return x * 2
+
+    assert double(4) == 8
+    assert double.__name__ == "double"
+    assert registry.snapshot()["double"]["count"] == 1
+
+def test_timed_iter_records_once_when_exhausted():
+    registry = MetricsRegistry(enabled=True)
+    assert list(registry.timed_iter("chunking", iter(["a", "b", "c"]))) == ["a", "b", "c"]
+    assert registry.snapshot()["chunking"]["count"] == 1
+
+def test_histogram_buckets_and_quantile():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.quantile(0.5) == pytest.approx(0.1)
+    assert histogram.quantile(1.0) == 1.0
+
+def test_export_prometheus_format():
+    registry = MetricsRegistry(enabled=True)
+    registry.observe("index_query", 0.003)
+    registry.count("vectors_deleted", 4)
+    text = registry.export_prometheus()
+    assert "# TYPE rag_stage_seconds histogram" in text
+    assert 'rag_stage_seconds_bucket{stage="index_query",le="0.0025"} 0' in text
+    assert 'rag_stage_seconds_bucket{stage="index_query",le="0.005"} 1' in text
+    assert 'rag_stage_seconds_bucket{stage="index_query",le="+Inf"} 1' in text
+    assert 'rag_stage_seconds_count{stage="index_query"} 1' in text
+    assert 'rag_events_total{event="vectors_deleted"} 4' in text
+
+def test_write_file(tmp_path):
+    registry = MetricsRegistry(enabled=True)
+    registry.observe("upsert", 0.2)
+    path = tmp_path / "rag.prom"
+    registry.write_file(str(path))
+    assert 'rag_stage_seconds_count{stage="upsert"} 1' in path.read_text()
+    assert not (tmp_path / "rag.prom.tmp").exists()
+
+def test_retrieve_similar_is_instrumented():
+    mock_index = MagicMock()
+    mock_index.query.return_value.matches = []
+    with patch.object(metrics, "enabled", True), \
+         patch('retrieval.get_ollama_embedding', return_value=[0.1] * 768), \
+         patch('retrieval.query_cache.get', return_value=None):
+        metrics.reset()
+        retrieve_similar(mock_index, "user1", "a query", top_k=3)
+        assert metrics.snapshot()["index_query"]["count"] == 1
+    metrics.reset()
+
+def test_flush_file_is_noop_when_disabled(tmp_path):
+    path = tmp_path / "rag.prom"
+    with patch.object(metrics, "enabled", False):
+        metrics_module.flush_file(str(path))
+    assert not path.exists()
+
+def test_exporter_serves_health_check():
+    import json
+    import threading
+    import urllib.error
+    import urllib.request
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer(("127.0.0.1", 0), metrics_module._MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/healthz"
+    try:
+        with patch.object(metrics_module, "_health_check", lambda: {"ok": True, "indexes": {}}):
+            with urllib.request.urlopen(url) as response:
+                assert response.status == 200
+                assert json.loads(response.read()) == {"ok": True, "indexes": {}}
+        with patch.object(metrics_module, "_health_check", lambda: {"ok": False, "indexes": {}}):
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(url)
+            assert error.value.code == 503
+    finally:
+        server.shutdown()
+        server.server_close()
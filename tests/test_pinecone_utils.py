@@ -8,16 +8,18 @@ from dotenv import load_dotenv
 load_dotenv(dotenv_path='tests/.env.test', override=True)
 
 # Mock the Streamlit st object
-st = MagicMock()
-sys.modules['streamlit'] = st
+st = sys.modules.setdefault('streamlit', MagicMock())
 
 # Add the parent directory to the sys.path to allow importing pinecone_utils
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from pinecone_utils import (
     initialize_pinecone_rag_index, initialize_pinecone_user_index,
-    add_user_to_pinecone_index, get_user_from_pinecone_index,
+    add_user_to_pinecone_index, get_user_from_pinecone_index, user_record_id,
     get_all_users_from_pinecone_index, get_user_embeddings, delete_embeddings,
+    list_user_embedding_ids, fetch_embeddings,
+    batch_vectors, bulk_upsert, get_document_chunk_hashes,
+    get_rag_index, get_user_index, pinecone_health_check, reset_connections,
     DIMENSION, RAG_INDEX_NAME, USER_INDEX_NAME
 )
 
@@ -75,10 +77,20 @@ def test_initialize_pinecone_user_index_exists(mock_pinecone_grpc, mock_pinecone
 
 # Test add_user_to_pinecone_index
 def test_add_user_to_pinecone_index_success(mock_pinecone_index):
+    mock_pinecone_index.fetch.return_value.vectors = {}
     mock_pinecone_index.upsert.return_value = None # upsert doesn't return anything specific
     result = add_user_to_pinecone_index(mock_pinecone_index, "testuser", "hashed_pw", "1")
     assert result is True
     mock_pinecone_index.upsert.assert_called_once()
+    assert mock_pinecone_index.upsert.call_args.kwargs["vectors"][0]["id"] == user_record_id("testuser")
+    st.error.assert_not_called()
+
+def test_add_user_to_pinecone_index_refuses_taken_username(mock_pinecone_index):
+    # Registered by another session since the caller's existence check
+    mock_pinecone_index.fetch.return_value.vectors = {user_record_id("testuser"): MagicMock()}
+    result = add_user_to_pinecone_index(mock_pinecone_index, "testuser", "hashed_pw", "2")
+    assert result is False
+    mock_pinecone_index.upsert.assert_not_called()
     st.error.assert_not_called()
 
 def test_add_user_to_pinecone_index_error(mock_pinecone_index):
@@ -89,24 +101,35 @@ def test_add_user_to_pinecone_index_error(mock_pinecone_index):
 
 # Test get_user_from_pinecone_index
 def test_get_user_from_pinecone_index_found(mock_pinecone_index):
-    mock_query_response = MagicMock()
-    mock_match = MagicMock()
-    mock_match.metadata = {"username": "testuser", "password": "hashed_pw", "user_id": "1"}
-    mock_query_response.matches = [mock_match]
-    mock_pinecone_index.query.return_value = mock_query_response
+    record = MagicMock()
+    record.metadata = {"username": "testuser", "password": "hashed_pw", "user_id": "1"}
+    mock_pinecone_index.fetch.return_value.vectors = {user_record_id("testuser"): record}
 
     user_data = get_user_from_pinecone_index(mock_pinecone_index, "testuser")
     assert user_data == {"username": "testuser", "password": "hashed_pw", "user_id": "1"}
-    mock_pinecone_index.query.assert_called_once()
+    mock_pinecone_index.fetch.assert_called_once_with(ids=[user_record_id("testuser")])
+    mock_pinecone_index.query.assert_not_called()
 
 def test_get_user_from_pinecone_index_not_found(mock_pinecone_index):
-    mock_query_response = MagicMock()
-    mock_query_response.matches = []
-    mock_pinecone_index.query.return_value = mock_query_response
+    mock_pinecone_index.fetch.return_value.vectors = {}
+    mock_pinecone_index.query.return_value.matches = []
 
     user_data = get_user_from_pinecone_index(mock_pinecone_index, "nonexistent")
     assert user_data is None
-    mock_pinecone_index.query.assert_called_once()
+    with patch('pinecone_utils.USER_INDEX_LEGACY_LOOKUP', False):
+        assert get_user_from_pinecone_index(mock_pinecone_index, "nonexistent") is None
+    mock_pinecone_index.query.assert_called_once() # Only the legacy lookup queries
+
+def test_get_user_from_pinecone_index_rekeys_legacy_record(mock_pinecone_index):
+    legacy = MagicMock()
+    legacy.id = "7"
+    legacy.metadata = {"username": "olduser", "password": "hashed_pw", "user_id": "7"}
+    mock_pinecone_index.fetch.return_value.vectors = {}
+    mock_pinecone_index.query.return_value.matches = [legacy]
+
+    assert get_user_from_pinecone_index(mock_pinecone_index, "olduser") == legacy.metadata
+    assert mock_pinecone_index.upsert.call_args.kwargs["vectors"][0]["id"] == user_record_id("olduser")
+    mock_pinecone_index.delete.assert_called_once_with(ids=["7"])
 
 # Test get_all_users_from_pinecone_index
 def test_get_all_users_from_pinecone_index_success(mock_pinecone_index):
@@ -122,23 +145,43 @@ def test_get_all_users_from_pinecone_index_success(mock_pinecone_index):
     assert users == [{"username": "user1", "user_id": "1"}, {"username": "user2", "user_id": "2"}]
     mock_pinecone_index.query.assert_called_once()
 
-# Test get_user_embeddings
+# Test the paginated listing
+def _list_page(ids, next_token=None):
+    page = MagicMock()
+    page.vectors = [MagicMock(id=vector_id) for vector_id in ids]
+    page.pagination = MagicMock(next=next_token) if next_token else None
+    return page
+
+def _fetch_response(ids):
+    response = MagicMock()
+    response.vectors = {vector_id: MagicMock(id=vector_id, metadata={"user_id": "1", "text": vector_id}) for vector_id in ids}
+    return response
+
+def test_list_user_embedding_ids_pages_by_prefix(mock_pinecone_index):
+    mock_pinecone_index.list_paginated.return_value = _list_page(["1-a-0", "1-a-1"], "tok")
+    assert list_user_embedding_ids(mock_pinecone_index, "1", limit=2) == (["1-a-0", "1-a-1"], "tok")
+    mock_pinecone_index.list_paginated.assert_called_once_with(prefix="1-", limit=2, pagination_token=None)
+
+    mock_pinecone_index.list_paginated.side_effect = Exception("List error")
+    assert list_user_embedding_ids(mock_pinecone_index, "1") is None
+    st.error.assert_called_once_with("Error listing user embeddings from Pinecone: List error")
+
+def test_fetch_embeddings_batches_and_keeps_order(mock_pinecone_index):
+    mock_pinecone_index.fetch.side_effect = lambda ids: _fetch_response([i for i in ids if i != "gone"])
+    records = fetch_embeddings(mock_pinecone_index, ["c", "gone", "a", "b"], batch_size=2)
+    assert [record.id for record in records] == ["c", "a", "b"]
+    assert mock_pinecone_index.fetch.call_count == 2
+
 def test_get_user_embeddings_success(mock_pinecone_index):
-    mock_query_response = MagicMock()
-    mock_match1 = MagicMock()
-    mock_match1.id = "id1"
-    mock_match1.metadata = {"user_id": "1", "text": "text1"}
-    mock_match2 = MagicMock()
-    mock_match2.id = "id2"
-    mock_match2.metadata = {"user_id": "1", "text": "text2"}
-    mock_query_response.matches = [mock_match1, mock_match2]
-    mock_pinecone_index.query.return_value = mock_query_response
+    mock_pinecone_index.list_paginated.side_effect = [_list_page(["id1"], "tok"), _list_page(["id2"])]
+    mock_pinecone_index.fetch.side_effect = lambda ids: _fetch_response(ids)
 
     embeddings = get_user_embeddings(mock_pinecone_index, "1")
     assert len(embeddings) == 2
     assert embeddings[0].id == "id1"
     assert embeddings[1].id == "id2"
-    mock_pinecone_index.query.assert_called_once()
+    assert mock_pinecone_index.list_paginated.call_args.kwargs["pagination_token"] == "tok"
+    mock_pinecone_index.query.assert_not_called()
 
 # Test delete_embeddings
 def test_delete_embeddings_success(mock_pinecone_index):
@@ -153,3 +196,133 @@ def test_delete_embeddings_error(mock_pinecone_index):
     result = delete_embeddings(mock_pinecone_index, ["id1"], "1")
     assert result is False
     st.error.assert_called_once_with("Error deleting embeddings from Pinecone: Delete error")
+
+# Test batch_vectors and bulk_upsert
+def _vector(i, dimension=4, text=""):
+    return {"id": f"id{i}", "values": [0.1] * dimension, "metadata": {"text": text}}
+
+def test_batch_vectors_respects_count_and_size():
+    vectors = [_vector(i) for i in range(5)]
+    assert [len(b) for b in batch_vectors(vectors, batch_size=2, max_request_bytes=10_000)] == [2, 2, 1]
+
+    big = [_vector(i, text="x" * 400) for i in range(5)]
+    batches = batch_vectors(big, batch_size=100, max_request_bytes=1000)
+    assert [len(b) for b in batches] == [2, 2, 1]
+
+def test_bulk_upsert_uses_async_futures(mock_pinecone_index):
+    future = MagicMock()
+    mock_pinecone_index.upsert_async.return_value = future
+    result = bulk_upsert(mock_pinecone_index, [_vector(i) for i in range(5)], batch_size=2)
+    assert result == {"upserted_count": 5, "failed_batches": []}
+    assert mock_pinecone_index.upsert_async.call_count == 3
+    assert future.result.call_count == 3
+
+def test_bulk_upsert_retries_and_collects_failures(mock_pinecone_index):
+    def upsert_async(vectors):
+        future = MagicMock()
+        if vectors[0]["id"] == "id2":
+            future.result.side_effect = Exception("too large")
+        return future
+    mock_pinecone_index.upsert_async.side_effect = upsert_async
+
+    result = bulk_upsert(mock_pinecone_index, [_vector(i) for i in range(4)], batch_size=2, max_retries=1)
+    assert result["upserted_count"] == 2
+    assert result["failed_batches"] == [([_vector(2), _vector(3)], "too large")]
+    assert mock_pinecone_index.upsert_async.call_count == 3 # Two batches plus one retry
+
+def test_bulk_upsert_without_async_support():
+    index = MagicMock(spec=["upsert"])
+    result = bulk_upsert(index, [_vector(i) for i in range(3)], batch_size=1, max_concurrency=2)
+    assert result["upserted_count"] == 3
+    assert index.upsert.call_count == 3
+
+# Test get_document_chunk_hashes
+def test_get_document_chunk_hashes(mock_pinecone_index):
+    import hashlib
+    def record(metadata):
+        vector = MagicMock()
+        vector.metadata = metadata
+        return vector
+    records = {
+        "1-doc-a": record({"text": "new", "content_hash": "abc", "user_id": "1", "original_text_id": "doc"}),
+        "1-doc-0": record({"text": "legacy", "user_id": "1", "original_text_id": "doc"}),
+    }
+    first_page = MagicMock(vectors=[MagicMock(id="1-doc-0")])
+    first_page.pagination.next = "token"
+    last_page = MagicMock(vectors=[MagicMock(id="1-doc-a")], pagination=None)
+    mock_pinecone_index.list_paginated.side_effect = [first_page, last_page]
+    mock_pinecone_index.fetch.side_effect = lambda ids: MagicMock(vectors={i: records[i] for i in ids})
+
+    hashes = get_document_chunk_hashes(mock_pinecone_index, "1", "doc")
+    assert hashes == {"1-doc-a": "abc", "1-doc-0": hashlib.sha256(b"legacy").hexdigest()}
+    assert mock_pinecone_index.list_paginated.call_args_list[0].kwargs["prefix"] == "1-doc-"
+    assert mock_pinecone_index.list_paginated.call_args_list[1].kwargs["pagination_token"] == "token"
+    mock_pinecone_index.query.assert_not_called()
+
+# Test the connection registry
+@pytest.fixture
+def fresh_registry():
+    reset_connections()
+    yield
+    reset_connections()
+
+def test_registry_creates_client_and_index_once(mock_pinecone_grpc, fresh_registry):
+    import threading
+    mock_pc_instance = mock_pinecone_grpc.return_value
+    mock_pc_instance.has_index.return_value = True
+
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(get_rag_index())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    handles.append(get_rag_index())
+
+    assert all(handle is handles[0] for handle in handles)
+    mock_pinecone_grpc.assert_called_once()
+    mock_pc_instance.has_index.assert_called_once_with(RAG_INDEX_NAME)
+    # The user index shares the same client
+    get_user_index()
+    mock_pinecone_grpc.assert_called_once()
+    assert mock_pc_instance.Index.call_count == 2
+
+def test_registry_retries_after_failure(mock_pinecone_grpc, fresh_registry):
+    mock_pc_instance = mock_pinecone_grpc.return_value
+    mock_pc_instance.has_index.side_effect = [Exception("unavailable"), True]
+    assert get_rag_index() is None
+    assert get_rag_index().index is mock_pc_instance.Index.return_value
+
+def test_pinecone_health_check(mock_pinecone_grpc, fresh_registry):
+    mock_pc_instance = mock_pinecone_grpc.return_value
+    mock_pc_instance.has_index.return_value = True
+    get_rag_index()
+    report = pinecone_health_check()
+    assert report["ok"] is True
+    assert report["indexes"]["rag_index"]["ok"] is True
+
+    mock_pc_instance.Index.return_value.describe_index_stats.side_effect = Exception("down")
+    report = pinecone_health_check()
+    assert report["ok"] is False
+    assert report["indexes"]["rag_index"]["error"] == "down"
+
+def test_pinecone_health_check_reuses_recent_report(mock_pinecone_grpc, fresh_registry):
+    mock_pc_instance = mock_pinecone_grpc.return_value
+    mock_pc_instance.has_index.return_value = True
+    get_rag_index()
+    describe = mock_pc_instance.Index.return_value.describe_index_stats
+    first = pinecone_health_check(max_age=60)
+    assert pinecone_health_check(max_age=60) is first
+    assert describe.call_count == 1
+    pinecone_health_check() # max_age=0 always checks
+    assert describe.call_count == 2
+
+def test_persistent_store_ping_loads_no_partition(tmp_path):
+    from local_vector_store import PersistentVectorStore
+    store = PersistentVectorStore(str(tmp_path), 2, compaction_interval=0)
+    store.upsert(vectors=[{"id": "u1-a-0", "values": [1.0, 0.0], "metadata": {"user_id": "u1"}}])
+    store.close()
+    reopened = PersistentVectorStore(str(tmp_path), 2, compaction_interval=0)
+    reopened.ping()
+    assert reopened._partitions == {}
+    reopened.close()
@@ -0,0 +1,65 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import cProfile
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing profiler
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from profiler import RunProfile, detect_action, top_functions, rotate
+
+def busy_function():
+    return sum(i * i for i in range(20000))
+
+def test_detect_action_reports_changed_widgets():
+    session_state = {"page": "main", "retrieve_btn": False}
+    assert detect_action(session_state) == "load"
+    assert detect_action(session_state) == "rerun"
+    session_state["retrieve_btn"] = True
+    assert detect_action(session_state) == "retrieve_btn"
+    # The button resets on the next run; that is not a new action
+    session_state["retrieve_btn"] = False
+    session_state["page"] = "admin"
+    assert detect_action(session_state) == "page"
+
+def test_run_profile_writes_tagged_file(tmp_path):
+    run_profile = RunProfile("main", "retrieve_btn", directory=str(tmp_path))
+    assert run_profile.start()
+    busy_function()
+    summary = run_profile.stop()
+    assert summary["page"] == "main"
+    assert summary["action"] == "retrieve_btn"
+    assert summary["path"].endswith("-main-retrieve_btn.prof")
+    assert os.path.exists(summary["path"])
+    assert any("busy_function" in row["function"] or "genexpr" in row["function"] for row in summary["top"])
+
+def test_only_one_run_is_profiled_at_a_time(tmp_path):
+    first = RunProfile("main", "load", directory=str(tmp_path))
+    second = RunProfile("admin", "load", directory=str(tmp_path))
+    assert first.start()
+    assert not second.start()
+    assert second.stop() is None
+    assert first.stop() is not None
+    assert second.start()
+    second.stop()
+
+def test_rotate_keeps_newest(tmp_path):
+    for name in ("20240101-000000-0001-a.prof", "20240101-000000-0002-b.prof", "20240101-000000-0003-c.prof", "notes.txt"):
+        (tmp_path / name).write_text("")
+    rotate(str(tmp_path), keep=2)
+    assert sorted(os.listdir(tmp_path)) == ["20240101-000000-0002-b.prof", "20240101-000000-0003-c.prof", "notes.txt"]
+
+def test_top_functions_sorted_and_limited():
+    profile = cProfile.Profile()
+    profile.runcall(busy_function)
+    rows = top_functions(profile, n=3)
+    assert len(rows) <= 3
+    assert [row["own_ms"] for row in rows] == sorted((row["own_ms"] for row in rows), reverse=True)
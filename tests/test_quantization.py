@@ -0,0 +1,117 @@
+import pytest
+from unittest.mock import MagicMock
+import sys
+import os
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing quantization
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from quantization import Float16Quantizer, Int8Quantizer, make_quantizer, quantizer_from_params
+from local_vector_store import PersistentVectorStore
+
+DIM = 64
+
+def unit_rows(rows, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(rows, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+@pytest.mark.parametrize("mode,tolerance", [("float16", 1e-3), ("int8", 2e-2)])
+def test_quantized_scores_approximate_exact_scores(mode, tolerance):
+    vectors = unit_rows(2000)
+    quantizer = make_quantizer(mode, vectors)
+    codes = quantizer.encode(vectors)
+    assert codes.dtype == quantizer.dtype
+    query = unit_rows(1, seed=1)[0]
+    assert np.max(np.abs(quantizer.scores(codes, query) - vectors @ query)) < tolerance
+
+def test_int8_fit_falls_back_to_unit_range_for_few_rows():
+    quantizer = Int8Quantizer.fit(unit_rows(3))
+    codes = quantizer.encode(np.array([[1.0] + [0.0] * (DIM - 1), [-1.0] + [0.0] * (DIM - 1)], dtype=np.float32))
+    assert codes[0, 0] == 127 and codes[1, 0] == -128
+
+def test_quantizer_params_round_trip():
+    quantizer = Int8Quantizer.fit(unit_rows(500))
+    restored = quantizer_from_params(quantizer.params())
+    assert np.array_equal(restored.offset, quantizer.offset) and np.array_equal(restored.scale, quantizer.scale)
+    assert isinstance(quantizer_from_params(Float16Quantizer().params()), Float16Quantizer)
+    assert make_quantizer("none", None) is None
+    with pytest.raises(ValueError):
+        make_quantizer("int4", None)
+
+@pytest.mark.parametrize("mode", ["float16", "int8"])
+def test_persistent_store_reranks_quantized_candidates(tmp_path, mode):
+    vectors = unit_rows(3000, seed=2)
+    records = [{"id": f"u1-{i}", "values": v.tolist(), "metadata": {"user_id": "u1"}} for i, v in enumerate(vectors)]
+    exact = PersistentVectorStore(str(tmp_path / "exact"), DIM, compaction_interval=0)
+    quantized = PersistentVectorStore(str(tmp_path / mode), DIM, compaction_interval=0, quantization=mode)
+    for start in range(0, len(records), 500):
+        exact.upsert(vectors=records[start:start + 500])
+        quantized.upsert(vectors=records[start:start + 500])
+    segment = quantized._partitions["u1"].active
+    assert segment.quantizer.name == mode
+    assert os.path.getsize(segment.codes_path) == 3000 * DIM * np.dtype(segment.quantizer.dtype).itemsize
+
+    queries = unit_rows(20, seed=3)
+    recall = []
+    for query in queries:
+        truth = [m.id for m in exact.query(vector=query.tolist(), top_k=10, filter={"user_id": "u1"}).matches]
+        found = quantized.query(vector=query.tolist(), top_k=10, filter={"user_id": "u1"}).matches
+        recall.append(len({m.id for m in found} & set(truth)) / 10)
+        # Scores come from the full-precision rows
+        assert found[0].score == pytest.approx(float(vectors[int(found[0].id[3:])] @ query), abs=1e-5)
+    assert np.mean(recall) >= 0.95
+    quantized.close()
+
+    reopened = PersistentVectorStore(str(tmp_path / mode), DIM, compaction_interval=0, quantization=mode)
+    assert reopened.query(vector=vectors[7].tolist(), top_k=1, filter={"user_id": "u1"}).matches[0].id == "u1-7"
+    assert reopened._partitions["u1"].active.quantizer is not None
+    # Opening with quantization off ignores the codes and searches the float32 rows
+    plain = PersistentVectorStore(str(tmp_path / mode), DIM, compaction_interval=0)
+    assert plain.query(vector=vectors[7].tolist(), top_k=1, filter={"user_id": "u1"}).matches[0].id == "u1-7"
+    assert plain._partitions["u1"].active.quantizer is None
+
+def test_int8_segment_is_refitted_after_a_small_first_upsert(tmp_path):
+    # The app's first upsert into a segment is one document's chunks, too few to fit ranges
+    vectors = unit_rows(1000, seed=4)
+    records = [{"id": f"u1-{i}", "values": v.tolist(), "metadata": {"user_id": "u1"}} for i, v in enumerate(vectors)]
+    store = PersistentVectorStore(str(tmp_path), DIM, compaction_interval=0, quantization="int8")
+    store.upsert(vectors=records[:20])
+    segment = store._partitions["u1"].active
+    assert not segment.quantizer.fitted
+    for start in range(20, len(records), 50):
+        store.upsert(vectors=records[start:start + 50])
+    assert segment.quantizer.fitted
+
+    def reconstruction_error(quantizer, codes):
+        return float(np.mean(np.abs(quantizer.offset + quantizer.scale * codes.astype(np.float32) - vectors)))
+    fallback = Int8Quantizer.fit(vectors[:20])
+    error = reconstruction_error(segment.quantizer, np.asarray(segment.codes))
+    assert error < 0.6 * reconstruction_error(fallback, fallback.encode(vectors))
+    fitted = Int8Quantizer.fit(vectors[:300])
+    assert error < 1.5 * reconstruction_error(fitted, fitted.encode(vectors))
+    store.close()
+
+    reopened = PersistentVectorStore(str(tmp_path), DIM, compaction_interval=0, quantization="int8")
+    assert reopened.query(vector=vectors[7].tolist(), top_k=1, filter={"user_id": "u1"}).matches[0].id == "u1-7"
+    quantizer = reopened._partitions["u1"].active.quantizer
+    assert quantizer.fitted and np.array_equal(quantizer.scale, segment.quantizer.scale)
+
+def test_unfitted_params_without_flag_are_recognised():
+    params = Int8Quantizer.fit(unit_rows(3)).params()
+    del params["fitted"]
+    assert not quantizer_from_params(params).fitted
+    params = Int8Quantizer.fit(unit_rows(500)).params()
+    del params["fitted"]
+    assert quantizer_from_params(params).fitted
+
+def test_persistent_store_rejects_unknown_quantization(tmp_path):
+    with pytest.raises(ValueError):
+        PersistentVectorStore(str(tmp_path), DIM, compaction_interval=0, quantization="int4")
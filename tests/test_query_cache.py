@@ -0,0 +1,52 @@
+import pytest
+import sys
+import os
+
+# Add the parent directory to the sys.path to allow importing query_cache
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from query_cache import QueryCache
+
+FILTER = {"user_id": "1"}
+
+def test_query_cache_hit_and_miss():
+    cache = QueryCache(ttl=60, max_entries=10)
+    assert cache.get("1", "query", 5, FILTER) is None
+    cache.put("1", "query", 5, FILTER, ["match"], cache.generation("1"))
+    assert cache.get("1", "query", 5, FILTER) == ["match"]
+    # top_k and filter are part of the key
+    assert cache.get("1", "query", 10, FILTER) is None
+    assert cache.get("1", "query", 5, {"user_id": "1", "original_text_id": "doc"}) is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 3}
+
+def test_query_cache_expires(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("query_cache.time.monotonic", lambda: now[0])
+    cache = QueryCache(ttl=10, max_entries=10)
+    cache.put("1", "query", 5, FILTER, ["match"], 0)
+    now[0] += 11
+    assert cache.get("1", "query", 5, FILTER) is None
+
+def test_query_cache_bounded_lru():
+    cache = QueryCache(ttl=60, max_entries=2)
+    cache.put("1", "a", 5, FILTER, ["a"], 0)
+    cache.put("1", "b", 5, FILTER, ["b"], 0)
+    cache.get("1", "a", 5, FILTER)
+    cache.put("1", "c", 5, FILTER, ["c"], 0)
+    assert cache.get("1", "a", 5, FILTER) == ["a"]
+    assert cache.get("1", "b", 5, FILTER) is None
+
+def test_query_cache_invalidates_only_that_user():
+    cache = QueryCache(ttl=60, max_entries=10)
+    cache.put("1", "query", 5, FILTER, ["mine"], 0)
+    cache.put("2", "query", 5, {"user_id": "2"}, ["theirs"], 0)
+    cache.invalidate_user("1")
+    assert cache.get("1", "query", 5, FILTER) is None
+    assert cache.get("2", "query", 5, {"user_id": "2"}) == ["theirs"]
+
+def test_query_cache_drops_results_computed_during_a_write():
+    cache = QueryCache(ttl=60, max_entries=10)
+    generation = cache.generation("1")
+    cache.invalidate_user("1") # A write lands while the query is running
+    cache.put("1", "query", 5, FILTER, ["stale"], generation)
+    assert cache.get("1", "query", 5, FILTER) is None
@@ -0,0 +1,142 @@
+import pytest
+import logging
+import time
+from unittest.mock import patch, MagicMock
+import sys
+import os
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing rag_stats
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pinecone_utils
+from rag_stats import RagStats
+from pinecone_utils import bulk_upsert, delete_embeddings, get_user_rag_stats, start_rag_stats_reconciler
+
+def chunk(vector_id, user_id="1", document_id="doc"):
+    return {"id": vector_id, "values": [0.1], "metadata": {"user_id": user_id, "original_text_id": document_id}}
+
+def record(vector_id, document_id):
+    return MagicMock(id=vector_id, metadata={"original_text_id": document_id})
+
+@pytest.fixture
+def stats(tmp_path):
+    stats = RagStats(str(tmp_path / "stats.db"))
+    yield stats
+    stats.close()
+
+def counted(stats, *user_ids):
+    # Marks users as counted from an empty index, so their counters are read as is
+    for user_id in user_ids:
+        stats.reconcile(user_id, lambda uid: [], lambda ids: [])
+
+def test_counts_are_incremental_and_idempotent(stats):
+    assert stats.get("1") is None
+    counted(stats, "1", "2")
+    stats.record_upserts([chunk("1-a-0", document_id="a"), chunk("1-a-1", document_id="a"), chunk("1-b-0", document_id="b")])
+    stats.record_upserts([chunk("1-a-0", document_id="a")]) # Re-stored chunk is not counted twice
+    stats.record_upserts([chunk("2-c-0", user_id="2", document_id="c")])
+    assert stats.get("1") == {"total_documents": 2, "total_chunks": 3}
+
+    stats.record_deletes("1", ["1-a-0", "1-missing"])
+    assert stats.get("1") == {"total_documents": 2, "total_chunks": 2}
+    stats.record_deletes("1", ["1-a-1", "1-a-1"])
+    assert stats.get("1") == {"total_documents": 1, "total_chunks": 1}
+    assert stats.get("2") == {"total_documents": 1, "total_chunks": 1}
+
+def test_counts_are_durable(tmp_path):
+    path = str(tmp_path / "stats.db")
+    stats = RagStats(path)
+    counted(stats, "1")
+    stats.record_upserts([chunk("1-a-0"), chunk("1-a-1")])
+    stats.close()
+    reopened = RagStats(path)
+    assert reopened.get("1") == {"total_documents": 1, "total_chunks": 2}
+    reopened.close()
+
+def test_reconcile_corrects_drift(stats):
+    stats.record_upserts([chunk("1-a-0", document_id="a"), chunk("1-gone-0", document_id="gone")])
+    fetched = []
+    def fetch(ids):
+        fetched.extend(ids)
+        return [record(vector_id, vector_id.split("-")[1]) for vector_id in ids]
+    # The index lost 1-gone-0 and gained two chunks written outside pinecone_utils
+    result = stats.reconcile("1", lambda user_id: ["1-a-0", "1-a-1", "1-b-0"], fetch)
+    assert result == {"total_documents": 2, "total_chunks": 3}
+    assert fetched == ["1-a-1", "1-b-0"] # Only chunks missing from the ledger are fetched
+    assert stats.reconcile("3", lambda user_id: [], fetch) == {"total_documents": 0, "total_chunks": 0}
+    assert stats.reconcile("1", lambda user_id: None, fetch) is None # Listing failed; counts kept
+    assert stats.get("1") == {"total_documents": 2, "total_chunks": 3}
+
+def test_reconcile_keeps_chunks_recorded_during_the_listing(stats):
+    stats.record_upserts([chunk("1-a-0", document_id="a")])
+    def list_ids(user_id):
+        # A chunk is stored after the index was listed but before the listing returns
+        stats.record_upserts([chunk("1-a-1", document_id="a")])
+        return ["1-a-0"]
+    assert stats.reconcile("1", list_ids, lambda ids: []) == {"total_documents": 1, "total_chunks": 2}
+
+def test_writes_for_an_uncounted_user_stay_provisional(stats):
+    # The user had chunks in the index before the statistics store saw any of their writes
+    stats.record_upserts([chunk("1-new-0", document_id="new")])
+    assert stats.get("1") is None # Not mistaken for the user's full counts
+    listed = ["1-old-0", "1-old-1", "1-new-0"]
+    result = stats.reconcile("1", lambda user_id: listed, lambda ids: [record(vector_id, vector_id.split("-")[1]) for vector_id in ids])
+    assert result == {"total_documents": 2, "total_chunks": 3}
+
+def test_get_user_rag_stats_reads_counters(stats):
+    index = MagicMock()
+    counted(stats, "1")
+    with patch.object(pinecone_utils, "rag_stats", stats), patch.object(stats, "start_reconciler") as start:
+        bulk_upsert(index, [chunk("1-a-0"), chunk("1-a-1")])
+        assert get_user_rag_stats(index, "1") == {"total_documents": 1, "total_chunks": 2}
+        assert delete_embeddings(index, ["1-a-0"], "1")
+        assert get_user_rag_stats(index, "1") == {"total_documents": 1, "total_chunks": 1}
+        index.query.assert_not_called()
+        index.list_paginated.assert_not_called()
+    start.assert_not_called() # Started once at app startup, not per render
+
+def test_get_user_rag_stats_backfills_unknown_user(stats):
+    index = MagicMock()
+    page = MagicMock(vectors=[MagicMock(id="5-a-0"), MagicMock(id="5-b-0")], pagination=None)
+    index.list_paginated.return_value = page
+    index.fetch.return_value.vectors = {"5-a-0": record("5-a-0", "a"), "5-b-0": record("5-b-0", "b")}
+    with patch.object(pinecone_utils, "rag_stats", stats), patch.object(stats, "start_reconciler"):
+        assert get_user_rag_stats(index, "5") == {"total_documents": 2, "total_chunks": 2}
+        assert get_user_rag_stats(index, "5") == {"total_documents": 2, "total_chunks": 2}
+    index.list_paginated.assert_called_once() # Later renders read the counters only
+
+def test_reconciler_resolves_the_index_on_every_pass(stats):
+    new = MagicMock()
+    new.list_paginated.return_value = MagicMock(vectors=[MagicMock(id="1-a-0")], pagination=None)
+    new.fetch.return_value.vectors = {"1-a-0": record("1-a-0", "a")}
+    with patch.object(pinecone_utils, "rag_stats", stats), patch.object(stats, "start_reconciler") as start:
+        start_rag_stats_reconciler()
+        list_ids, fetch = start.call_args.args
+        # reset_connections() replaced the handle after the reconciler was started
+        with patch.object(pinecone_utils, "get_rag_index", return_value=new):
+            assert stats.reconcile("1", list_ids, fetch) == {"total_documents": 1, "total_chunks": 1}
+        with patch.object(pinecone_utils, "get_rag_index", return_value=None):
+            assert list_ids("1") is None # Not connected; the counts are kept
+
+def test_reconciler_logs_failures_and_keeps_running(stats, caplog):
+    counted(stats, "1")
+    calls = []
+    def list_ids(user_id):
+        calls.append(user_id)
+        if len(calls) == 1:
+            raise RuntimeError("index unavailable")
+        return []
+    with caplog.at_level(logging.ERROR, logger="rag_stats"):
+        stats.start_reconciler(list_ids, lambda ids: [], interval=0.01)
+        deadline = time.monotonic() + 5
+        while len(calls) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert len(calls) >= 2
+    assert "index unavailable" in caplog.text
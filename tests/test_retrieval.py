@@ -0,0 +1,99 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing retrieval
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from retrieval import retrieve_similar, retrieve_many
+from query_cache import query_cache
+from pinecone_utils import delete_embeddings, bulk_upsert
+
+@pytest.fixture(autouse=True)
+def fresh_query_cache():
+    query_cache.clear()
+    yield
+    query_cache.clear()
+
+@pytest.fixture
+def mock_index():
+    index = MagicMock()
+    match = MagicMock()
+    match.metadata = {"text": "stored text"}
+    index.query.return_value.matches = [match]
+    return index
+
+@patch('retrieval.get_ollama_embedding', return_value=[0.1, 0.2])
+def test_retrieve_similar_caches_repeated_queries(mock_embed, mock_index):
+    first = retrieve_similar(mock_index, "1", "query")
+    second = retrieve_similar(mock_index, "1", "query")
+    assert first == second
+    assert mock_embed.call_count == 1
+    mock_index.query.assert_called_once_with(vector=[0.1, 0.2], top_k=5, include_metadata=True, filter={"user_id": "1"})
+
+@patch('retrieval.get_ollama_embedding', return_value=[0.1, 0.2])
+def test_retrieve_similar_invalidated_by_delete(mock_embed, mock_index):
+    retrieve_similar(mock_index, "1", "query")
+    delete_embeddings(mock_index, ["1-doc-0"], "1")
+    retrieve_similar(mock_index, "1", "query")
+    assert mock_index.query.call_count == 2
+
+@patch('retrieval.get_ollama_embedding', return_value=[0.1, 0.2])
+def test_retrieve_similar_invalidated_by_upsert(mock_embed, mock_index):
+    retrieve_similar(mock_index, "1", "query")
+    bulk_upsert(mock_index, [{"id": "1-doc-0", "values": [0.1, 0.2], "metadata": {"user_id": "1"}}])
+    retrieve_similar(mock_index, "1", "query")
+    assert mock_index.query.call_count == 2
+
+@patch('retrieval.get_ollama_embedding', return_value=None)
+def test_retrieve_similar_without_embedding(mock_embed, mock_index):
+    assert retrieve_similar(mock_index, "1", "query") is None
+    mock_index.query.assert_not_called()
+
+def _echo_index():
+    # Each query's single match carries the vector it was queried with
+    index = MagicMock()
+    def query(vector, top_k, include_metadata, filter):
+        match = MagicMock()
+        match.metadata = {"vector": vector}
+        return MagicMock(matches=[match])
+    index.query.side_effect = query
+    return index
+
+@patch('retrieval.get_ollama_embeddings', side_effect=lambda texts: [[float(len(text))] for text in texts])
+def test_retrieve_many_dedupes_and_keeps_order(mock_embed):
+    index = _echo_index()
+    results = retrieve_many("1", ["a", "bbb", "a", "cc"], top_k=3, index=index, max_concurrency=2)
+    assert [r[0].metadata["vector"] for r in results] == [[1.0], [3.0], [1.0], [2.0]]
+    mock_embed.assert_called_once_with(["a", "bbb", "cc"]) # One batched call, duplicates removed
+    assert index.query.call_count == 3
+    assert index.query.call_args.kwargs["filter"] == {"user_id": "1"}
+
+@patch('retrieval.get_ollama_embeddings', side_effect=lambda texts: [[1.0] if text != "bad" else None for text in texts])
+def test_retrieve_many_partial_failures(mock_embed):
+    index = _echo_index()
+    results = retrieve_many("1", ["ok", "bad"], index=index)
+    assert results[0] is not None
+    assert results[1] is None
+
+    index.query.side_effect = Exception("Query error")
+    assert retrieve_many("2", ["x"], index=index) == [None]
+    st.error.assert_called_once_with("Error retrieving similar embeddings from Pinecone for 1 queries: Query error")
+
+@patch('retrieval.get_ollama_embeddings', side_effect=lambda texts: [[1.0] for _ in texts])
+@patch('retrieval.get_ollama_embedding', return_value=[1.0])
+def test_retrieve_many_shares_the_query_cache(mock_embed_one, mock_embed_many):
+    index = _echo_index()
+    retrieve_similar(index, "1", "seen")
+    retrieve_many("1", ["seen", "new"], index=index)
+    mock_embed_many.assert_called_once_with(["new"])
+    retrieve_many("1", ["seen", "new"], index=index)
+    assert index.query.call_count == 2
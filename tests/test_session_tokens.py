@@ -0,0 +1,78 @@
+import pytest
+import logging
+from unittest.mock import patch, MagicMock
+import sys
+import os
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing session_tokens
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from session_tokens import issue_token, verify_token, revoke_token, warn_if_no_secret, SessionStore
+from utils import hash_password, check_password, password_pool
+
+def test_token_round_trip():
+    token = issue_token("u1", "alice", ttl=60)
+    assert verify_token(token) == {"user_id": "u1", "username": "alice"}
+
+def test_expired_token_is_rejected():
+    token = issue_token("u1", "alice", ttl=60, now=1000)
+    assert verify_token(token, now=1059) is not None
+    assert verify_token(token, now=1060) is None
+
+def test_tampered_or_foreign_tokens_are_rejected():
+    token = issue_token("u1", "alice", ttl=60)
+    payload, signature = token.split(".")
+    forged = issue_token("u2", "mallory", ttl=60).split(".")[0] + "." + signature
+    assert verify_token(forged) is None
+    assert verify_token(issue_token("u1", "alice", ttl=60, secret=b"other key")) is None
+    for garbage in ["", "abc", "a.b.c", payload + ".!!", "é.é", None]:
+        assert verify_token(garbage) is None
+
+def test_password_hashing_runs_on_the_pool():
+    with patch.object(password_pool, "submit", wraps=password_pool.submit) as submit:
+        hashed = hash_password("secret", rounds=4)
+        assert hashed.startswith("$2b$04$")
+        assert check_password("secret", hashed)
+        assert not check_password("wrong", hashed)
+    assert submit.call_count == 3
+
+def test_revoked_token_is_rejected(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    token = issue_token("u1", "alice", ttl=60, store=store)
+    other = issue_token("u1", "alice", ttl=60, store=store)
+    assert verify_token(token, store=store) is not None
+    revoke_token(token, store=store)
+    assert verify_token(token, store=store) is None
+    assert verify_token(other, store=store) is not None # Other sessions of the user are kept
+    reopened = SessionStore(str(tmp_path / "sessions.db"))
+    assert verify_token(other, store=reopened) is not None # Sessions survive a restart
+    assert verify_token(token, store=reopened) is None
+
+def test_token_without_a_stored_session_is_rejected():
+    # Signed with the right key but not issued through the store, e.g. before it was emptied
+    store = SessionStore(":memory:")
+    token = issue_token("u1", "alice", ttl=60, store=SessionStore(":memory:"))
+    assert verify_token(token, store=store) is None
+    revoke_token("garbage", store=store)
+
+def test_expired_sessions_are_purged():
+    store = SessionStore(":memory:")
+    issue_token("u1", "alice", ttl=60, now=1000, store=store)
+    issue_token("u2", "bob", ttl=60, now=2000, store=store)
+    assert store._conn.execute("SELECT user_id FROM sessions").fetchall() == [("u2",)]
+
+def test_missing_secret_is_warned_about(caplog):
+    with caplog.at_level(logging.WARNING, logger="session_tokens"):
+        assert warn_if_no_secret(secret="", ttl=3600)
+    assert "SESSION_SECRET is not set" in caplog.text
+    caplog.clear()
+    assert not warn_if_no_secret(secret="configured", ttl=3600)
+    assert not warn_if_no_secret(secret="", ttl=0) # Session tokens disabled
+    assert caplog.text == ""
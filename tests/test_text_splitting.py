@@ -0,0 +1,109 @@
+import pytest
+import io
+import sys
+import os
+
+# Add the parent directory to the sys.path to allow importing text_splitting
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import random
+from text_splitting import RecursiveTextSplitter, iter_text_blocks, iter_split_stream, iter_file_chunks
+
+def _langchain_splitter(chunk_size, chunk_overlap):
+    # The splitter the app used before RecursiveTextSplitter; equivalence tests skip without it
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        RecursiveCharacterTextSplitter = pytest.importorskip("langchain.text_splitter").RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len, is_separator_regex=False)
+
+def _document(paragraphs=200):
+    # Every word is unique so each chunk has exactly one position in the document
+    return "\n\n".join(" ".join(f"p{p}w{w}" for w in range(10 + (p * 13) % 90)) for p in range(paragraphs))
+
+def _splitter(chunk_size=200, chunk_overlap=20):
+    return RecursiveTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+class RecordingFile(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+def test_iter_text_blocks_handles_multibyte_boundaries():
+    text = "héllo wörld ✓ " * 50
+    blocks = list(iter_text_blocks(io.BytesIO(text.encode('utf-8')), block_size=3))
+    assert "".join(blocks) == text
+
+def test_stream_matches_split_text_for_small_documents():
+    splitter = _splitter()
+    text = _document(paragraphs=3)
+    assert list(iter_split_stream([text], splitter, 200, 20)) == splitter.split_text(text)
+
+def test_stream_chunks_cover_document_with_overlap():
+    splitter = _splitter()
+    text = _document()
+    chunks = list(iter_file_chunks(io.BytesIO(text.encode('utf-8')), splitter, 200, 20, block_size=500))
+
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    # Every chunk appears in order and no text between consecutive chunks is skipped
+    cursor = 0
+    covered = 0
+    for chunk in chunks:
+        position = text.find(chunk, cursor)
+        assert position != -1
+        assert not text[covered:position].strip()
+        cursor = position + 1
+        covered = max(covered, position + len(chunk))
+    assert not text[covered:].strip()
+    # Chunk count stays close to splitting the whole document at once
+    assert abs(len(chunks) - len(splitter.split_text(text))) <= len(chunks) // 50 + 1
+
+def test_stream_does_not_duplicate_repetitive_text():
+    splitter = _splitter(chunk_size=500, chunk_overlap=50)
+    text = "word " * 5000
+    chunks = list(iter_file_chunks(io.BytesIO(text.encode('utf-8')), splitter, 500, 50, block_size=1000))
+    assert abs(len(chunks) - len(splitter.split_text(text))) <= 2
+
+def test_stream_yields_before_file_is_read():
+    text = _document(paragraphs=400)
+    upload = RecordingFile(text.encode('utf-8'))
+    chunks = iter_file_chunks(upload, _splitter(), 200, 20, block_size=1024)
+    next(chunks)
+    assert upload.tell() < len(text) // 4
+
+def test_recursive_splitter_prefers_paragraphs():
+    text = "first paragraph\n\nsecond paragraph\n\nthird"
+    assert RecursiveTextSplitter(chunk_size=20, chunk_overlap=0).split_text(text) == ["first paragraph", "second paragraph", "third"]
+
+def test_recursive_splitter_overlap_and_size():
+    text = " ".join(f"w{i}" for i in range(200))
+    chunks = RecursiveTextSplitter(chunk_size=50, chunk_overlap=10).split_text(text)
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    # Each chunk starts with words from the end of the previous one
+    assert all(chunks[i + 1].split()[0] in chunks[i].split() for i in range(len(chunks) - 1))
+
+def test_recursive_splitter_rejects_bad_settings():
+    with pytest.raises(ValueError):
+        RecursiveTextSplitter(chunk_size=0)
+    with pytest.raises(ValueError):
+        RecursiveTextSplitter(chunk_size=10, chunk_overlap=20)
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(100, 0), (200, 20), (500, 50), (2000, 1999)])
+def test_recursive_splitter_matches_langchain_on_documents(chunk_size, chunk_overlap):
+    reference = _langchain_splitter(chunk_size, chunk_overlap)
+    text = _document(paragraphs=50) + "\n" + "x" * (3 * chunk_size) + "\n  trailing line \n"
+    assert RecursiveTextSplitter(chunk_size, chunk_overlap).split_text(text) == reference.split_text(text)
+
+def test_recursive_splitter_matches_langchain_on_random_text():
+    rng = random.Random(0)
+    alphabet = ["a", "b", " ", "  ", "\n", "\n\n", "\n\n\n", " \n", "é", "longwordwithoutspaces" * 4]
+    for _ in range(500):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 300)))
+        chunk_size = rng.randint(1, 80)
+        chunk_overlap = rng.randint(0, chunk_size)
+        expected = _langchain_splitter(chunk_size, chunk_overlap).split_text(text)
+        assert RecursiveTextSplitter(chunk_size, chunk_overlap).split_text(text) == expected, (text, chunk_size, chunk_overlap)
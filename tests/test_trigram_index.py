@@ -0,0 +1,106 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing trigram_index
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import random
+import time
+from trigram_index import TrigramIndex, TextSearchIndex, SEARCH_FIELDS, text_search_index
+from pinecone_utils import bulk_upsert, delete_embeddings
+
+WORDS = ["alpha", "Beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "iota", "kappa", "lambda", "mu"]
+
+def make_match(vector_id, text, document_id="doc", insert_date="2024-05-01T10:00:00"):
+    match = MagicMock()
+    match.id = vector_id
+    match.metadata = {"text": text, "original_text_id": document_id, "insert_date": insert_date, "user_id": "u1"}
+    return match
+
+def scan(matches, field, term):
+    term = term.lower()
+    values = lambda m: (m.id if field == "id" else m.metadata.get(field, "")).lower()
+    return [m.id for m in matches if term in values(m)]
+
+@pytest.fixture
+def corpus():
+    rng = random.Random(0)
+    return [make_match(f"u1-doc{i % 9}-{i}", " ".join(rng.choice(WORDS) for _ in range(12)), f"doc{i % 9}", f"2024-0{1 + i % 9}-1{i % 10}")
+            for i in range(400)]
+
+def test_search_matches_substring_scan(corpus):
+    index = TrigramIndex()
+    for match in corpus:
+        index.add(match.id, match.metadata)
+    for field, term in [("text", "beta gam"), ("text", "LAMBDA"), ("text", "ta"), ("text", "x"), ("text", ""),
+                        ("id", "doc3-"), ("original_text_id", "doc7"), ("insert_date", "2024-03"), ("text", "zeta zeta zeta")]:
+        assert index.search(field, term) == scan(corpus, field, term), (field, term)
+
+def test_add_replaces_and_remove_hides(corpus):
+    index = TrigramIndex()
+    for match in corpus[:10]:
+        index.add(match.id, match.metadata)
+    index.add(corpus[0].id, {"text": "completely new words"})
+    assert index.search("text", "new words") == [corpus[0].id]
+    index.remove(corpus[1].id)
+    assert corpus[1].id not in index.search("text", "")
+    assert len(index) == 9
+
+def test_rebuild_after_many_removals(corpus):
+    index = TrigramIndex()
+    for match in corpus:
+        index.add(match.id, match.metadata)
+    for match in corpus[:300]:
+        index.remove(match.id)
+    assert len(index._ids) < 300 # Purged removed documents
+    assert index.search("text", "alpha") == scan(corpus[300:], "text", "alpha")
+    assert index.search("id", "doc1-") == scan(corpus[300:], "id", "doc1-")
+
+def test_sync_reconciles_by_id(corpus):
+    indexes = TextSearchIndex()
+    records = {m.id: m for m in corpus}
+    fetched = []
+    def fetch(ids):
+        fetched.extend(ids)
+        return [records[vector_id] for vector_id in ids]
+    index = indexes.sync("u1", [m.id for m in corpus[:100]], fetch)
+    assert len(index) == 100
+    del fetched[:]
+    index = indexes.sync("u1", [m.id for m in corpus[50:150]], fetch)
+    assert fetched == [m.id for m in corpus[100:150]] # Only chunks not yet indexed are fetched
+    assert index.ids() == {m.id for m in corpus[50:150]}
+    assert index.search("text", "kappa") == scan(corpus[50:150], "text", "kappa")
+
+def test_writes_through_pinecone_utils_update_the_index():
+    text_search_index.clear()
+    index = text_search_index.sync("u1", ["u1-doc-0"], lambda ids: [make_match("u1-doc-0", "first chunk")])
+    mock_index = MagicMock(spec=["upsert"])
+    bulk_upsert(mock_index, [{"id": "u1-doc-1", "values": [0.1], "metadata": {"text": "second chunk", "user_id": "u1"}},
+                             {"id": "u2-doc-0", "values": [0.1], "metadata": {"text": "other user", "user_id": "u2"}}])
+    assert index.search("text", "chunk") == ["u1-doc-0", "u1-doc-1"]
+    assert text_search_index.sync("u2", [], None).search("text", "other") == [] # u2 had no index at upsert time
+    assert delete_embeddings(MagicMock(), ["u1-doc-0"], "u1")
+    assert index.search("text", "chunk") == ["u1-doc-1"]
+    text_search_index.clear()
+
+def test_current_serves_the_index_until_expired_or_due():
+    indexes = TextSearchIndex(resync_interval=60)
+    assert indexes.current("u1") is None # Never synced
+    index = indexes.sync("u1", ["u1-doc-0"], lambda ids: [make_match("u1-doc-0", "first chunk")])
+    assert indexes.current("u1") is index
+    indexes.add_vectors([{"id": "u1-doc-1", "values": [0.1], "metadata": {"text": "second chunk", "user_id": "u1"}}])
+    assert indexes.current("u1").search("text", "chunk") == ["u1-doc-0", "u1-doc-1"]
+    indexes.expire("u1")
+    assert indexes.current("u1") is None
+    indexes.sync("u1", ["u1-doc-0", "u1-doc-1"], lambda ids: [])
+    with patch("trigram_index.time.monotonic", return_value=time.monotonic() + 61):
+        assert indexes.current("u1") is None # Due for a periodic resync
@@ -0,0 +1,96 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import threading
+from dotenv import load_dotenv
+
+# Load test environment variables
+load_dotenv(dotenv_path='tests/.env.test', override=True)
+
+# Mock the Streamlit st object
+st = sys.modules.setdefault('streamlit', MagicMock())
+
+# Add the parent directory to the sys.path to allow importing user_store
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils
+from user_store import SQLiteUserStore, PineconeUserStore, migrate_users
+from local_vector_store import LocalVectorStore
+from pinecone_utils import DIMENSION
+from utils import add_user, get_user_by_username, check_password, clear_user_cache
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteUserStore(str(tmp_path / "users.db"))
+    yield store
+    store.close()
+
+@pytest.fixture
+def sqlite_backend(store):
+    clear_user_cache()
+    with patch('utils.user_store', store):
+        yield store
+    clear_user_cache()
+
+def test_add_and_get(store):
+    assert store.get("alice") is None
+    assert store.add("alice", "hash-a", "u1")
+    assert not store.add("alice", "hash-b", "u2") # Username taken
+    assert store.get("alice") == {"username": "alice", "password": "hash-a", "user_id": "u1"}
+    assert store.count() == 1
+
+def test_concurrent_registrations_of_one_username(store):
+    results = []
+    def register(i):
+        results.append(store.add("bob", f"hash-{i}", f"u{i}"))
+    threads = [threading.Thread(target=register, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
+    assert store.count() == 1
+
+def test_concurrent_registrations_in_the_pinecone_store():
+    # Same-process registrations of one username; the local store stands in for the user index
+    store = PineconeUserStore(LocalVectorStore(DIMENSION, partition_field=None))
+    results = {}
+    def register(i):
+        results[i] = store.add("bob", f"hash-{i}", f"u{i}")
+    threads = [threading.Thread(target=register, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    winners = [i for i, added in results.items() if added]
+    assert len(winners) == 1
+    assert store.get("bob")["user_id"] == f"u{winners[0]}" # Not overwritten by a later registration
+
+def test_utils_use_the_sqlite_store(sqlite_backend):
+    with patch('utils.get_user_index') as get_user_index:
+        assert add_user("carol", "secret")
+        clear_user_cache()
+        user = get_user_by_username("carol")
+        assert check_password("secret", user["password"])
+        assert not add_user("carol", "other")
+        st.error.assert_called_with("Username already exists.")
+        get_user_index.assert_not_called() # No Pinecone user index involved
+
+def _page(ids, next_token=None):
+    return MagicMock(vectors=[MagicMock(id=vector_id) for vector_id in ids],
+                     pagination=MagicMock(next=next_token) if next_token else None)
+
+def test_migrate_users(store):
+    records = {
+        "user-a": MagicMock(id="user-a", metadata={"username": "alice", "password": "hash-a", "user_id": "1"}),
+        "2": MagicMock(id="2", metadata={"username": "bob", "password": "hash-b", "user_id": "2"}),
+        "junk": MagicMock(id="junk", metadata={"note": "not a user"}),
+    }
+    user_index = MagicMock()
+    user_index.list_paginated.side_effect = [_page(["user-a", "2"], "tok"), _page(["junk"])] * 2
+    user_index.fetch.side_effect = lambda ids: MagicMock(vectors={i: records[i] for i in ids})
+
+    assert migrate_users(user_index, store) == (2, 0)
+    assert store.get("bob") == {"username": "bob", "password": "hash-b", "user_id": "2"}
+    assert migrate_users(user_index, store) == (0, 2) # Re-running skips migrated users
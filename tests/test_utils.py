@@ -2,6 +2,7 @@ import pytest
 from unittest.mock import patch, MagicMock
 import sys
 import os
+import time
 import requests # Import requests here
 from dotenv import load_dotenv
 
@@ -10,13 +11,13 @@ load_dotenv(dotenv_path='tests/.env.test', override=True)
 
 # Mock the Streamlit st object to prevent errors during testing
 # This is a common pattern when testing Streamlit apps without running the app
-st = MagicMock()
-sys.modules['streamlit'] = st
+st = sys.modules.setdefault('streamlit', MagicMock())
 
 # Add the parent directory to the sys.path to allow importing utils
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from utils import hash_password, check_password, get_ollama_embedding, get_next_user_id, add_user, get_user_by_username
+from utils import hash_password, check_password, get_ollama_embedding, get_next_user_id, add_user, get_user_by_username, clear_user_cache, get_ollama_embeddings, AdaptiveBatchSizer, embedding_client, OLLAMA_EMBED_BATCH_URL
+from ollama_client import EmbeddingClient, CircuitBreaker, CircuitOpenError
 from pinecone_utils import initialize_pinecone_user_index, get_all_users_from_pinecone_index, add_user_to_pinecone_index, get_user_from_pinecone_index
 
 # Mock the user_index from utils.py
@@ -25,6 +26,20 @@ def mock_user_index():
     with patch('utils.user_index', MagicMock()) as mock_index:
         yield mock_index
 
+# Retries must not sleep and breaker state must not leak between tests
+@pytest.fixture(autouse=True)
+def reset_embedding_client():
+    embedding_client.breaker.reset()
+    with patch('ollama_client.time.sleep'):
+        yield
+    embedding_client.breaker.reset()
+
+# A developer's EMBEDDING_CACHE_PATH must not leak cached vectors into these tests
+@pytest.fixture(autouse=True)
+def no_embedding_cache():
+    with patch('utils.embedding_cache', None):
+        yield
+
 # Test password hashing functions
 def test_hash_password():
     password = "test_password"
@@ -44,7 +59,7 @@ def test_check_password_incorrect():
     assert not check_password("wrong_password", hashed_password)
 
 # Test get_ollama_embedding with mocking requests
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_get_ollama_embedding_success(mock_post):
     mock_response = MagicMock()
     mock_response.raise_for_status.return_value = None
@@ -56,10 +71,11 @@ def test_get_ollama_embedding_success(mock_post):
     assert embedding == [0.1, 0.2, 0.3]
     mock_post.assert_called_once_with(
         "http://localhost:11434/api/embeddings",
-        json={"model": "all-minilm:33m", "prompt": text}
+        json={"model": "all-minilm:33m", "prompt": text},
+        timeout=embedding_client.timeout
     )
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_get_ollama_embedding_connection_error(mock_post):
     mock_post.side_effect = requests.exceptions.ConnectionError
     
@@ -68,7 +84,7 @@ def test_get_ollama_embedding_connection_error(mock_post):
     assert embedding is None
     st.error.assert_called_once_with("Could not connect to Ollama. Make sure the Ollama service is running and accessible at 'http://ollama:11434'.")
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_get_ollama_embedding_request_exception(mock_post):
     mock_post.side_effect = requests.exceptions.RequestException("Test error")
     
@@ -77,23 +93,197 @@ def test_get_ollama_embedding_request_exception(mock_post):
     assert embedding is None
     st.error.assert_called_once_with("Error getting embedding from Ollama: Test error")
 
+# Test get_ollama_embeddings batching and fallback
+def _embed_response(status_code=200, payload=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.raise_for_status.return_value = None
+    response.json.return_value = payload
+    return response
+
+@pytest.fixture
+def batch_endpoint():
+    with patch('utils.batch_endpoint_supported', True):
+        yield
+
+@patch('requests.Session.post')
+def test_get_ollama_embeddings_batches(mock_post, batch_endpoint):
+    mock_post.side_effect = lambda url, json, timeout: _embed_response(payload={"embeddings": [[float(len(t))] for t in json["input"]]})
+
+    embeddings = get_ollama_embeddings(["a", "bb", "ccc"], batch_size=2)
+    assert embeddings == [[1.0], [2.0], [3.0]]
+    assert mock_post.call_count == 2
+    assert mock_post.call_args_list[0].kwargs["json"] == {"model": "all-minilm:33m", "input": ["a", "bb"]}
+    assert mock_post.call_args_list[0].args[0] == OLLAMA_EMBED_BATCH_URL
+
+@patch('requests.Session.post')
+def test_get_ollama_embeddings_falls_back_without_batch_endpoint(mock_post, batch_endpoint):
+    def respond(url, json, timeout):
+        if url.endswith("/api/embed"):
+            return _embed_response(status_code=404)
+        return _embed_response(payload={"embedding": [float(len(json["prompt"]))]})
+    mock_post.side_effect = respond
+
+    embeddings = get_ollama_embeddings(["a", "bb"])
+    assert embeddings == [[1.0], [2.0]]
+    import utils
+    assert utils.batch_endpoint_supported is False
+
+@patch('requests.Session.post')
+def test_missing_model_does_not_disable_batching(mock_post, batch_endpoint):
+    # Ollama answers an unknown model with 404 and a JSON error on an endpoint that exists
+    def respond(url, json, timeout):
+        response = _embed_response(status_code=404, payload={"error": "model \"x\" not found, try pulling it first"})
+        response.raise_for_status.side_effect = requests.exceptions.HTTPError("404 Not Found")
+        return response
+    mock_post.side_effect = respond
+    assert get_ollama_embeddings(["a", "bb"]) == [None, None]
+    import utils
+    assert utils.batch_endpoint_supported is True
+
+@patch('requests.Session.post')
+def test_missing_batch_endpoint_is_probed_again_later(mock_post, batch_endpoint):
+    import utils
+    def respond(url, json, timeout):
+        if url == OLLAMA_EMBED_BATCH_URL:
+            return _embed_response(payload={"embeddings": [[1.0] for _ in json["input"]]})
+        return _embed_response(payload={"embedding": [1.0]})
+    mock_post.side_effect = respond
+    with patch('utils.batch_endpoint_supported', False), patch('utils.batch_endpoint_missing_at', time.monotonic()):
+        get_ollama_embeddings(["a"])
+        assert mock_post.call_args.args[0] != OLLAMA_EMBED_BATCH_URL # Still within the re-probe interval
+        with patch('utils.OLLAMA_EMBED_BATCH_REPROBE', 0):
+            assert get_ollama_embeddings(["a", "b"]) == [[1.0], [1.0]]
+        assert mock_post.call_args.args[0] == OLLAMA_EMBED_BATCH_URL
+        assert utils.batch_endpoint_supported is True
+
+@patch('requests.Session.post')
+def test_get_ollama_embeddings_marks_failed_texts_none(mock_post, batch_endpoint):
+    def respond(url, json, timeout):
+        if url.endswith("/api/embed"):
+            return _embed_response(status_code=500, payload={})
+        if json["prompt"] == "bad":
+            raise requests.exceptions.RequestException("bad input")
+        return _embed_response(payload={"embedding": [1.0]})
+    mock_post.side_effect = respond
+
+    embeddings = get_ollama_embeddings(["good", "bad", "good"], batch_size=3)
+    assert embeddings == [[1.0], None, [1.0]]
+
+@patch('requests.Session.post')
+def test_get_ollama_embeddings_only_requests_cache_misses(mock_post, batch_endpoint, tmp_path):
+    from embedding_cache import EmbeddingCache
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), "all-minilm:33m", 1)
+    cache.put("cached", [9.0])
+    mock_post.side_effect = lambda url, json, timeout: _embed_response(payload={"embeddings": [[1.0] for _ in json["input"]]})
+
+    with patch('utils.embedding_cache', cache):
+        assert get_ollama_embeddings(["cached", "fresh"]) == [[9.0], [1.0]]
+        assert mock_post.call_args.kwargs["json"]["input"] == ["fresh"]
+        assert cache.get("fresh") == [1.0]
+
+def test_adaptive_batch_sizer_adjusts_to_latency_and_payload():
+    sizer = AdaptiveBatchSizer(batch_size=4, max_batch_size=8, target_latency=1.0, max_payload_bytes=10)
+    sizer.record(4, 0.1)
+    assert sizer.batch_size == 8
+    sizer.record(8, 5.0)
+    assert sizer.batch_size == 4
+    # Payload bound cuts the batch before the size bound does
+    assert sizer.next_batch(["aaaa", "bbbb", "cccc"], 0) == 2
+    assert sizer.next_batch(["a" * 50], 0) == 1
+
+def test_adaptive_batch_sizer_stays_in_range_under_concurrency():
+    import threading
+    sizer = AdaptiveBatchSizer(batch_size=4, max_batch_size=16, target_latency=1.0, max_payload_bytes=10 ** 6)
+    texts = ["x"] * 64
+
+    ends = []
+    errors = []
+
+    def worker(seed):
+        # Assertions in a thread would not fail the test; results are checked below
+        try:
+            for i in range(2000):
+                end = sizer.next_batch(texts, 0)
+                ends.append(end)
+                sizer.record(end, 0.1 if (i + seed) % 3 else 5.0)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(ends) == 8 * 2000
+    assert all(1 <= end <= 16 for end in ends)
+    assert 1 <= sizer.batch_size <= 16
+
+# Test EmbeddingClient retries and circuit breaker
+def _status_response(status_code):
+    response = MagicMock()
+    response.status_code = status_code
+    return response
+
+def test_embedding_client_retries_transient_errors():
+    client = EmbeddingClient(max_retries=3, backoff_factor=0)
+    with patch.object(client.session, 'post') as mock_post:
+        mock_post.side_effect = [requests.exceptions.ConnectionError(), _status_response(503), _status_response(200)]
+        response = client.post("http://ollama/api/embed", json={})
+    assert response.status_code == 200
+    assert mock_post.call_count == 3
+    assert client.breaker.failures == 0
+
+def test_embedding_client_returns_server_errors_without_retrying():
+    client = EmbeddingClient(max_retries=3, backoff_factor=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    with patch.object(client.session, 'post', return_value=_status_response(500)) as mock_post:
+        for _ in range(3):
+            assert client.post("http://ollama/api/embed", json={}).status_code == 500
+    assert mock_post.call_count == 3 # One request per call, no retries
+    assert not client.breaker.is_open
+
+def test_embedding_client_gives_up_after_retries():
+    client = EmbeddingClient(max_retries=2, backoff_factor=0)
+    with patch.object(client.session, 'post', side_effect=requests.exceptions.Timeout()) as mock_post:
+        with pytest.raises(requests.exceptions.Timeout):
+            client.post("http://ollama/api/embed", json={})
+    assert mock_post.call_count == 3
+
+def test_embedding_client_circuit_breaker_fails_fast():
+    client = EmbeddingClient(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    with patch.object(client.session, 'post', side_effect=requests.exceptions.ConnectionError()) as mock_post:
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.ConnectionError):
+                client.post("http://ollama/api/embed", json={})
+        with pytest.raises(CircuitOpenError):
+            client.post("http://ollama/api/embed", json={})
+    assert mock_post.call_count == 2
+
+def test_circuit_breaker_half_open_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.is_open
+    assert breaker.allow_request() is True # Trial request
+    assert breaker.allow_request() is False # Only one trial at a time
+    breaker.record_success()
+    assert not breaker.is_open
+
 # Test Pinecone-based user management functions
-@patch('utils.get_all_users_from_pinecone_index')
-def test_get_next_user_id_empty(mock_get_all_users, mock_user_index):
-    mock_get_all_users.return_value = []
-    assert get_next_user_id() == "1"
-
-@patch('utils.get_all_users_from_pinecone_index')
-def test_get_next_user_id_existing_users(mock_get_all_users, mock_user_index):
-    mock_get_all_users.return_value = [
-        {"user_id": "1", "username": "user1"},
-        {"user_id": "3", "username": "user3"},
-        {"user_id": "2", "username": "user2"},
-    ]
-    assert get_next_user_id() == "4"
+@pytest.fixture(autouse=True)
+def empty_user_cache():
+    clear_user_cache()
+    yield
+    clear_user_cache()
+
+def test_get_next_user_id_is_unique(mock_user_index):
+    ids = {get_next_user_id() for _ in range(1000)}
+    assert len(ids) == 1000
+    assert all(len(user_id) == 32 and "-" not in user_id for user_id in ids)
+    mock_user_index.query.assert_not_called() # No scan of existing users
 
 @patch('utils.get_user_by_username')
-@patch('utils.add_user_to_pinecone_index')
+@patch('user_store.add_user_to_pinecone_index')
 @patch('utils.get_next_user_id', return_value="1")
 def test_add_user_success(mock_get_next_user_id, mock_add_to_pinecone, mock_get_user_by_username, mock_user_index):
     mock_get_user_by_username.return_value = None # User does not exist
@@ -105,7 +295,7 @@ def test_add_user_success(mock_get_next_user_id, mock_add_to_pinecone, mock_get_
     st.error.assert_not_called()
 
 @patch('utils.get_user_by_username')
-@patch('utils.add_user_to_pinecone_index')
+@patch('user_store.add_user_to_pinecone_index')
 def test_add_user_exists(mock_add_to_pinecone, mock_get_user_by_username, mock_user_index):
     mock_get_user_by_username.return_value = {"user_id": "1", "username": "existinguser"}
     
@@ -114,7 +304,7 @@ def test_add_user_exists(mock_add_to_pinecone, mock_get_user_by_username, mock_u
     mock_add_to_pinecone.assert_not_called()
     st.error.assert_called_once_with("Username already exists.")
 
-@patch('utils.get_user_from_pinecone_index')
+@patch('user_store.get_user_from_pinecone_index')
 def test_get_user_by_username_found(mock_get_from_pinecone, mock_user_index):
     mock_get_from_pinecone.return_value = {"user_id": "1", "username": "testuser", "password": "hashed_pw"}
     
@@ -122,10 +312,19 @@ def test_get_user_by_username_found(mock_get_from_pinecone, mock_user_index):
     assert user_data == {"user_id": "1", "username": "testuser", "password": "hashed_pw"}
     mock_get_from_pinecone.assert_called_once_with(mock_user_index, "testuser")
 
-@patch('utils.get_user_from_pinecone_index')
+@patch('user_store.get_user_from_pinecone_index')
 def test_get_user_by_username_not_found(mock_get_from_pinecone, mock_user_index):
     mock_get_from_pinecone.return_value = None
     
     user_data = get_user_by_username("nonexistent")
     assert user_data is None
     mock_get_from_pinecone.assert_called_once_with(mock_user_index, "nonexistent")
+
+@patch('user_store.get_user_from_pinecone_index')
+def test_get_user_by_username_cached(mock_get_from_pinecone, mock_user_index):
+    mock_get_from_pinecone.return_value = {"user_id": "1", "username": "testuser", "password": "hashed_pw"}
+    assert get_user_by_username("testuser") == get_user_by_username("testuser")
+    mock_get_from_pinecone.assert_called_once()
+    with patch('utils.time.monotonic', return_value=time.monotonic() + 3600): # Entry expired
+        get_user_by_username("testuser")
+    assert mock_get_from_pinecone.call_count == 2
@@ -0,0 +1,166 @@
+import codecs
+import os
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv() # Load environment variables from .env file
+
+UPLOAD_READ_BLOCK_SIZE = int(os.getenv("UPLOAD_READ_BLOCK_SIZE", 64 * 1024)) # Bytes read from an upload at a time
+DEFAULT_CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 500)) # Default for the "Chunk Size" slider and the ingestion CLI
+DEFAULT_CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 50)) # Default for the "Chunk Overlap" slider and the ingestion CLI
+
+# --- Recursive Character Splitting ---
+# Same output as langchain's RecursiveCharacterTextSplitter with the settings the app
+# uses (separators "\n\n", "\n", " ", "", keep_separator=True, length_function=len,
+# strip_whitespace=True), without importing langchain. The text is split at the first
+# separator that occurs in it, each separator staying at the start of the piece that
+# follows it; consecutive pieces shorter than chunk_size are merged into chunks of at
+# most chunk_size characters, carrying up to chunk_overlap characters of trailing pieces
+# into the next chunk, and longer pieces are split again with the next separator.
+# Pieces are (start, end) offsets into the original text, so the only strings built
+# are the chunks themselves.
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", " ", ""]
+
+class RecursiveTextSplitter:
+    def __init__(self, chunk_size=4000, chunk_overlap=200, separators=None):
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be > 0, got {chunk_size}")
+        if chunk_overlap < 0:
+            raise ValueError(f"chunk_overlap must be >= 0, got {chunk_overlap}")
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"Got a larger chunk overlap ({chunk_overlap}) than chunk size ({chunk_size}), should be smaller.")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators or DEFAULT_SEPARATORS)
+
+    def split_text(self, text):
+        chunks = []
+        self._split(text, 0, len(text), 0, chunks)
+        return chunks
+
+    def _split(self, text, start, end, level, chunks):
+        # Split text[start:end] with the first of separators[level:] found in it
+        separator = self.separators[-1]
+        next_level = len(self.separators) # No finer separator left to split long pieces with
+        for i in range(level, len(self.separators)):
+            candidate = self.separators[i]
+            if not candidate:
+                separator = candidate
+                break
+            if text.find(candidate, start, end) != -1:
+                separator = candidate
+                next_level = i + 1
+                break
+
+        short_pieces = []
+        for piece_start, piece_end in _iter_pieces(text, start, end, separator):
+            if piece_end - piece_start < self.chunk_size:
+                short_pieces.append((piece_start, piece_end))
+                continue
+            if short_pieces:
+                self._merge(text, short_pieces, chunks)
+                short_pieces = []
+            if next_level < len(self.separators):
+                self._split(text, piece_start, piece_end, next_level, chunks)
+            else:
+                chunks.append(text[piece_start:piece_end]) # Nothing left to split it with; kept as is
+        if short_pieces:
+            self._merge(text, short_pieces, chunks)
+
+    def _merge(self, text, pieces, chunks):
+        # pieces are contiguous, so a chunk is the text from its first piece to its last
+        current = deque()
+        total = 0
+        for piece_start, piece_end in pieces:
+            length = piece_end - piece_start
+            if total + length > self.chunk_size and current:
+                chunk = text[current[0][0]:current[-1][1]].strip()
+                if chunk:
+                    chunks.append(chunk)
+                # Keep at most chunk_overlap characters, and only what still fits with this piece
+                while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                    first_start, first_end = current.popleft()
+                    total -= first_end - first_start
+            current.append((piece_start, piece_end))
+            total += length
+        if current:
+            chunk = text[current[0][0]:current[-1][1]].strip()
+            if chunk:
+                chunks.append(chunk)
+
+def _iter_pieces(text, start, end, separator):
+    # (start, end) of each non-empty piece of text[start:end], every piece after the first
+    # beginning with the separator; an empty separator yields single characters
+    if not separator:
+        for i in range(start, end):
+            yield i, i + 1
+        return
+    piece_start = start
+    position = text.find(separator, start, end)
+    while position != -1:
+        if position > piece_start:
+            yield piece_start, position
+        piece_start = position
+        position = text.find(separator, position + len(separator), end)
+    if end > piece_start:
+        yield piece_start, end
+
+# --- Streaming Text Splitting ---
+# Splits a text stream into chunks without ever holding the whole document.
+# Text is buffered until a window of several chunks is available, split with the
+# regular text splitter, and all but the last two chunks are emitted. The buffer
+# then restarts at the second-to-last chunk, so chunks near a read boundary are
+# re-split with the text that follows them and overlap carries across windows.
+
+def iter_text_blocks(fileobj, block_size=UPLOAD_READ_BLOCK_SIZE, encoding="utf-8"):
+    # Incrementally decodes a binary file object; multi-byte characters split
+    # across reads are handled by the incremental decoder
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    while True:
+        data = fileobj.read(block_size)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def _chunk_offsets(text, chunks, chunk_overlap):
+    # Start offset of every chunk in text. Chunks are contiguous substrings, and each one
+    # starts at most chunk_overlap characters before the previous one ends; searching from
+    # there keeps repetitive text from matching an earlier copy of the chunk.
+    offsets = []
+    cursor = 0
+    for chunk in chunks:
+        position = text.find(chunk, cursor)
+        if position == -1:
+            return None
+        offsets.append(position)
+        cursor = max(position + 1, position + len(chunk) - chunk_overlap)
+    return offsets
+
+def iter_split_stream(blocks, text_splitter, chunk_size, chunk_overlap):
+    window = max(8 * chunk_size, 4096)
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        if len(buffer) < window:
+            continue
+        chunks = text_splitter.split_text(buffer)
+        if len(chunks) <= 2:
+            continue
+        offsets = _chunk_offsets(buffer, chunks, chunk_overlap)
+        yield from chunks[:-2]
+        if offsets is None:
+            # Chunks are not plain substrings (custom splitter); fall back to keeping their text
+            buffer = "".join(chunks[-2:])
+        else:
+            buffer = buffer[offsets[-2]:]
+    if buffer.strip():
+        yield from text_splitter.split_text(buffer)
+
+def iter_file_chunks(fileobj, text_splitter, chunk_size, chunk_overlap, block_size=UPLOAD_READ_BLOCK_SIZE, encoding="utf-8"):
+    return iter_split_stream(iter_text_blocks(fileobj, block_size, encoding), text_splitter, chunk_size, chunk_overlap)
@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from array import array
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv() # Load environment variables from .env file
+
+TEXT_SEARCH_RESYNC_INTERVAL = float(os.getenv("TEXT_SEARCH_RESYNC_INTERVAL", 600)) # Seconds before a user's index is reconciled with the stored IDs again (0 never)
+
+SEARCH_FIELDS = ("text", "id", "original_text_id", "insert_date")
+
+# --- Trigram Substring Index ---
+# Per-user inverted index from lowercase character trigrams to the documents (stored
+# chunks) containing them, over the fields the admin page filters on. A substring query
+# intersects the posting lists of the term's trigrams, starting with the shortest, and
+# only the surviving candidates are checked with a real substring test. Terms shorter
+# than three characters have no trigrams and fall back to scanning the field values.
+# Documents are numbered in insertion order, so posting lists stay sorted and compact
+# (array of uint32); removed documents are skipped at verification and purged by a
+# rebuild once they make up half of the index.
+
+def trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+def _field_value(vector_id, metadata, field):
+    value = vector_id if field == "id" else metadata.get(field, "")
+    return str(value).lower()
+
+class TrigramIndex:
+    def __init__(self):
+        self._ids = [] # document number -> vector ID, None once removed
+        self._values = [] # document number -> {field: lowercase value}
+        self._numbers = {} # vector ID -> document number
+        self._postings = {field: {} for field in SEARCH_FIELDS} # field -> trigram -> array('I')
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def ids(self):
+        with self._lock:
+            return set(self._numbers)
+
+    def add(self, vector_id, metadata):
+        with self._lock:
+            self._add(vector_id, metadata)
+
+    def _add(self, vector_id, metadata):
+        self._remove(vector_id)
+        number = len(self._ids)
+        values = {field: _field_value(vector_id, metadata, field) for field in SEARCH_FIELDS}
+        self._ids.append(vector_id)
+        self._values.append(values)
+        self._numbers[vector_id] = number
+        for field, value in values.items():
+            postings = self._postings[field]
+            for gram in trigrams(value):
+                posting = postings.get(gram)
+                if posting is None:
+                    posting = postings[gram] = array('I')
+                posting.append(number)
+
+    def remove(self, vector_id):
+        with self._lock:
+            self._remove(vector_id)
+            if len(self._ids) > 64 and len(self._numbers) * 2 < len(self._ids):
+                self._rebuild()
+
+    def _remove(self, vector_id):
+        number = self._numbers.pop(vector_id, None)
+        if number is not None:
+            self._ids[number] = None
+            self._values[number] = None
+
+    def _rebuild(self):
+        live = [(vector_id, values) for vector_id, values in zip(self._ids, self._values) if vector_id is not None]
+        self._ids, self._values, self._numbers = [], [], {}
+        self._postings = {field: {} for field in SEARCH_FIELDS}
+        for vector_id, values in live:
+            metadata = {field: value for field, value in values.items() if field != "id"}
+            self._add(vector_id, metadata)
+
+    def search(self, field, term):
+        # Vector IDs whose field contains term (case-insensitive), in insertion order
+        term = term.lower()
+        with self._lock:
+            if not term:
+                return [vector_id for vector_id in self._ids if vector_id is not None]
+            grams = trigrams(term)
+            if not grams:
+                numbers = range(len(self._ids))
+            else:
+                postings = self._postings[field]
+                lists = [postings.get(gram) for gram in grams]
+                if any(posting is None for posting in lists):
+                    return []
+                lists.sort(key=len)
+                candidates = np.frombuffer(lists[0], dtype=np.uint32) if len(lists[0]) else np.zeros(0, dtype=np.uint32)
+                for posting in lists[1:]:
+                    if not len(candidates):
+                        break
+                    # Postings are sorted, so a binary search per candidate keeps the cost
+                    # proportional to the candidate count rather than the posting length
+                    posting = np.frombuffer(posting, dtype=np.uint32)
+                    positions = np.minimum(np.searchsorted(posting, candidates), len(posting) - 1)
+                    candidates = candidates[posting[positions] == candidates]
+                numbers = candidates.tolist()
+            return [self._ids[number] for number in numbers
+                    if self._ids[number] is not None and term in self._values[number][field]]
+
+class TextSearchIndex:
+    # The trigram indexes of all users, kept in step with writes made through pinecone_utils.
+    # A user's index is built from a full ID listing once (sync); afterwards current() serves
+    # it as is, and the listing is only repeated when expire() is called or the last sync is
+    # older than the resync interval, which picks up chunks written by other processes.
+    def __init__(self, resync_interval=TEXT_SEARCH_RESYNC_INTERVAL):
+        self._indexes = {}
+        self._synced = {} # user ID -> time.monotonic() of the last sync
+        self.resync_interval = resync_interval
+        self._lock = threading.Lock()
+
+    def current(self, user_id):
+        # The user's index if it can be used without listing the user's IDs, else None
+        with self._lock:
+            synced = self._synced.get(user_id)
+            if synced is None:
+                return None
+            if self.resync_interval > 0 and time.monotonic() - synced >= self.resync_interval:
+                return None
+            return self._indexes.get(user_id)
+
+    def expire(self, user_id):
+        # The next current() call returns None, so the caller syncs from a fresh listing
+        with self._lock:
+            self._synced.pop(user_id, None)
+
+    def sync(self, user_id, ids, fetch):
+        # Returns the user's index, building it on first use. ids: every chunk ID the user
+        # has stored; fetch(ids) returns the records (with metadata) of IDs not yet indexed.
+        # Chunks written by another process (e.g. the bulk-ingestion CLI) are reconciled by ID.
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                index = self._indexes[user_id] = TrigramIndex()
+        current = set(ids)
+        indexed = index.ids()
+        for vector_id in indexed - current:
+            index.remove(vector_id)
+        missing = [vector_id for vector_id in ids if vector_id not in indexed]
+        if missing:
+            for record in fetch(missing):
+                index.add(record.id, record.metadata)
+        with self._lock:
+            self._synced[user_id] = time.monotonic()
+        return index
+
+    def add_vectors(self, vectors):
+        # vectors: upserted Pinecone vector dicts; only users with a built index are updated
+        for vector in vectors:
+            metadata = vector.get("metadata", {})
+            index = self._indexes.get(metadata.get("user_id"))
+            if index is not None:
+                index.add(vector["id"], metadata)
+
+    def remove(self, user_id, ids):
+        index = self._indexes.get(user_id)
+        if index is not None:
+            for vector_id in ids:
+                index.remove(vector_id)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._synced.clear()
+
+text_search_index = TextSearchIndex()
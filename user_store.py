@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+from pinecone_utils import add_user_to_pinecone_index, get_user_from_pinecone_index, PINECONE_FETCH_BATCH_SIZE
+
+load_dotenv() # Load environment variables from .env file
+
+USER_STORE_BACKEND = os.getenv("USER_STORE_BACKEND", "pinecone").lower() # "pinecone" (USER_INDEX_NAME) or "sqlite"
+USER_STORE_PATH = os.getenv("USER_STORE_PATH", "users.db") # SQLite file used by the "sqlite" backend
+
+# --- User Store Interface ---
+# utils.add_user / get_user_by_username work against any object with:
+#   add(username, hashed_password, user_id) -> True once stored, False if it was not stored
+#   get(username)                           -> {"username", "password", "user_id"} or None
+# utils checks for an existing username before add(). The SQLite store also refuses a
+# taken username atomically, which closes the race between two registrations. The
+# Pinecone store checks again right before its upsert and serializes registrations within
+# the process, but two processes registering one username at once can still both succeed,
+# the later write replacing the earlier account.
+
+class UserStore:
+    def add(self, username, hashed_password, user_id):
+        raise NotImplementedError
+
+    def get(self, username):
+        raise NotImplementedError
+
+class PineconeUserStore(UserStore):
+    # Users kept as zero-vector records in the Pinecone user index
+    def __init__(self, index):
+        self.index = index
+
+    def add(self, username, hashed_password, user_id):
+        return add_user_to_pinecone_index(self.index, username, hashed_password, user_id)
+
+    def get(self, username):
+        return get_user_from_pinecone_index(self.index, username)
+
+class SQLiteUserStore(UserStore):
+    # Users in a local SQLite table with username as the primary key. Each thread gets its
+    # own connection, and WAL mode lets logins read while a registration writes.
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "username TEXT PRIMARY KEY, user_id TEXT NOT NULL UNIQUE, password TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def add(self, username, hashed_password, user_id):
+        # The primary key makes the existence check and the insert one atomic step
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO users (username, user_id, password, created_at) VALUES (?, ?, ?, ?)",
+                    (username, user_id, hashed_password, time.time()),
+                )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def get(self, username):
+        row = self._connection().execute(
+            "SELECT username, password, user_id FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"username": row[0], "password": row[1], "user_id": row[2]}
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+def migrate_users(user_index, store, page_size=100):
+    # Copies every user record out of the Pinecone user index into store, keeping user
+    # IDs so stored chunks stay attached to their owners. Users already in store are
+    # left alone, so the migration can be re-run. Returns (copied, skipped).
+    copied = 0
+    skipped = 0
+    pagination_token = None
+    while True:
+        page = user_index.list_paginated(limit=page_size, pagination_token=pagination_token)
+        ids = [vector.id for vector in page.vectors]
+        for start in range(0, len(ids), PINECONE_FETCH_BATCH_SIZE):
+            records = user_index.fetch(ids=ids[start:start + PINECONE_FETCH_BATCH_SIZE]).vectors
+            for record in records.values():
+                metadata = record.metadata or {}
+                if "username" not in metadata or "password" not in metadata:
+                    continue
+                if store.add(metadata["username"], metadata["password"], str(metadata.get("user_id", record.id))):
+                    copied += 1
+                else:
+                    skipped += 1
+        pagination = getattr(page, "pagination", None)
+        pagination_token = pagination.next if pagination else None
+        if not pagination_token:
+            return copied, skipped
@@ -2,41 +2,113 @@ import bcrypt
 import requests
 import streamlit as st # Streamlit is needed for st.error in get_ollama_embedding
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from pinecone_utils import initialize_pinecone_user_index, add_user_to_pinecone_index, get_user_from_pinecone_index, get_all_users_from_pinecone_index
+from ollama_client import EmbeddingClient
+from embedding_cache import EmbeddingCache
+from metrics import metrics
+from pinecone_utils import DIMENSION, get_user_index
+from user_store import PineconeUserStore, SQLiteUserStore, USER_STORE_BACKEND, USER_STORE_PATH
 
 load_dotenv() # Load environment variables from .env file
 
 OLLAMA_EMBEDDING_URL = os.getenv("OLLAMA_EMBEDDING_URL", "http://localhost:11434/api/embeddings")
 OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL", "all-minilm:33m") # New environment variable for model selection
+# Multi-input endpoint used for batched embedding; derived from OLLAMA_EMBEDDING_URL unless set explicitly
+OLLAMA_EMBED_BATCH_URL = os.getenv("OLLAMA_EMBED_BATCH_URL", OLLAMA_EMBEDDING_URL.rsplit("/api/embeddings", 1)[0] + "/api/embed")
+OLLAMA_EMBED_BATCH_SIZE = int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", 16)) # Starting batch size, adapted at runtime
+OLLAMA_EMBED_MAX_BATCH_SIZE = int(os.getenv("OLLAMA_EMBED_MAX_BATCH_SIZE", 256))
+OLLAMA_EMBED_TARGET_LATENCY = float(os.getenv("OLLAMA_EMBED_TARGET_LATENCY", 2.0)) # Seconds per batch request
+OLLAMA_EMBED_MAX_PAYLOAD_BYTES = int(os.getenv("OLLAMA_EMBED_MAX_PAYLOAD_BYTES", 1_000_000)) # Upper bound on text bytes per batch request
+OLLAMA_EMBED_BATCH_REPROBE = float(os.getenv("OLLAMA_EMBED_BATCH_REPROBE", 600)) # Seconds before /api/embed is tried again after it was found missing
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "") # SQLite file for the embedding cache; empty disables it
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200_000))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12)) # bcrypt cost factor for new password hashes (each step doubles the work)
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", os.cpu_count() or 2)) # Password hashes computed or verified at once
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 30)) # Seconds a fetched user record is reused for logins; 0 disables the cache
 
-# Initialize Pinecone User Index
-user_index = initialize_pinecone_user_index()
+# Shared keep-alive client for all Ollama calls (timeouts, retries, circuit breaker)
+embedding_client = EmbeddingClient()
 
-# --- User Management Functions (Pinecone-based) ---
-def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# On-disk embedding cache, shared by single and batched embedding calls
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, OLLAMA_EMBEDDING_MODEL, DIMENSION, EMBEDDING_CACHE_MAX_ENTRIES) if EMBEDDING_CACHE_PATH else None
+
+# Pinecone User Index handle. Resolved lazily from the shared connection registry on first
+# use, so importing this module does not connect to Pinecone; tests may assign it directly.
+user_index = None
+
+# User store behind add_user / get_user_by_username (see user_store.py). With the
+# "sqlite" backend it is opened on first use and the Pinecone user index is never
+# created; tests may assign a store directly.
+user_store = None
+_user_store_lock = threading.Lock()
+
+def _get_user_index():
+    return user_index if user_index is not None else get_user_index()
+
+def _get_user_store():
+    global user_store
+    if user_store is not None:
+        return user_store
+    if USER_STORE_BACKEND == "sqlite":
+        with _user_store_lock:
+            if user_store is None:
+                user_store = SQLiteUserStore(USER_STORE_PATH)
+        return user_store
+    index = _get_user_index()
+    return PineconeUserStore(index) if index is not None else None
+
+# Short-lived cache of user records by username, so repeated logins and reruns do not
+# fetch the record again. Only found records are cached: a username registered by
+# another process becomes visible immediately.
+_user_cache = {} # username -> (expires_at, record)
+_user_cache_lock = threading.Lock()
+
+def _cached_user(username):
+    with _user_cache_lock:
+        entry = _user_cache.get(username)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        _user_cache.pop(username, None)
+        return None
+
+def _cache_user(username, record):
+    if USER_CACHE_TTL > 0:
+        with _user_cache_lock:
+            _user_cache[username] = (time.monotonic() + USER_CACHE_TTL, record)
+
+def clear_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
+
+# --- User Management Functions ---
+# Accounts are read and written through the user store (USER_STORE_BACKEND): the Pinecone
+# user index or a local SQLite table.
+# bcrypt releases the GIL while hashing, so concurrent logins run in parallel on this
+# bounded pool instead of each on its own script thread; at most BCRYPT_WORKERS hashes
+# compete for the CPU during a login burst and the rest queue.
+password_pool = ThreadPoolExecutor(max_workers=max(1, BCRYPT_WORKERS), thread_name_prefix="bcrypt")
+
+def hash_password(password, rounds=BCRYPT_ROUNDS):
+    return password_pool.submit(
+        lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+    ).result()
 
 def check_password(password, hashed_password):
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    # The cost factor is read from the stored hash, so hashes made with other rounds still verify
+    return password_pool.submit(bcrypt.checkpw, password.encode('utf-8'), hashed_password.encode('utf-8')).result()
 
 def get_next_user_id():
-    if user_index is None:
-        return "1" # Fallback if index not initialized
-    all_users = get_all_users_from_pinecone_index(user_index)
-    if not all_users:
-        return "1"
-    # Find the maximum user_id and increment it
-    max_id = 0
-    for user_data in all_users:
-        try:
-            max_id = max(max_id, int(user_data.get("user_id", 0)))
-        except ValueError:
-            continue # Skip invalid user_ids
-    return str(max_id + 1)
+    # Random 128-bit IDs need no coordination between concurrent registrations and never
+    # collide in practice. They contain no "-", so "{user_id}-" prefixes stay unambiguous.
+    return uuid.uuid4().hex
 
 def add_user(username, password):
-    if user_index is None:
+    store = _get_user_store()
+    if store is None:
         st.error("Pinecone user index not initialized. Cannot add user.")
         return False
     
@@ -48,18 +120,51 @@ def add_user(username, password):
 
     hashed_pw = hash_password(password)
     new_user_id = get_next_user_id()
-    return add_user_to_pinecone_index(user_index, username, hashed_pw, new_user_id)
+    try:
+        added = store.add(username, hashed_pw, new_user_id)
+    except Exception as e:
+        st.error(f"Error adding user: {e}")
+        return False
+    if not added:
+        if store.get(username) is not None:
+            st.error("Username already exists.") # Registered concurrently since the check above
+        return False
+    _cache_user(username, {"username": username, "password": hashed_pw, "user_id": new_user_id})
+    return True
 
 def get_user_by_username(username):
-    if user_index is None:
+    cached = _cached_user(username)
+    if cached is not None:
+        return cached
+    store = _get_user_store()
+    if store is None:
         st.error("Pinecone user index not initialized. Cannot retrieve user.")
         return None
-    return get_user_from_pinecone_index(user_index, username)
+    try:
+        user = store.get(username)
+    except Exception as e:
+        st.error(f"Error retrieving user: {e}")
+        return None
+    if user is not None:
+        _cache_user(username, user)
+    return user
 
 # --- Ollama Embedding Function ---
 def get_ollama_embedding(text):
+    if embedding_cache is not None:
+        cached = embedding_cache.get(text)
+        if cached is not None:
+            metrics.count("embedding_cache_hits")
+            return cached
+    embedding = _request_ollama_embedding(text)
+    if embedding_cache is not None and embedding is not None:
+        embedding_cache.put(text, embedding)
+    return embedding
+
+@metrics.instrument("ollama_embedding")
+def _request_ollama_embedding(text):
     try:
-        response = requests.post(
+        response = embedding_client.post(
             OLLAMA_EMBEDDING_URL,
             json={"model": OLLAMA_EMBEDDING_MODEL, "prompt": text}
         )
@@ -71,3 +176,126 @@ def get_ollama_embedding(text):
     except requests.exceptions.RequestException as e:
         st.error(f"Error getting embedding from Ollama: {e}")
         return None
+
+# --- Batched Ollama Embeddings ---
+class AdaptiveBatchSizer:
+    # Grows the batch while requests finish well under the target latency and
+    # halves it when a request overshoots, so batches track the server's capacity.
+    # One sizer is shared by concurrent ingestion and retrieval threads, hence the lock.
+    def __init__(self, batch_size=OLLAMA_EMBED_BATCH_SIZE, max_batch_size=OLLAMA_EMBED_MAX_BATCH_SIZE,
+                 target_latency=OLLAMA_EMBED_TARGET_LATENCY, max_payload_bytes=OLLAMA_EMBED_MAX_PAYLOAD_BYTES):
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_size = min(max(1, batch_size), self.max_batch_size)
+        self.target_latency = target_latency
+        self.max_payload_bytes = max_payload_bytes
+        self._lock = threading.Lock()
+
+    def next_batch(self, texts, start):
+        # Take up to batch_size texts starting at `start`, stopping early once the payload
+        # would exceed max_payload_bytes (a single oversized text still forms its own batch)
+        with self._lock:
+            batch_size = self.batch_size
+        end = start
+        payload_bytes = 0
+        while end < len(texts) and end - start < batch_size:
+            text_bytes = len(texts[end].encode('utf-8'))
+            if end > start and payload_bytes + text_bytes > self.max_payload_bytes:
+                break
+            payload_bytes += text_bytes
+            end += 1
+        return end
+
+    def record(self, batch_len, elapsed):
+        with self._lock:
+            if elapsed > self.target_latency:
+                self.batch_size = max(1, batch_len // 2)
+            elif elapsed < self.target_latency / 2 and batch_len >= self.batch_size:
+                self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+
+embedding_batch_sizer = AdaptiveBatchSizer()
+batch_endpoint_supported = True # Flipped off once the server reports that /api/embed does not exist
+batch_endpoint_missing_at = 0.0 # time.monotonic() when it was flipped off; tried again OLLAMA_EMBED_BATCH_REPROBE seconds later
+
+def _batch_endpoint_missing(response):
+    # 405, or a 404 from the router itself. Ollama answers a missing model on an existing
+    # endpoint with 404 too, but with a JSON {"error": ...} body; that is not a missing endpoint.
+    if response.status_code == 405:
+        return True
+    try:
+        body = response.json()
+    except ValueError:
+        return True
+    return not (isinstance(body, dict) and "error" in body)
+
+def _use_batch_endpoint():
+    global batch_endpoint_supported
+    if not batch_endpoint_supported and time.monotonic() - batch_endpoint_missing_at >= OLLAMA_EMBED_BATCH_REPROBE:
+        batch_endpoint_supported = True # The server may have been upgraded; probe again
+    return batch_endpoint_supported
+
+@metrics.instrument("ollama_embed_batch")
+def _post_embedding_batch(batch):
+    # Returns the list of embeddings for the batch, or None if the batch request failed
+    global batch_endpoint_supported, batch_endpoint_missing_at
+    try:
+        response = embedding_client.post(
+            OLLAMA_EMBED_BATCH_URL,
+            json={"model": OLLAMA_EMBEDDING_MODEL, "input": batch}
+        )
+        if response.status_code in (404, 405):
+            if _batch_endpoint_missing(response):
+                batch_endpoint_supported = False
+                batch_endpoint_missing_at = time.monotonic()
+            return None
+        response.raise_for_status()
+        embeddings = response.json()["embeddings"]
+        if len(embeddings) != len(batch):
+            return None
+        return embeddings
+    except (requests.exceptions.RequestException, KeyError, ValueError):
+        return None
+
+def get_ollama_embeddings(texts, batch_size=None):
+    # Embeds many texts with as few round trips as possible. Results are aligned with
+    # `texts`; an entry is None when that text could not be embedded.
+    texts = list(texts)
+    if embedding_cache is not None:
+        # Only texts missing from the cache go to Ollama
+        embeddings = embedding_cache.get_many(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            fresh = _embed_uncached([texts[i] for i in missing], batch_size)
+            for i, embedding in zip(missing, fresh):
+                embeddings[i] = embedding
+            embedding_cache.put_many([texts[i] for i in missing], fresh)
+        return embeddings
+    return _embed_uncached(texts, batch_size)
+
+def _embed_uncached(texts, batch_size):
+    embeddings = [None] * len(texts)
+    sizer = embedding_batch_sizer if batch_size is None else AdaptiveBatchSizer(batch_size=batch_size)
+
+    start = 0
+    while start < len(texts):
+        if not _use_batch_endpoint():
+            # Older Ollama servers only have /api/embeddings: embed the rest one at a time
+            for i in range(start, len(texts)):
+                embeddings[i] = _request_ollama_embedding(texts[i])
+            break
+
+        end = sizer.next_batch(texts, start)
+        batch = texts[start:end]
+        started = time.perf_counter()
+        batch_embeddings = _post_embedding_batch(batch)
+        if batch_embeddings is not None:
+            sizer.record(len(batch), time.perf_counter() - started)
+            embeddings[start:end] = batch_embeddings
+        elif batch_endpoint_supported:
+            # The batch failed as a whole; retry its texts individually so one bad
+            # input only costs its own slot
+            for i in range(start, end):
+                embeddings[i] = _request_ollama_embedding(texts[i])
+        else:
+            continue # Endpoint missing: re-run this batch through the per-text path
+        start = end
+    return embeddings